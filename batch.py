@@ -0,0 +1,164 @@
+import os
+import tempfile
+import numpy as np
+from core_utils import update_neurons, update_neurons_int
+from noc_utils import unpack_coor
+from checkpoint import chip_queues
+
+class BatchRunner:
+    """
+    Runs many stimulus trials of a prepared Chip in one vectorized pass, in 'functional' semantics
+
+    The compartments of all cores are laid out as in ChipState (core i owns [offsets[i], offsets[i+1])),
+    and the state arrays get a leading trial dimension: current and voltage are [trial, compartment],
+    the delay line is a ring of [delay, trial, compartment] as in Core. The parameters are shared by the trials, except the
+    bias, which may differ per trial. The synapses of every compartment are compiled into one chip-wide
+    fan-out table (target compartment, total delay, weight), so a timestep is one neuron update and one
+    scatter-add for the whole batch. Each trial gives the same state and spikes as a 'functional' Chip.
+
+    Trials start from the current state of the chip, e.g. right after programming or after a warm-up
+    without messages in flight. The chip itself is not changed.
+    """
+
+    def __init__(self, chip, n_trials, bias=None, stimulus=None):
+        """
+        n_trials: number of trials
+        bias: per-trial biases, [n_trials, compartments] or [compartments], in the units of the prepared
+              cores (quantized for 'int' arithmetic), default the programmed biases
+        stimulus: (trials, times, compartments) index arrays of input spikes. a stimulated compartment
+                  spikes in that timestep whatever its voltage, which is not reset
+        """
+        assert n_trials >= 1
+        assert all(queue.is_empty() for queue in chip_queues(chip)), 'messages in flight'
+        cores = chip.cores
+        self.chip = chip
+        self.n_trials = n_trials
+        self.offsets = np.zeros(len(cores)+1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([core.n_neurons for core in cores])
+        self.n = int(self.offsets[-1])
+        self.arith = cores[0].arith
+        for name in ('decay_u', 'decay_v', 'vth', 'vmin', 'vmax', 'bias_delay'):
+            setattr(self, name, np.concatenate([getattr(core, name) for core in cores]))
+        self.bias = np.empty((n_trials, self.n), dtype=cores[0].bias.dtype)
+        self.bias[...] = np.concatenate([core.bias for core in cores]) if bias is None else bias
+        self.current = np.repeat(np.concatenate([core.current for core in cores])[None], n_trials, axis=0)
+        self.voltage = np.repeat(np.concatenate([core.voltage for core in cores])[None], n_trials, axis=0)
+        self.input = np.repeat(np.concatenate([core.delay_line() for core in cores], axis=1)[:, None], n_trials, axis=1)
+        self.input_head = 0
+        self.overflow_count = {'input': np.zeros(n_trials, dtype=np.int64), 'current': np.zeros(n_trials, dtype=np.int64)}
+        self.compile_fan_out()
+        if stimulus is None:
+            stimulus = (np.zeros(0, dtype=np.int64),) * 3
+        trials, times, nrns = [np.asarray(col, dtype=np.int64) for col in stimulus]
+        assert len(trials) == len(times) == len(nrns)
+        assert np.all((trials >= 0) & (trials < n_trials)) and np.all((nrns >= 0) & (nrns < self.n))
+        order = np.argsort(times, kind='stable')
+        self.stim_times = times[order]
+        self.stim_trials = trials[order]
+        self.stim_nrns = nrns[order]
+        self.tstep = chip.controller.get_tstep()
+        self.cycles = None
+
+    def compile_fan_out(self):
+        """
+        compile_fan_out - the synapses reached by the spike messages of every compartment, in CSR form
+        entries of a compartment are in message, axon and synapse order, the order in which
+        Chip.operate_functional accumulates them
+        """
+        chip = self.chip
+        nrn, delay, weight = [], [], []
+        counts = np.zeros(self.n, dtype=np.int64)
+        for i, core in enumerate(chip.cores):
+            for local, msgs in sorted(core.axon_out_msgs.items()):
+                for dst, axon_ids, msg_delay in msgs:
+                    for packed in (dst if type(dst) is list else (dst,)):
+                        j = chip.get_ind(*unpack_coor(packed))
+                        dst_core = chip.cores[j]
+                        for ax_in in axon_ids:
+                            row = dst_core.axon_rows[ax_in]
+                            syns = slice(dst_core.syn_ptr[row], dst_core.syn_ptr[row+1])
+                            nrn.append(dst_core.syn_nrn[syns] + self.offsets[j])
+                            delay.append(dst_core.syn_delay[syns] + msg_delay)
+                            weight.append(dst_core.syn_weight[syns])
+                            counts[self.offsets[i] + local] += syns.stop - syns.start
+        self.fan_ptr = np.zeros(self.n+1, dtype=np.int64)
+        self.fan_ptr[1:] = np.cumsum(counts)
+        dtype = self.input.dtype
+        self.fan_nrn = np.concatenate(nrn).astype(np.int64) if len(nrn) > 0 else np.zeros(0, dtype=np.int64)
+        self.fan_delay = np.concatenate(delay).astype(np.int64) if len(delay) > 0 else np.zeros(0, dtype=np.int64)
+        assert len(self.fan_delay) == 0 or self.fan_delay.max() < len(self.input), 'total delay beyond the delay line'
+        self.fan_weight = np.concatenate(weight).astype(dtype) if len(weight) > 0 else np.zeros(0, dtype=dtype)
+
+    def step(self, tstep):
+        """
+        step - one timestep of every trial, returns the (trial, compartment) indices of the spikes
+        """
+        args = (self.current, self.voltage, self.input[self.input_head], self.decay_u, self.decay_v, self.vth, self.vmin,
+            self.vmax, self.bias, tstep >= self.bias_delay)
+        if self.arith == 'int':
+            spiked, q_overflowed, u_overflowed = update_neurons_int(*args)
+            self.overflow_count['input'] += np.count_nonzero(q_overflowed, axis=1)
+            self.overflow_count['current'] += np.count_nonzero(u_overflowed, axis=1)
+        else:
+            spiked = update_neurons(*args)
+        stim = slice(np.searchsorted(self.stim_times, tstep), np.searchsorted(self.stim_times, tstep, side='right'))
+        spiked[self.stim_trials[stim], self.stim_nrns[stim]] = True
+        trials, nrns = np.nonzero(spiked) # trial major, compartments ascending
+        starts = self.fan_ptr[nrns]
+        lens = self.fan_ptr[nrns+1] - starts
+        syns = np.arange(lens.sum()) + np.repeat(starts - (np.cumsum(lens) - lens), lens)
+        rows = (self.fan_delay[syns] + self.input_head) % len(self.input)
+        np.add.at(self.input, (rows, np.repeat(trials, lens), self.fan_nrn[syns]), self.fan_weight[syns])
+        self.input[self.input_head] = 0
+        self.input_head = (self.input_head + 1) % len(self.input)
+        return trials, nrns
+
+    def run(self, timing=None):
+        """
+        run - simulate the trials from their current timestep to the tmax of the chip
+        timing: None, or 'cycle' to replay every trial on the cycle-mode chip for its cycle count
+                (self.cycles, one per trial), which needs a 'cycle' mode chip and no stimulus
+        returns the (trials, times, compartments) index arrays of all spikes, compartments in the order
+        of a Probe on all cores
+        """
+        assert timing in (None, 'cycle')
+        assert timing is None or self.tstep == self.chip.controller.get_tstep()
+        out = []
+        while self.tstep < self.chip.controller.tmax:
+            trials, nrns = self.step(self.tstep)
+            out.append((trials, np.full(len(trials), self.tstep, dtype=np.int64), nrns))
+            self.tstep += 1
+        if timing == 'cycle':
+            self.cycles = self.replay()
+        if len(out) == 0:
+            return (np.zeros(0, dtype=np.int64),) * 3
+        trials, times, nrns = [np.concatenate(cols) for cols in zip(*out)]
+        order = np.lexsort((nrns, times, trials))
+        return trials[order], times[order], nrns[order]
+
+    def replay(self):
+        """
+        replay - run every trial on the cycle-mode chip, restarting from a checkpoint of its current state
+        returns the core_cycle_count of every trial, the chip is left in its starting state
+        """
+        chip = self.chip
+        assert chip.mode == 'cycle' and len(self.stim_times) == 0
+        fhandle, filename = tempfile.mkstemp(suffix='.ckpt')
+        os.close(fhandle)
+        try:
+            chip.save_checkpoint(filename)
+            bias = [core.bias.copy() for core in chip.cores]
+            start = chip.core_cycle_count
+            cycles = np.zeros(self.n_trials, dtype=np.int64)
+            for trial in range(self.n_trials):
+                chip.load_checkpoint(filename)
+                for i, core in enumerate(chip.cores):
+                    core.bias[...] = self.bias[trial, self.offsets[i]:self.offsets[i+1]]
+                chip.run()
+                cycles[trial] = chip.core_cycle_count - start
+            chip.load_checkpoint(filename)
+            for core, core_bias in zip(chip.cores, bias):
+                core.bias[...] = core_bias
+        finally:
+            os.remove(filename)
+        return cycles
@@ -0,0 +1,96 @@
+from batch import BatchRunner
+from chip_utils import Chip
+from chip_programmer import save_network
+from netgen import random_sparse
+import numpy as np
+import os
+import tempfile
+import time
+
+# trials with scaled biases and input spikes, against one chip per trial
+netfile = os.path.join(tempfile.mkdtemp(), 'sparse.npz')
+save_network(netfile, *random_sparse(x_dim=3, y_dim=3, npc=10, fan_out=4, rate=0.1, tmax=30, seed=3))
+n_trials = 4
+
+def build(mode='functional', arith='float', bias=None):
+    chip = Chip(x_dim=3, y_dim=3, mode=mode, arith=arith)
+    chip.program_cores(netfile)
+    if bias is not None:
+        offsets = np.cumsum([0] + [core.n_neurons for core in chip.cores])
+        for i, core in enumerate(chip.cores):
+            core.bias[...] = bias[offsets[i]:offsets[i+1]]
+    return chip
+
+def reference(chip, stim_times, stim_nrns):
+    # Chip.operate_functional, with the stimulated compartments spiking as well
+    offsets = np.cumsum([0] + [core.n_neurons for core in chip.cores])
+    times, nrns = [], []
+    while chip.controller.conditional_run():
+        tstep = chip.controller.get_tstep()
+        msgs = []
+        for i, core in enumerate(chip.cores):
+            spiked = core.update_compartments(slice(0, core.n_neurons))
+            stim = stim_nrns[(stim_times == tstep) & (stim_nrns >= offsets[i]) & (stim_nrns < offsets[i+1])]
+            spiked[stim - offsets[i]] = True
+            local = np.flatnonzero(spiked)
+            times.extend([tstep] * len(local))
+            nrns.extend(local + offsets[i])
+            msgs.extend(core.emit_spikes(local))
+        for i, core in enumerate(chip.cores):
+            core.deliver_batch([msg for msg in msgs if msg.dst == core.packed_id])
+            core.cur_nrn = core.n_neurons
+        chip.controller.inc_tstep()
+        for core in chip.cores:
+            core.next_timestep()
+    return np.array(times), np.array(nrns)
+
+for arith in ('float', 'int'):
+    chip = build(arith=arith)
+    base = np.concatenate([core.bias for core in chip.cores])
+    bias = np.stack([base * (1 + k) for k in range(n_trials)])
+    stimulus = (np.array([2, 2, 3, 3, 3]), np.array([0, 5, 1, 1, 12]), np.array([4, 17, 0, 30, 89]))
+    runner = BatchRunner(chip, n_trials, bias=bias, stimulus=stimulus)
+    trials, times, nrns = runner.run()
+    assert np.all(np.diff(trials) >= 0)
+    for trial in range(n_trials):
+        ref = build(arith=arith, bias=bias[trial])
+        sel = stimulus[0] == trial
+        ref_times, ref_nrns = reference(ref, stimulus[1][sel], stimulus[2][sel])
+        assert np.array_equal(times[trials == trial], ref_times)
+        assert np.array_equal(nrns[trials == trial], ref_nrns)
+        assert np.array_equal(runner.voltage[trial], np.concatenate([core.voltage for core in ref.cores]))
+        assert np.array_equal(runner.current[trial], np.concatenate([core.current for core in ref.cores]))
+        for name in ('input', 'current'):
+            assert runner.overflow_count[name][trial] == sum(core.overflow_count[name] for core in ref.cores)
+    # trials without input spikes are independent runs of the functional chip
+    ref = build(arith=arith)
+    probe = ref.add_probe('spikes')
+    ref.run()
+    assert np.array_equal(np.stack(probe.get_data()), np.stack((times, nrns))[:, trials == 0])
+    assert len(np.unique(trials)) == n_trials
+
+# cycle counts from replaying every trial on the cycle-mode chip
+chip = build(mode='cycle')
+bias = np.stack([np.concatenate([core.bias for core in chip.cores]) * (1 + 0.5*k) for k in range(3)])
+runner = BatchRunner(chip, 3, bias=bias)
+trials, times, nrns = runner.run(timing='cycle')
+for trial in range(3):
+    ref = build(mode='cycle', bias=bias[trial])
+    probe = ref.add_probe('spikes')
+    ref.run()
+    assert runner.cycles[trial] == ref.core_cycle_count
+    assert np.array_equal(np.stack(probe.get_data()), np.stack((times, nrns))[:, trials == trial])
+assert runner.cycles[2] > runner.cycles[0]
+assert chip.controller.get_tstep() == 0 and chip.core_cycle_count == 0 and not np.any(chip.cores[0].voltage)
+
+# one batch against a chip per trial
+chip = build()
+base = np.concatenate([core.bias for core in chip.cores])
+t0 = time.perf_counter()
+BatchRunner(chip, 64, bias=np.linspace(0.5, 2.0, 64)[:, None] * base).run()
+batch_s = time.perf_counter() - t0
+t0 = time.perf_counter()
+for trial in range(8):
+    build().run()
+single_s = (time.perf_counter() - t0) / 8
+print('Batch of 64: {:.3f}s ({:.3f}s per chip)'.format(batch_s, single_s))
@@ -0,0 +1,140 @@
+"""
+Benchmark harness: sweeps synthetic networks (see netgen) over mesh size, router buffer capacity, pQ and
+firing rate, and appends one JSON line per run to a results file, e.g.
+
+    python bench.py --gen random_sparse,hot_spot --mesh 4x4,8x8 --capacity 10,50 --pq 1,0 --rate 0.05,0.2
+
+--multicast 0,1 repeats the sweep with unicast and multicast spike messages (Chip multicast), and
+--routing xy,west_first,odd_even --arbitration round_robin,age,delay with every router routing algorithm
+and arbiter (Chip routing, arbitration). --fast-forward 0,1 compares the cycle loop with the fast-forward
+of quiet timesteps (Chip fast_forward), and --noc objects,arrays the Router objects with the array NoC
+(Chip noc).
+
+Every run is simulated in a forked child process, so that its peak resident memory can be measured.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing as mp
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from chip_programmer import save_network
+from netgen import GENERATORS
+from noc_utils import ARBITERS, ROUTING
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def simulate(netfile, dims, chip_kwargs, conn):
+    # runs in the child process
+    from chip_utils import Chip
+    t0 = time.time()
+    chip = Chip(x_dim=dims[0], y_dim=dims[1], **chip_kwargs)
+    chip.program_cores(netfile)
+    t1 = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        chip.run()
+    t2 = time.time()
+    conn.send(dict(
+        program_s=t1 - t0,
+        wall_s=t2 - t1,
+        core_cycle_count=chip.core_cycle_count,
+        run=sum(cyc_count['run'] for cyc_count in chip.cyc_counters),
+        stall=sum(cyc_count['stall'] for cyc_count in chip.cyc_counters),
+        n_neurons=sum(core.n_neurons for core in chip.cores),
+        n_synapses=sum(core.n_synapse_in for core in chip.cores),
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, # kilobytes on linux
+    ))
+
+def run_one(netfile, dims, chip_kwargs):
+    ctx = mp.get_context('fork')
+    recv_end, send_end = ctx.Pipe(duplex=False)
+    sys.stdout.flush()
+    proc = ctx.Process(target=simulate, args=(netfile, dims, chip_kwargs, send_end))
+    proc.start()
+    send_end.close()
+    try:
+        result = recv_end.recv()
+    except EOFError: # the traceback of the child is on stderr
+        result = None
+    proc.join()
+    if result is None:
+        result = dict(error='run failed with exit code {}'.format(proc.exitcode))
+    return result
+
+def sweep(gens, meshes, capacities, pqs, rates, gen_kwargs, chip_kwargs, out, repeat=1):
+    """
+    sweep - run every combination of the parameters and append the results to out as JSON lines
+    returns the list of result records
+    """
+    tmpdir = tempfile.mkdtemp()
+    revision = git_revision()
+    records = []
+    for gen, dims, rate in itertools.product(gens, meshes, rates):
+        netfile = os.path.join(tmpdir, '{}_{}x{}_{}.npz'.format(gen, dims[0], dims[1], rate))
+        save_network(netfile, *GENERATORS[gen](x_dim=dims[0], y_dim=dims[1], rate=rate, **gen_kwargs))
+        for capacity, pQ, rep in itertools.product(capacities, pqs, range(repeat)):
+            kwargs = dict(chip_kwargs, capacity=capacity, pQ=pQ)
+            record = dict(time=time.strftime('%Y-%m-%dT%H:%M:%S'), revision=revision, generator=gen,
+                x_dim=dims[0], y_dim=dims[1], rate=rate, capacity=capacity, pQ=pQ, repeat=rep,
+                gen_kwargs=gen_kwargs, chip_kwargs=chip_kwargs)
+            record.update(run_one(netfile, dims, kwargs))
+            records.append(record)
+            with open(out, 'a') as fhandle:
+                fhandle.write(json.dumps(record) + '\n')
+            name = '{generator} {x_dim}x{y_dim} rate={rate} capacity={capacity} pQ={pQ}'.format(**record)
+            if chip_kwargs.get('multicast'):
+                name += ' multicast'
+            if chip_kwargs.get('fast_forward'):
+                name += ' fast-forward'
+            for key, default in (('routing', 'xy'), ('arbitration', 'round_robin'), ('noc', 'objects')):
+                if chip_kwargs.get(key, default) != default:
+                    name += ' {}={}'.format(key, chip_kwargs[key])
+            if 'error' in record:
+                print('{}: {}'.format(name, record['error']))
+            else:
+                print('{}: {core_cycle_count} cycles, {wall_s:.2f}s, {peak_rss_kb} kB'.format(name, **record))
+    return records
+
+def split(arg, conv):
+    return [conv(item) for item in arg.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='sweep synthetic networks and record cycle counts and wall time')
+    parser.add_argument('--gen', default='random_sparse', help='comma separated generators: ' + ','.join(GENERATORS))
+    parser.add_argument('--mesh', default='4x4', help='comma separated XxY mesh sizes')
+    parser.add_argument('--capacity', default='50', help='comma separated router buffer capacities')
+    parser.add_argument('--pq', default='1', help='comma separated pQ settings (1/0)')
+    parser.add_argument('--rate', default='0.1', help='comma separated firing rates')
+    parser.add_argument('--npc', type=int, default=16, help='neurons per core')
+    parser.add_argument('--tmax', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mode', default='cycle', choices=['cycle', 'functional'])
+    parser.add_argument('--scheduler', default='sync', choices=['sync', 'event'])
+    parser.add_argument('--multicast', default='0', help='comma separated multicast settings (1/0)')
+    parser.add_argument('--routing', default='xy', help='comma separated routing algorithms: ' + ','.join(ROUTING))
+    parser.add_argument('--arbitration', default='round_robin', help='comma separated arbiters: ' + ','.join(ARBITERS))
+    parser.add_argument('--fast-forward', default='0', help='comma separated fast_forward settings (1/0)')
+    parser.add_argument('--noc', default='objects', help='comma separated NoC engines: objects,arrays')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--out', default='bench_results.jsonl')
+    args = parser.parse_args()
+    meshes = [tuple(int(d) for d in mesh.split('x')) for mesh in args.mesh.split(',')]
+    for multicast, routing, arbitration, fast_forward, noc in itertools.product(split(args.multicast, lambda s: bool(int(s))),
+            split(args.routing, str), split(args.arbitration, str), split(args.fast_forward, lambda s: bool(int(s))),
+            split(args.noc, str)):
+        sweep(split(args.gen, str), meshes, split(args.capacity, int), split(args.pq, lambda s: bool(int(s))),
+            split(args.rate, float), dict(npc=args.npc, tmax=args.tmax, seed=args.seed),
+            dict(mode=args.mode, scheduler=args.scheduler, multicast=multicast, routing=routing, arbitration=arbitration,
+                 fast_forward=fast_forward, noc=noc),
+            args.out, repeat=args.repeat)
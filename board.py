@@ -0,0 +1,440 @@
+import multiprocessing as mp
+import os
+import sys
+from collections import deque
+import numpy as np
+from chip_utils import Chip, SimController, deliver_functional, opp_map
+from chip_programmer import ChipProgrammer
+import compile_cache
+from noc_utils import MSG_POOL, advance_enqueue_seq, advance_inject_seq
+from parallel import WorkerFailed, chip_result, fork_workers, merge_result
+from probes import Probe
+
+# boundary ports and the coordinate step to the facing router
+PORT_STEPS = (('north', (0, 1)), ('east', (1, 0)), ('south', (0, -1)), ('west', (-1, 0)))
+
+class Link:
+    """
+    Inter-chip link, the sink of a boundary port of one chip that feeds the facing input buffer of a neighbouring chip
+
+    A message sent in cycle c comes out of the link in cycle c + latency and enters the far buffer at the end
+    of that cycle, at most bandwidth messages per cycle. Flow control is credit based: the sending router
+    sees the link full when capacity messages are on it or waiting for space in the far buffer, or when
+    bandwidth messages went out in this cycle, and the credit of a message comes back latency cycles after
+    it left the link. The sending side thus only depends on what the far side did latency cycles ago,
+    which lets a BoardRunner exchange the link traffic of latency cycles in one batch.
+    """
+
+    def __init__(self, src_chip, dst_chip, sink, capacity=16, latency=4, bandwidth=1, pQ=True):
+        """
+        src_chip, dst_chip: Board indices of the sending chip and of the chip owning sink
+        sink: input buffer of the facing router
+        pQ: like the router buffers, without it every message must leave the link within its timestep
+        """
+        assert capacity >= 1 and latency >= 1 and bandwidth >= 1
+        self.src_chip = src_chip
+        self.dst_chip = dst_chip
+        self.sink = sink
+        self.capacity = capacity
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.pQ = pQ
+        self.credits = capacity
+        self.cycle = 0
+        self.sent = 0 # messages sent in the current cycle
+        self.n_sent = 0 # messages sent in total
+        self.flight = deque() # (exit cycle, message) in send order
+        self.arrived = deque() # messages out of the link, waiting for space in the far buffer
+        self.returns = deque() # cycles the credits come back, ascending
+
+    @property
+    def n_msgs(self):
+        # messages on the link as the sending side sees them, for the adaptive routes
+        return self.capacity - self.credits
+
+    def is_full(self, amt=1):
+        return self.credits < amt or self.sent + amt > self.bandwidth
+
+    def enqueue(self, msg):
+        assert not self.is_full()
+        self.credits -= 1
+        self.sent += 1
+        self.n_sent += 1
+        self.flight.append((self.cycle + self.latency, msg))
+
+    def start_cycle(self, cycle):
+        # sending side, before the routers operate in cycle
+        self.cycle = cycle
+        self.sent = 0
+        while len(self.returns) > 0 and self.returns[0] <= cycle:
+            self.returns.popleft()
+            self.credits += 1
+
+    def deliver(self, cycle):
+        # receiving side, after the routers operated in cycle
+        while len(self.flight) > 0 and self.flight[0][0] <= cycle:
+            self.arrived.append(self.flight.popleft()[1])
+        n = 0
+        while n < self.bandwidth and len(self.arrived) > 0 and not self.sink.is_full():
+            self.sink.enqueue(self.arrived.popleft())
+            self.returns.append(cycle + self.latency)
+            n += 1
+
+    def messages(self):
+        return [msg for _, msg in self.flight] + list(self.arrived)
+
+    def ready(self):
+        if self.pQ:
+            return all(msg.delay > 1 for msg in self.messages())
+        return len(self.flight) == 0 and len(self.arrived) == 0
+
+    def next_timestep(self):
+        assert self.ready()
+        if self.pQ:
+            for msg in self.messages():
+                msg.decrement_delay()
+
+class Board:
+    """
+    Tiles chips_x x chips_y Chips of x_dim x y_dim cores into one mesh, neighbouring chips joined by Links
+
+    Cores and routers carry board-global coordinates (see the Chip origin): core (x, y) sits on chip
+    (x // x_dim, y // y_dim), a network for the whole mesh programs like one big chip, and the routers
+    send messages for other chips out of their boundary ports. Every router on a chip edge that faces
+    another chip gets a Link to the facing input buffer. All chips share one SimController and go through
+    the cycles of a timestep together, which ends when every chip and link is ready.
+    """
+
+    def __init__(self, chips_x=2, chips_y=1, x_dim=4, y_dim=4, link_capacity=16, link_latency=4, link_bandwidth=1,
+                 workers=1, **chip_args):
+        """
+        link_capacity, link_latency, link_bandwidth: see Link
+        workers: run() simulates the chips in this many processes, see BoardRunner. needs 'cycle' mode and an
+                 arbiter other than 'age'
+        chip_args: Chip arguments of every chip (mode, soa, arith, weight_exp, capacity, pQ, multicast, routing,
+                   arbitration). the chips use the 'sync' scheduler, a single worker and the Router objects
+                   (noc='objects', the array NoC has no Link sinks) each. telemetry may be enabled per chip
+                   in serial runs, its hop counts are board-wide. tracing is not supported
+        """
+        for name in ('util_arr', 'scheduler', 'workers', 'fast_forward', 'origin', 'controller', 'noc'):
+            assert not name in chip_args, '{} is not supported on a Board'.format(name)
+        self.mode = chip_args.get('mode', 'cycle')
+        assert workers == 1 or (self.mode == 'cycle' and chip_args.get('arbitration', 'round_robin') != 'age')
+        self.controller = SimController()
+        self.chips_x = chips_x
+        self.chips_y = chips_y
+        self.x_dim = chips_x * x_dim
+        self.y_dim = chips_y * y_dim
+        self.get_ind = lambda x, y: y + (x * self.y_dim) # global, as on one chip of the size of the board
+        self.get_coor = lambda i: (i//self.y_dim, i%self.y_dim)
+        self.get_chip = lambda x, y: y//y_dim + (x//x_dim) * chips_y # chip of the global core (x, y)
+        self.chips = []
+        for cx in range(chips_x):
+            for cy in range(chips_y):
+                self.chips.append(Chip(x_dim=x_dim, y_dim=y_dim, origin=(cx * x_dim, cy * y_dim),
+                    controller=self.controller, **chip_args))
+                self.chips[-1].board = self
+        self.cores = []
+        self.routers = []
+        self.cyc_counters = []
+        for i in range(self.x_dim * self.y_dim):
+            x, y = self.get_coor(i)
+            chip = self.chips[self.get_chip(x, y)]
+            self.cores.append(chip.cores[chip.get_ind(x, y)])
+            self.routers.append(chip.routers[chip.get_ind(x, y)])
+            self.cyc_counters.append(chip.cyc_counters[chip.get_ind(x, y)])
+        self.state = None # chip-wide states stay with the chips, probes read the cores
+        self.probes = []
+        self.workers = workers
+        self.core_cycle_count = 0
+        self.links = []
+        for router in self.routers:
+            x, y = router.router_id
+            c = self.get_chip(x, y)
+            for key, (dx, dy) in PORT_STEPS:
+                fx, fy = x + dx, y + dy
+                if 0 <= fx < self.x_dim and 0 <= fy < self.y_dim and self.get_chip(fx, fy) != c:
+                    sink = self.routers[self.get_ind(fx, fy)].get_buffer_ref(opp_map[key])
+                    link = Link(c, self.get_chip(fx, fy), sink, capacity=link_capacity, latency=link_latency,
+                        bandwidth=link_bandwidth, pQ=chip_args.get('pQ', True))
+                    router.set_sink_ref(key, link)
+                    self.links.append(link)
+            router.initialize_crossbar()
+
+    def program_cores(self, filename, cache_dir=None, cache_bytes=compile_cache.CACHE_MAX_BYTES):
+        # a network file for the whole board, with global core coordinates. cache_dir: see Chip.program_cores
+        if cache_dir is not None:
+            compile_cache.program_cached(self, filename, cache_dir, max_bytes=cache_bytes)
+            return
+        self.programmer = ChipProgrammer(filename, self)
+        self.programmer.program()
+        self.prepare_computation()
+
+    def prepare_computation(self, loaded=False):
+        for chip in self.chips:
+            chip.prepare_computation(loaded=loaded)
+
+    def add_probe(self, kind, **kwargs):
+        """
+        add_probe - record spikes, voltages or currents of the prepared cores (global coordinates), see Probe
+        """
+        probe = Probe(self, kind, **kwargs)
+        self.probes.append(probe)
+        return probe
+
+    def operate(self):
+        if (self.controller.conditional_run()):
+            if self.mode == 'functional':
+                self.operate_functional()
+            else:
+                self.operate_cycle()
+            for probe in self.probes:
+                probe.record(self.controller.get_tstep())
+            for chip in self.chips:
+                if chip.telemetry is not None:
+                    chip.telemetry.timestep()
+            self.controller.inc_tstep()
+            for chip in self.chips:
+                chip.next_timestep()
+            for link in self.links:
+                link.next_timestep()
+
+    def operate_cycle(self):
+        tic_toc = 0
+        while(not self.ready()):
+            cycle = self.core_cycle_count
+            for link in self.links:
+                link.start_cycle(cycle)
+            for chip in self.chips:
+                chip.operate_tick(tic_toc)
+            for link in self.links:
+                link.deliver(cycle)
+            tic_toc = tic_toc + 1
+            self.core_cycle_count += 1
+
+    def operate_functional(self):
+        # the messages skip the NoC and the links, as in Chip.operate_functional
+        msgs = []
+        for chip in self.chips:
+            msgs.extend(chip.functional_spikes())
+        deliver_functional(self, msgs)
+
+    def ready(self):
+        for chip in self.chips:
+            if not chip.ready():
+                return False
+        for link in self.links:
+            if not link.ready():
+                return False
+        return True
+
+    def run(self):
+        if self.workers > 1:
+            BoardRunner(self, self.workers).run()
+        while(self.controller.conditional_run()):
+            print("tstep: {}".format(self.controller.get_tstep()))
+            self.operate()
+        for probe in self.probes:
+            probe.flush()
+        print("Cycle Count: {}".format(self.core_cycle_count))
+
+    def get_overflow_counts(self):
+        return [core.overflow_count for core in self.cores]
+
+    def get_last_nrn_vs(self):
+        return [core.get_last_nrn_v() for core in self.cores]
+
+class BoardWorker:
+    """
+    One worker of a BoardRunner, runs the cycle loop of Board.operate_cycle on its chips and the links they touch
+    """
+
+    def __init__(self, runner, w, conns):
+        board = runner.board
+        self.runner = runner
+        self.board = board
+        self.w = w
+        self.conns = conns # (src worker, dst worker) -> own end of the pipe
+        self.arrive = runner.arrive
+        self.flags = runner.flags
+        self.abort = runner.abort
+        self.rounds = 0
+        self.chips = [board.chips[c] for c in runner.groups[w]]
+        worker_of = runner.worker_of
+        self.tx = [link for link in board.links if worker_of[link.src_chip] == w]
+        self.rx = [link for link in board.links if worker_of[link.dst_chip] == w]
+        self.links = [link for link in board.links if link in self.tx or link in self.rx]
+        self.remote_tx = [(l, link) for l, link in enumerate(board.links)
+            if worker_of[link.src_chip] == w and worker_of[link.dst_chip] != w]
+        self.remote_rx = [(l, link) for l, link in enumerate(board.links)
+            if worker_of[link.dst_chip] == w and worker_of[link.src_chip] != w]
+        # each message and credit of a remote link is held by one side: messages by the receiver, credits
+        # on their way back by the sender
+        for _, link in self.remote_tx:
+            link.flight.clear()
+            link.arrived.clear()
+        for _, link in self.remote_rx:
+            link.returns.clear()
+        self.peers = sorted(set(dst for src, dst in conns if src == w))
+
+    def wait(self, cond):
+        while not cond():
+            if self.abort[0]:
+                raise WorkerFailed()
+            os.sched_yield()
+
+    def barrier(self):
+        self.arrive[self.w] = self.rounds
+        self.wait(lambda: self.arrive.min() >= self.rounds)
+
+    def local_ready(self):
+        for chip in self.chips:
+            if not chip.ready():
+                return False
+        for link in self.links:
+            if not link.ready():
+                return False
+        return True
+
+    def exchange(self):
+        # the messages sent on remote links and the credits of the messages taken off them, in one batch per peer
+        batches = {dst: ([], []) for dst in self.peers}
+        worker_of = self.runner.worker_of
+        for l, link in self.remote_tx:
+            batches[worker_of[link.dst_chip]][0].append((l, list(link.flight)))
+            link.flight.clear()
+        for l, link in self.remote_rx:
+            batches[worker_of[link.src_chip]][1].append((l, list(link.returns)))
+            link.returns.clear()
+        for dst, batch in batches.items():
+            self.conns[(self.w, dst)].send(batch)
+            for _, flight in batch[0]: # the receiver works on copies
+                for _, msg in flight:
+                    MSG_POOL.release(msg)
+        links = self.board.links
+        for src in self.peers:
+            flights, returns = self.conns[(src, self.w)].recv()
+            for l, flight in flights:
+                links[l].flight.extend(flight)
+            for l, cycles in returns:
+                links[l].returns.extend(cycles)
+
+    def run(self):
+        board = self.board
+        window = self.runner.window
+        while board.controller.conditional_run():
+            if self.w == 0:
+                print("tstep: {}".format(board.controller.get_tstep()))
+            tic_toc = 0
+            while True:
+                self.rounds += 1
+                self.flags[self.rounds%2, self.w] = self.local_ready()
+                self.barrier()
+                if self.flags[self.rounds%2].all():
+                    break
+                cycle = board.core_cycle_count
+                for link in self.tx:
+                    link.start_cycle(cycle)
+                for chip in self.chips:
+                    chip.operate_tick(tic_toc)
+                for link in self.rx:
+                    link.deliver(cycle)
+                tic_toc += 1
+                board.core_cycle_count += 1
+                if board.core_cycle_count % window == 0 and len(self.peers) > 0:
+                    self.exchange()
+            board.controller.inc_tstep()
+            for chip in self.chips:
+                chip.next_timestep()
+            for link in self.links:
+                link.next_timestep()
+        return self.result()
+
+    def result(self):
+        board = self.board
+        chips = {}
+        for c in self.runner.groups[self.w]:
+            chip = board.chips[c]
+            chips[c] = dict(chip_result(chip, range(len(chip.cores))), core_cycle_count=chip.core_cycle_count)
+        links = {}
+        for l, link in enumerate(board.links):
+            if link in self.links:
+                links[l] = dict(credits=link.credits, cycle=link.cycle, sent=link.sent, n_sent=link.n_sent,
+                    flight=list(link.flight), arrived=list(link.arrived), returns=list(link.returns))
+        return dict(chips=chips, links=links, core_cycle_count=board.core_cycle_count,
+            tstep=board.controller.get_tstep(), seq=advance_enqueue_seq(), inject_seq=advance_inject_seq())
+
+class BoardRunner:
+    """
+    Runs a prepared cycle-mode Board with its chips spread over worker processes, one chip each by default
+
+    Each worker runs the cycle loop on its own chips. The workers share only a cycle barrier and readiness
+    flags, so that every timestep ends in the same cycle everywhere. The traffic of the links between
+    workers, messages one way and credits the other, goes through pipes in one batch every link latency
+    cycles: nothing sent in a batch can leave its link, or come back as a credit, before the next batch.
+    Cycle counts and state come out identical to the serial Board.run and are merged back into the board.
+    """
+
+    def __init__(self, board, workers):
+        assert board.mode == 'cycle' and len(board.probes) == 0
+        assert all(chip.telemetry is None and chip.tracer is None for chip in board.chips)
+        self.board = board
+        n_workers = max(1, min(workers, len(board.chips)))
+        self.groups = [chips.tolist() for chips in np.array_split(np.arange(len(board.chips)), n_workers)]
+        self.worker_of = {c: w for w, chips in enumerate(self.groups) for c in chips}
+        self.window = min([link.latency for link in board.links] + [1 << 30])
+        self.arrive = np.frombuffer(mp.RawArray('q', n_workers), dtype=np.int64)
+        self.flags = np.frombuffer(mp.RawArray('b', 2*n_workers), dtype=np.bool_).reshape(2, n_workers)
+        self.abort = np.frombuffer(mp.RawArray('b', 1), dtype=np.bool_)
+        pairs = set()
+        for link in board.links:
+            src, dst = self.worker_of[link.src_chip], self.worker_of[link.dst_chip]
+            if src != dst: # messages one way, credits the other
+                pairs.update(((src, dst), (dst, src)))
+        self.pipes = {pair: mp.Pipe(duplex=False) for pair in pairs}
+
+    def work(self, w, conn):
+        # forked child, keeps its own ends of the pipes
+        conns = {}
+        for (src, dst), (recv_end, send_end) in self.pipes.items():
+            if dst == w:
+                conns[(src, dst)] = recv_end
+            if src == w:
+                conns[(src, dst)] = send_end
+        try:
+            conn.send(BoardWorker(self, w, conns).run())
+        except WorkerFailed:
+            conn.send(None)
+        except BaseException:
+            self.abort[0] = True
+            raise
+        finally:
+            sys.stdout.flush()
+
+    def run(self):
+        self.merge(fork_workers(len(self.groups), self.work))
+
+    def merge(self, results):
+        board = self.board
+        for result in results:
+            for c, state in result['chips'].items():
+                merge_result(board.chips[c], state)
+                board.chips[c].core_cycle_count = state['core_cycle_count']
+            advance_enqueue_seq(result['seq'])
+            advance_inject_seq(result['inject_seq'])
+        for l, link in enumerate(board.links):
+            tx = results[self.worker_of[link.src_chip]]['links'][l]
+            rx = results[self.worker_of[link.dst_chip]]['links'][l]
+            link.credits = tx['credits']
+            link.cycle = tx['cycle']
+            link.sent = tx['sent']
+            link.n_sent = tx['n_sent']
+            link.arrived = deque(rx['arrived'])
+            if tx is rx:
+                link.flight = deque(tx['flight'])
+                link.returns = deque(tx['returns'])
+            else: # the receiver holds the earlier messages, the sender the earlier credits
+                link.flight = deque(rx['flight'] + tx['flight'])
+                link.returns = deque(tx['returns'] + rx['returns'])
+        board.core_cycle_count = results[0]['core_cycle_count']
+        board.controller.tstep = results[0]['tstep']
@@ -0,0 +1,108 @@
+from board import Board
+from chip_utils import Chip
+from chip_programmer import save_network
+from netgen import random_sparse
+import numpy as np
+import os
+import tempfile
+
+# a 4x4 network on one chip and on boards of 2x1 and 2x2 chips
+netfile = os.path.join(tempfile.mkdtemp(), 'sparse.npz')
+save_network(netfile, *random_sparse(x_dim=4, y_dim=4, npc=6, fan_out=4, rate=0.15, tmax=25, seed=5))
+
+def build(chips=None, **kwargs):
+    if chips is None:
+        system = Chip(x_dim=4, y_dim=4, **kwargs)
+    else:
+        system = Board(chips[0], chips[1], x_dim=4//chips[0], y_dim=4//chips[1], **kwargs)
+    system.program_cores(netfile)
+    probe = system.add_probe('spikes')
+    return system, probe
+
+def same_state(a, b):
+    for core_a, core_b in zip(a.cores, b.cores):
+        assert core_a.core_id == core_b.core_id
+        assert np.array_equal(core_a.voltage, core_b.voltage)
+        assert np.array_equal(core_a.current, core_b.current)
+        assert np.array_equal(core_a.get_last_nrn_v(), core_b.get_last_nrn_v())
+        assert core_a.overflow_count == core_b.overflow_count
+
+def same_spikes(a, b):
+    for x, y in zip(a.get_data(), b.get_data()):
+        assert np.array_equal(x, y)
+
+# the neural result does not depend on where the chip boundaries are or how slow the links are
+cycles = {}
+for mode in ('cycle', 'functional'):
+    chip, chip_probe = build(mode=mode)
+    chip.run()
+    for chips in ((2, 1), (2, 2)):
+        for latency, bandwidth in ((1, 4), (4, 1), (16, 1)):
+            board, probe = build(chips, mode=mode, link_latency=latency, link_bandwidth=bandwidth)
+            board.run()
+            same_state(board, chip)
+            same_spikes(probe, chip_probe)
+            if mode == 'cycle':
+                assert sum(link.n_sent for link in board.links) > 0
+                for link in board.links: # credits are on the link, on their way back or with the sender
+                    assert link.credits + len(link.returns) + len(link.messages()) == link.capacity
+                cycles[chips, latency, bandwidth] = board.core_cycle_count
+    if mode == 'cycle':
+        assert chip.core_cycle_count <= min(cycles.values())
+# slower links, and more of them on the paths, cost cycles
+for chips in ((2, 1), (2, 2)):
+    assert cycles[chips, 1, 4] < cycles[chips, 4, 1] < cycles[chips, 16, 1]
+assert cycles[(2, 1), 16, 1] < cycles[(2, 2), 16, 1]
+
+# multicast trees and adaptive routes cross the chips as well
+for kwargs in (dict(multicast=True), dict(routing='odd_even', arbitration='delay', capacity=2)):
+    chip, chip_probe = build(**kwargs)
+    chip.run()
+    board, probe = build((2, 2), link_capacity=2, **kwargs)
+    board.run()
+    same_state(board, chip)
+    same_spikes(probe, chip_probe)
+
+# one process per chip gives the serial result, also stopped with messages on the links
+for kwargs in (dict(), dict(routing='west_first', soa=True), dict(link_latency=3, link_bandwidth=2, pQ=False)):
+    serial, _ = build((2, 2), **kwargs)
+    serial.controller.set_tmax(12)
+    serial.run()
+    assert sum(len(link.messages()) for link in serial.links) > 0 or kwargs.get('pQ', True) == False
+    for workers in (2, 4):
+        board = Board(2, 2, x_dim=2, y_dim=2, workers=workers, **kwargs)
+        board.program_cores(netfile)
+        board.controller.set_tmax(12)
+        board.run()
+        assert board.core_cycle_count == serial.core_cycle_count
+        assert board.cyc_counters == serial.cyc_counters
+        same_state(board, serial)
+        for link, serial_link in zip(board.links, serial.links):
+            assert link.credits == serial_link.credits and link.n_sent == serial_link.n_sent
+            assert list(link.returns) == list(serial_link.returns)
+            assert [(msg.dst, msg.delay) for msg in link.messages()] == \
+                [(msg.dst, msg.delay) for msg in serial_link.messages()]
+        for router, serial_router in zip(board.routers, serial.routers):
+            for key, buff in router.buffers.items():
+                assert [msg.dst for msg in buff.messages()] == [msg.dst for msg in serial_router.buffers[key].messages()]
+# telemetry per chip counts the hops and latencies board-wide, the chips count the cycles of the board
+chip, _ = build()
+chip_stats = chip.enable_telemetry()
+chip.run()
+board, _ = build((2, 2))
+stats = [board_chip.enable_telemetry() for board_chip in board.chips]
+board.run()
+assert all(board_chip.core_cycle_count == board.core_cycle_count for board_chip in board.chips)
+hops = sum(s.hop_count for s in stats)
+assert len(hops) == len(chip_stats.hop_count) and hops[board.chips[0].x_dim + board.chips[0].y_dim:].sum() > 0
+assert np.all(hops <= chip_stats.hop_count) # the board may stop with messages still on the links
+assert all(s.latency.sum() == s.hop_count.sum() for s in stats)
+assert sum(s.hop_latency_sum.sum() for s in stats) / hops.sum() > chip_stats.hop_latency_sum.sum() / chip_stats.hop_count.sum()
+# a traced message would leave the tracer of its chip
+try:
+    board.chips[0].enable_tracing()
+    assert False
+except AssertionError as err:
+    assert 'Board' in str(err)
+print('Cycle Count: {} on one chip, {} on 2x2 chips with 16 cycle links'.format(chip.core_cycle_count,
+    cycles[(2, 2), 16, 1]))
@@ -0,0 +1,181 @@
+import struct
+import zipfile
+import numpy as np
+from noc_utils import MSG_POOL, advance_enqueue_seq, advance_inject_seq
+
+CHECKPOINT_VERSION = 1
+# one row per buffered message, lists are stored in the ragged msg_dsts, msg_axons and msg_branches arrays
+MSG_DTYPE = np.dtype([('queue', np.int32), ('dst', np.int64), ('n_dsts', np.int32), ('n_axons', np.int32),
+    ('n_branches', np.int32), ('delay', np.int64), ('due', np.int64), ('op', np.int32), ('q_op', np.int64),
+    ('src', np.int64), ('born', np.int64), ('seq', np.int64), ('hop_t', np.int64)])
+# per queue: epoch, op_step, number of messages and size of the delay-1 group
+QUEUE_FIELDS = 4
+
+def chip_queues(chip):
+    # every Queue of the chip in checkpoint order: in and out buffer of each core, then the router buffers.
+    # an array NoC first writes its buffers and round robin pointers back to the routers, see MeshNoc.store
+    if getattr(chip, 'noc', None) is not None:
+        chip.noc.store()
+    queues = []
+    for core in chip.cores:
+        queues.extend((core.in_buffer, core.out_buffer))
+    for router in chip.routers:
+        queues.extend(router.buffers.values())
+    return queues
+
+def save_checkpoint(chip, filename):
+    """
+    save_checkpoint - write the simulation state of a prepared Chip between two timesteps to an uncompressed
+    .npz: the compartment state, the delay line (in delay order) up to its last non-zero row, every buffered SpikeMsg, the
+    arbiter round robin pointers, the timestep and the cycle counters. the network itself (parameters,
+    synapse tables, axon_out) is not saved, load_checkpoint restores into a chip programmed with the
+    same network. probes, telemetry and tracer records are not part of the checkpoint
+    """
+    queues = chip_queues(chip)
+    cores = chip.cores
+    n_neurons = np.array([core.n_neurons for core in cores], dtype=np.int64)
+    delay_lines = [core.delay_line() for core in cores]
+    used = [np.flatnonzero(delay_line.any(axis=1)) for delay_line in delay_lines if delay_line.shape[1] > 0]
+    n_rows = max([int(rows[-1]) + 1 for rows in used if len(rows) > 0] + [0])
+    arrays = dict(
+        meta=np.array([CHECKPOINT_VERSION, chip.x_dim, chip.y_dim, chip.controller.tstep, chip.controller.tmax,
+            chip.core_cycle_count, chip.quiet_tsteps, advance_enqueue_seq(), advance_inject_seq()], dtype=np.int64),
+        n_neurons=n_neurons,
+        cur_nrn=np.array([core.cur_nrn for core in cores], dtype=np.int64),
+        cyc_counters=np.array([[cyc_count['run'], cyc_count['stall']] for cyc_count in chip.cyc_counters], dtype=np.int64),
+        overflow_count=np.array([[core.overflow_count['input'], core.overflow_count['current']] for core in cores],
+            dtype=np.int64),
+        current=np.concatenate([core.current for core in cores]),
+        voltage=np.concatenate([core.voltage for core in cores]),
+        spiked=np.concatenate([core.spiked for core in cores]),
+        input=np.concatenate([delay_line[:n_rows] for delay_line in delay_lines], axis=1),
+        input_head=np.array([core.input_head for core in cores], dtype=np.int64),
+        n_last_nrn_v=np.array([len(core.last_nrn_v) for core in cores], dtype=np.int64),
+        last_nrn_v=np.asarray([v for core in cores for v in core.last_nrn_v], dtype=cores[0].voltage.dtype),
+        start_inds=np.array([[arb.start_ind for arb in router.xbar.arbiters.values()] for router in chip.routers],
+            dtype=np.int64))
+    queue_state = np.zeros((len(queues), QUEUE_FIELDS), dtype=np.int64)
+    rows, dsts, axons, branches = [], [], [], []
+    for q, queue in enumerate(queues):
+        msgs = queue.messages()
+        queue_state[q] = (queue.epoch, queue.op_step, len(msgs), len(queue.urgent))
+        for msg in msgs:
+            multi = type(msg.dst) is list
+            if multi:
+                dsts.extend(msg.dst)
+            axons.extend(msg.axon_ids)
+            if msg.branches is not None:
+                branches.extend((op, dst) for op, op_dsts in msg.branches.items() for dst in op_dsts)
+            rows.append((q, -1 if multi else msg.dst, len(msg.dst) if multi else 0, len(msg.axon_ids),
+                0 if msg.branches is None else sum(len(op_dsts) for op_dsts in msg.branches.values()),
+                msg.delay, msg.due, msg.op, msg.q_op, msg.src, msg.born, msg.seq, msg.hop_t))
+    arrays.update(queues=queue_state, msgs=np.array(rows, dtype=MSG_DTYPE), msg_dsts=np.array(dsts, dtype=np.int64),
+        msg_axons=np.array(axons, dtype=np.int64), msg_branches=np.array(branches, dtype=np.int64).reshape(-1, 2))
+    with open(filename, 'wb') as fhandle: # a file object keeps np.savez from appending .npz
+        np.savez(fhandle, **arrays)
+
+def load_arrays(filename, mmap=True, mode='r'):
+    """
+    load_arrays - name -> array of every member of an uncompressed .npz
+    mmap: memory-map the members instead of reading them, np.load cannot map .npz members
+    mode: np.memmap mode of the mapped members, 'r' read-only or 'c' copy on write
+    """
+    if not mmap:
+        with np.load(filename) as data:
+            return {name: data[name] for name in data.files}
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as fhandle:
+        for info in archive.infolist():
+            assert info.compress_type == zipfile.ZIP_STORED, 'compressed .npz members cannot be mapped'
+            # data follows the local file header, whose name and extra field lengths are at offset 26
+            fhandle.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack('<HH', fhandle.read(4))
+            fhandle.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(fhandle)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fhandle)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fhandle)
+            assert not dtype.hasobject
+            name = info.filename[:-len('.npy')]
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode=mode, offset=fhandle.tell(), shape=shape,
+                    order='F' if fortran_order else 'C')
+    return arrays
+
+def load_checkpoint(chip, filename, mmap=True):
+    """
+    load_checkpoint - restore a save_checkpoint file into a Chip with the same mesh, prepared with the same
+    network, e.g. a fresh chip after program_cores. run() then continues from the saved timestep
+    mmap: copy the arrays out of a memory-mapped file (see load_arrays)
+    """
+    data = load_arrays(filename, mmap=mmap)
+    version, x_dim, y_dim, tstep, tmax, core_cycle_count, quiet_tsteps, enqueue_seq, inject_seq = data['meta'].tolist()
+    assert version == CHECKPOINT_VERSION
+    assert (x_dim, y_dim) == (chip.x_dim, chip.y_dim), 'checkpoint of a different mesh'
+    cores = chip.cores
+    n_neurons = np.asarray(data['n_neurons'])
+    assert n_neurons.tolist() == [core.n_neurons for core in cores], 'checkpoint of a different network'
+    chip.controller.tmax = tmax
+    chip.controller.tstep = tstep
+    chip.core_cycle_count = core_cycle_count
+    chip.quiet_tsteps = quiet_tsteps
+    # later messages get enqueue and creation stamps above the restored ones, as in the saved run
+    advance_enqueue_seq(enqueue_seq)
+    advance_inject_seq(inject_seq)
+    offsets = np.concatenate(([0], np.cumsum(n_neurons)))
+    last_offsets = np.concatenate(([0], np.cumsum(data['n_last_nrn_v'])))
+    last_nrn_v = data['last_nrn_v']
+    n_rows = data['input'].shape[0]
+    if 'input_head' in data: # the rings rotate as in the saved run
+        heads = data['input_head'].tolist()
+        if chip.state is not None:
+            chip.state.set_input_head(heads[0])
+        for core, head in zip(cores, heads):
+            core.input_head = head
+    for i, core in enumerate(cores):
+        nrns = slice(offsets[i], offsets[i+1])
+        for name in ('current', 'voltage', 'spiked'):
+            getattr(core, name)[...] = data[name][nrns] # in place, these may be views into a ChipState
+        rows = (core.input_head + np.arange(len(core.input))) % len(core.input) # in delay order
+        core.input[rows[:n_rows]] = data['input'][:, nrns]
+        core.input[rows[n_rows:]] = 0
+        core.cur_nrn = int(data['cur_nrn'][i])
+        core.overflow_count = dict(zip(('input', 'current'), data['overflow_count'][i].tolist()))
+        core.last_nrn_v = list(last_nrn_v[last_offsets[i]:last_offsets[i+1]].astype(core.voltage.dtype))
+        chip.cyc_counters[i].update(zip(('run', 'stall'), data['cyc_counters'][i].tolist()))
+    for router, start_inds in zip(chip.routers, data['start_inds'].tolist()):
+        for arb, start_ind in zip(router.xbar.arbiters.values(), start_inds):
+            arb.start_ind = start_ind
+    msgs = data['msgs']
+    columns = {name: msgs[name].tolist() for name in MSG_DTYPE.names}
+    dsts = data['msg_dsts'].tolist()
+    axons = data['msg_axons'].tolist()
+    branches = data['msg_branches'].tolist()
+    n_dst, n_axon, n_branch = 0, 0, 0
+    queue_msgs = [[] for _ in range(len(data['queues']))]
+    for m in range(len(msgs)):
+        if columns['n_dsts'][m] > 0:
+            dst = dsts[n_dst:n_dst + columns['n_dsts'][m]]
+            n_dst += len(dst)
+        else:
+            dst = columns['dst'][m]
+        msg = MSG_POOL.acquire(dst, axons[n_axon:n_axon + columns['n_axons'][m]], columns['delay'][m])
+        n_axon += columns['n_axons'][m]
+        if columns['n_branches'][m] > 0:
+            msg.branches = {}
+            for op, branch_dst in branches[n_branch:n_branch + columns['n_branches'][m]]:
+                msg.branches.setdefault(op, []).append(branch_dst)
+            n_branch += columns['n_branches'][m]
+        for name in ('due', 'op', 'q_op', 'src', 'born', 'seq', 'hop_t'):
+            setattr(msg, name, columns[name][m])
+        queue_msgs[columns['queue'][m]].append(msg)
+    for queue, (epoch, op_step, n_msgs, n_urgent), q_msgs in zip(chip_queues(chip), data['queues'].tolist(), queue_msgs):
+        assert len(q_msgs) == n_msgs
+        for msg in queue.messages(): # the restored state replaces whatever the chip had buffered
+            MSG_POOL.release(msg)
+        queue.load(epoch, op_step, q_msgs, n_urgent)
+    if getattr(chip, 'noc', None) is not None:
+        chip.noc.load()
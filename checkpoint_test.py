@@ -0,0 +1,87 @@
+from chip_utils import Chip
+from checkpoint import chip_queues
+from chip_programmer import save_network
+from netgen import random_sparse
+import numpy as np
+import os
+import tempfile
+
+# a busy 3x3 mesh with small router buffers, so that messages are in flight between timesteps
+tmpdir = tempfile.mkdtemp()
+netfile = os.path.join(tmpdir, 'sparse.npz')
+save_network(netfile, *random_sparse(x_dim=3, y_dim=3, npc=12, fan_out=6, rate=0.3, tmax=40, seed=7))
+ckpt = os.path.join(tmpdir, 'chip.ckpt')
+
+def build(**kwargs):
+    chip = Chip(x_dim=3, y_dim=3, capacity=2, **kwargs)
+    chip.program_cores(netfile)
+    return chip
+
+def run_to(chip, tstep):
+    while chip.controller.get_tstep() < tstep:
+        chip.operate()
+
+def same_run(a, b):
+    assert a.controller.get_tstep() == b.controller.get_tstep()
+    assert a.core_cycle_count == b.core_cycle_count
+    assert a.cyc_counters == b.cyc_counters
+    for core_a, core_b in zip(a.cores, b.cores):
+        assert np.array_equal(core_a.voltage, core_b.voltage)
+        assert np.array_equal(core_a.current, core_b.current)
+        assert np.array_equal(core_a.input, core_b.input)
+        assert np.array_equal(core_a.get_last_nrn_v(), core_b.get_last_nrn_v())
+        assert core_a.overflow_count == core_b.overflow_count
+
+for kwargs in (dict(), dict(soa=True), dict(arith='int'), dict(multicast=True, arbitration='age'),
+               dict(scheduler='event', pQ=False), dict(routing='odd_even', fast_forward=True)):
+    reference = build(**kwargs)
+    reference.run()
+    # stop half way, with messages still buffered
+    chip = build(**kwargs)
+    run_to(chip, 20)
+    assert sum(queue.n_msgs for queue in chip_queues(chip)) > 0
+    chip.save_checkpoint(ckpt)
+    chip.run()
+    same_run(chip, reference)
+    # fresh chips continue from the checkpoint, memory-mapped or read
+    for mmap in (True, False):
+        restored = build(**kwargs)
+        restored.load_checkpoint(ckpt, mmap=mmap)
+        assert restored.controller.get_tstep() == 20
+        restored.run()
+        same_run(restored, reference)
+
+# experiments forked from one warmed-up chip
+warm = build()
+run_to(warm, 10)
+warm.save_checkpoint(ckpt)
+forks = []
+for bias in (0.0, 5.0):
+    fork = build()
+    fork.load_checkpoint(ckpt)
+    for core in fork.cores:
+        core.bias[:] += bias
+    fork.run()
+    forks.append(fork)
+warm.run()
+same_run(forks[0], warm)
+assert not np.array_equal(forks[1].cores[0].voltage, warm.cores[0].voltage)
+
+# periodic checkpoints of a run, the last one resumes to the same result
+chip = build()
+chip.run(checkpoint_file=ckpt, checkpoint_every=15)
+assert not os.path.exists(ckpt + '.tmp')
+restored = build()
+restored.load_checkpoint(ckpt)
+assert restored.controller.get_tstep() == 30
+restored.run()
+same_run(restored, chip)
+
+# the checkpoint only fits a chip with the same mesh and network
+try:
+    other = Chip(x_dim=2, y_dim=3)
+    other.load_checkpoint(ckpt)
+    assert False
+except AssertionError as err:
+    assert 'mesh' in str(err)
+print('Checkpoint size: {} bytes'.format(os.path.getsize(ckpt)))
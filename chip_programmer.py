@@ -1,10 +1,104 @@
 from collections import OrderedDict
-from core_utils import Core, SynapseState
+from core_utils import Core, SynapseState, MAX_DELAY
 import csv
 import numpy as np
 
 DTYPE = np.float32
 
+# binary network format, see save_network
+NEURON_DTYPE = np.dtype([('nrn_id', np.int64), ('x', np.int32), ('y', np.int32), ('decay_u', DTYPE), ('decay_v', DTYPE),
+    ('vth', DTYPE), ('bias', DTYPE), ('bias_delay', np.int32), ('vmin', DTYPE)])
+SYNAPSE_DTYPE = np.dtype([('src', np.int64), ('dst', np.int64), ('weight', DTYPE), ('delay_pre', np.int32), ('delay_post', np.int32)])
+
+def read_csv_network(simfile):
+    """
+    read_csv_network - parse a ChipProgrammer csv file into structured neuron and synapse tables
+    returns (tmax, neurons, synapses), tables keep the row order of the file
+    """
+    with open(simfile, mode='r') as fhandle:
+        header = fhandle.readline().split()
+        assert header[0] == 'simcontroller'
+        lines = {'neuron': [], 'synapse': []}
+        for line in fhandle:
+            kind = line.split(' ', 1)[0]
+            if kind in lines:
+                lines[kind].append(line)
+    neurons = np.zeros(len(lines['neuron']), dtype=NEURON_DTYPE)
+    if len(neurons) > 0:
+        cols = np.loadtxt(lines['neuron'], dtype=str, usecols=range(1, 10), ndmin=2)
+        for i, name in enumerate(NEURON_DTYPE.names):
+            neurons[name] = cols[:, i].astype(np.float64 if NEURON_DTYPE[name] == DTYPE else NEURON_DTYPE[name])
+    synapses = np.zeros(len(lines['synapse']), dtype=SYNAPSE_DTYPE)
+    if len(synapses) > 0:
+        cols = np.loadtxt(lines['synapse'], dtype=str, usecols=range(1, 6), ndmin=2)
+        for i, name in enumerate(SYNAPSE_DTYPE.names):
+            synapses[name] = cols[:, i].astype(np.float64 if SYNAPSE_DTYPE[name] == DTYPE else SYNAPSE_DTYPE[name])
+    return int(header[1]), neurons, synapses
+
+def save_network(filename, tmax, neurons, synapses):
+    """
+    save_network - write the binary network format, an uncompressed .npz with members
+        tmax: number of timesteps
+        neurons: NEURON_DTYPE table, one row per neuron line of the csv format
+        synapses: SYNAPSE_DTYPE table, one row per synapse line of the csv format
+    """
+    np.savez(filename, tmax=np.int64(tmax), neurons=np.asarray(neurons, dtype=NEURON_DTYPE),
+             synapses=np.asarray(synapses, dtype=SYNAPSE_DTYPE))
+
+def load_network(filename):
+    with np.load(filename) as data:
+        return int(data['tmax']), data['neurons'], data['synapses']
+
+def write_csv_network(simfile, tmax, neurons, synapses):
+    """
+    write_csv_network - write neuron and synapse tables in the csv format read by ChipProgrammer
+    """
+    with open(simfile, mode='w') as fhandle:
+        fhandle.write('simcontroller {}\n'.format(int(tmax)))
+        for nrn in neurons.tolist():
+            fhandle.write('neuron {} {} {} {!r} {!r} {!r} {!r} {} {!r}\n'.format(*nrn))
+        for syn in synapses.tolist():
+            fhandle.write('synapse {} {} {!r} {} {}\n'.format(*syn))
+
+def convert_csv(simfile, filename):
+    """
+    convert_csv - convert a csv network file to the binary format read by ChipProgrammer
+    """
+    save_network(filename, *read_csv_network(simfile))
+
+def read_network(filename):
+    # (tmax, neurons, synapses) of a binary (.npz) or csv network file
+    if filename.endswith('.npz'):
+        return load_network(filename)
+    return read_csv_network(filename)
+
+def write_network(filename, tmax, neurons, synapses):
+    # binary format for .npz file names, csv otherwise
+    if filename.endswith('.npz'):
+        save_network(filename, tmax, neurons, synapses)
+    else:
+        write_csv_network(filename, tmax, neurons, synapses)
+
+def nrn_rows(neurons, nrn_ids):
+    # rows of the neuron table holding the given neuron ids
+    id_order = np.argsort(neurons['nrn_id'], kind='stable')
+    sorted_ids = neurons['nrn_id'][id_order]
+    pos = np.minimum(np.searchsorted(sorted_ids, nrn_ids), max(len(sorted_ids) - 1, 0))
+    assert len(nrn_ids) == 0 or np.array_equal(sorted_ids[pos], nrn_ids), 'synapse references an unknown neuron'
+    return id_order[pos]
+
+def axon_id(src_nrn_id, delay_pre):
+    # axon of the synapses of a source neuron that share delay_pre, within their destination core
+    return src_nrn_id * MAX_DELAY + delay_pre - 1
+
+def group_by(keys):
+    # yields (key, indices of the rows with that key) in key order, rows keep their order
+    order = np.argsort(keys, kind='stable')
+    bounds = np.flatnonzero(np.diff(keys[order])) + 1
+    for rows in np.split(order, bounds):
+        if len(rows) > 0:
+            yield int(keys[rows[0]]), rows
+
 class ChipProgrammer:
     """
     Given a reference to a Chip object and a document that specifies network and simulation parameters, set up the network and simulation on the virtual chip
@@ -12,6 +106,9 @@ class ChipProgrammer:
     simcontroller <tmax> 
     neuron nrn_id, x_coor, y_coor, decay_u, decay_v, vth, bias=0, bias_delay=0, vmin=0, vmax=np.inf
     synapse src_nrn_id, dst_nrn_id, weight, delay_pre, delay_post, 
+    files ending in .npz are read as the binary format written by save_network and programmed in bulk
+    the synapses of a source neuron into one core with the same delay_pre share an axon, and a spike
+    sends one message per such axon (see axon_id)
     """
 
     def __init__(self, simfile, chip_ref):
@@ -21,9 +118,13 @@ class ChipProgrammer:
         self.nrn_id_to_core_axon_map = {}
 
     def program(self):
+        if self.simfile.endswith('.npz'):
+            self.program_tables(*load_network(self.simfile))
+            return
         # open csv file
         fhandle = open(self.simfile, mode='r')
         csvfile = csv.reader(fhandle, delimiter=' ')
+        axons_out = set() # (src_nrn_id, dst core, delay_pre) with an axon_out entry
         for i, line in enumerate(csvfile):
             if i == 0:
                 assert line[0] == 'simcontroller'
@@ -51,14 +152,53 @@ class ChipProgrammer:
                 src_core_id = self.nrn_id_to_core_axon_map[src_nrn_id]['core_id']
                 dst_core_id = self.nrn_id_to_core_axon_map[dst_nrn_id]['core_id']
                 src_ind = self.chip_ref.get_ind(src_core_id[0], src_core_id[1])
-                self.chip_ref.cores[src_ind].add_axon_out(self.nrn_id_to_core_axon_map[src_nrn_id]['nrn_core_loc'], (dst_core_id, [src_nrn_id], delay_pre))
+                ax = axon_id(src_nrn_id, delay_pre)
+                if (src_nrn_id, dst_core_id, delay_pre) not in axons_out:
+                    axons_out.add((src_nrn_id, dst_core_id, delay_pre))
+                    self.chip_ref.cores[src_ind].add_axon_out(self.nrn_id_to_core_axon_map[src_nrn_id]['nrn_core_loc'], (dst_core_id, [ax], delay_pre))
                 # must set up axon in in post_core
                 dst_ind = self.chip_ref.get_ind(dst_core_id[0], dst_core_id[1])
-                self.chip_ref.cores[dst_ind].add_synapse_in(src_nrn_id, SynapseState(
+                self.chip_ref.cores[dst_ind].add_synapse_in(ax, SynapseState(
                     self.nrn_id_to_core_axon_map[dst_nrn_id]['nrn_core_loc'],
                     weight,
                     delay_post))
             else:
                 pass
         # close csv file
-        fhandle.close()
\ No newline at end of file
+        fhandle.close()
+
+    def program_tables(self, tmax, neurons, synapses):
+        """
+        program_tables - bulk version of program for structured neuron and synapse tables
+        neurons and synapses are grouped by core with array operations, the resulting core tables are
+        the same as programming the equivalent csv file row by row
+        """
+        chip = self.chip_ref
+        chip.controller.set_tmax(int(tmax))
+        core_ind = chip.get_ind(neurons['x'].astype(np.int64), neurons['y'].astype(np.int64))
+        assert np.all((core_ind >= 0) & (core_ind < len(chip.cores)))
+        nrn_core_loc = np.zeros(len(neurons), dtype=np.int64)
+        for i, rows in group_by(core_ind):
+            nrn_core_loc[rows] = chip.cores[i].add_neurons(neurons['decay_u'][rows], neurons['decay_v'][rows],
+                neurons['vth'][rows], neurons['bias'][rows], neurons['bias_delay'][rows], neurons['vmin'][rows],
+                np.full(len(rows), np.inf, dtype=DTYPE))
+        src = nrn_rows(neurons, synapses['src'])
+        dst = nrn_rows(neurons, synapses['dst'])
+        # afferent synapses of the destination cores
+        axons = axon_id(synapses['src'].astype(np.int64), synapses['delay_pre'].astype(np.int64))
+        for i, rows in group_by(core_ind[dst]):
+            chip.cores[i].add_synapses_in(axons[rows], nrn_core_loc[dst[rows]],
+                synapses['weight'][rows], synapses['delay_post'][rows])
+        # one efferent message per axon, at the first synapse of the axon
+        _, first = np.unique(np.stack((axons, core_ind[dst]), axis=1), axis=0, return_index=True)
+        first = np.sort(first)
+        for i, rows in group_by(core_ind[src[first]]):
+            rows = first[rows]
+            core = chip.cores[i]
+            for nrn, dst_ind, ax, delay in zip(nrn_core_loc[src[rows]].tolist(), core_ind[dst[rows]].tolist(),
+                                               axons[rows].tolist(), synapses['delay_pre'][rows].tolist()):
+                core.add_axon_out(nrn, (chip.get_coor(dst_ind), [ax], delay))
+
+if __name__ == '__main__':
+    import sys
+    convert_csv(sys.argv[1], sys.argv[2])
@@ -0,0 +1,62 @@
+from chip_utils import Chip
+from chip_programmer import convert_csv
+from noc_utils import unpack_coor
+import numpy as np
+import os
+import tempfile
+
+# the same network programmed from the csv format and from the binary format
+lines = ['simcontroller 30']
+for n in range(12):
+    lines.append('neuron {} {} {} 0.5 0.9 {} {} {} 0'.format(100 + 7*n, n%2, (n//2)%2, 80 + n, 10 + n%5, n%3))
+for n in range(12):
+    for m in (1, 4, 7):
+        lines.append('synapse {} {} {} {} {}'.format(100 + 7*n, 100 + 7*((n + m)%12), 20.0 - 3*m, 1 + m%3, m%4))
+tmpdir = tempfile.mkdtemp()
+csv_file = os.path.join(tmpdir, 'net.csv')
+npz_file = os.path.join(tmpdir, 'net.npz')
+with open(csv_file, 'w') as fhandle:
+    fhandle.write('\n'.join(lines) + '\n')
+convert_csv(csv_file, npz_file)
+
+chips = []
+for simfile in (csv_file, npz_file):
+    chip = Chip(x_dim=2, y_dim=2)
+    chip.program_cores(simfile)
+    chips.append(chip)
+for csv_core, npz_core in zip(*[chip.cores for chip in chips]):
+    assert csv_core.n_neurons == npz_core.n_neurons
+    assert csv_core.n_synapse_in == npz_core.n_synapse_in
+    assert csv_core.axon_out_msgs == npz_core.axon_out_msgs
+    for name in ('vth', 'bias', 'bias_delay', 'axon_ids', 'syn_ptr', 'syn_nrn', 'syn_weight', 'syn_delay'):
+        assert np.array_equal(getattr(csv_core, name), getattr(npz_core, name))
+for chip in chips:
+    chip.run()
+for csv_core, npz_core in zip(*[chip.cores for chip in chips]):
+    assert np.array_equal(csv_core.voltage, npz_core.voltage)
+assert chips[0].core_cycle_count == chips[1].core_cycle_count
+print('Cycle Count: {}'.format(chips[1].core_cycle_count))
+
+# a spike sends one message per (destination core, delay_pre) and delivers each of its synapses once
+lines = ['simcontroller 5', 'neuron 0 0 0 0.5 0.9 10 0 0 0']
+for n, (x, y) in enumerate([(1, 0), (1, 0), (1, 0), (1, 0), (0, 1)]):
+    lines.append('neuron {} {} {} 0.5 0.9 100 0 0 0'.format(n + 1, x, y))
+synapses = [(1, 10.0, 1), (2, 20.0, 1), (3, 30.0, 2), (4, 40.0, 1), (5, 50.0, 3), (2, 60.0, 2)]
+for dst, weight, delay in synapses:
+    lines.append('synapse 0 {} {} {} 0'.format(dst, weight, delay))
+with open(csv_file, 'w') as fhandle:
+    fhandle.write('\n'.join(lines) + '\n')
+convert_csv(csv_file, npz_file)
+for simfile in (csv_file, npz_file):
+    chip = Chip(x_dim=2, y_dim=2)
+    chip.program_cores(simfile)
+    msgs = chip.cores[0].emit_spikes([0])
+    assert [(unpack_coor(msg.dst), msg.delay) for msg in msgs] == [((1, 0), 1), ((1, 0), 2), ((0, 1), 3)]
+    for msg in msgs:
+        chip.cores[chip.get_ind(*unpack_coor(msg.dst))].deliver(msg)
+    expected = {(1, 0): [[1, 0, 10.0], [1, 1, 20.0], [2, 2, 30.0], [1, 3, 40.0], [2, 1, 60.0]], (0, 1): [[3, 0, 50.0]]}
+    for coor, inputs in expected.items():
+        core = chip.cores[chip.get_ind(*coor)]
+        assert sorted(list(row) for row in zip(*np.nonzero(core.input))) == sorted(row[:2] for row in inputs)
+        for delay, nrn, weight in inputs:
+            assert core.input[delay, nrn] == weight
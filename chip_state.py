@@ -0,0 +1,62 @@
+import numpy as np
+from core_utils import NEURON_ARRAYS, update_neurons, update_neurons_int
+
+class ChipState:
+    """
+    Structure-of-arrays storage for the neuron state of every core on a chip
+
+    The compartments of core i occupy [offsets[i], offsets[i+1]) of each chip-wide array.
+    After packing, the arrays of each Core are views into this storage, so the per-core
+    accessors (get_last_nrn_v, process_neuron, ...) keep working unchanged.
+    """
+
+    def __init__(self, cores):
+        self.cores = cores
+        self.offsets = np.zeros(len(cores)+1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([core.n_neurons for core in cores])
+        self.n_neurons = int(self.offsets[-1])
+        self.arith = cores[0].arith # dtypes follow the prepared cores
+        self.input = np.zeros((cores[0].input.shape[0], self.n_neurons), dtype=cores[0].input.dtype)
+        self.input_head = cores[0].input_head # one ring head for the delay lines of all cores
+        for name in NEURON_ARRAYS:
+            setattr(self, name, np.zeros(self.n_neurons, dtype=getattr(cores[0], name).dtype))
+        for i, core in enumerate(cores):
+            core.attach_state(self, self.offsets[i])
+
+    def advance_input(self):
+        self.input[self.input_head] = 0
+        self.set_input_head((self.input_head + 1) % len(self.input))
+        self.spiked[:] = False
+
+    def set_input_head(self, head):
+        self.input_head = head
+        for core in self.cores:
+            core.input_head = head
+
+    def process_neurons(self, tstep):
+        """
+        process_neurons - update every compartment of the chip in one vectorized step
+        returns the chip-wide indices of the compartments that spiked, in ascending order
+        """
+        args = (self.current, self.voltage, self.input[self.input_head], self.decay_u, self.decay_v, \
+            self.vth, self.vmin, self.vmax, self.bias, tstep >= self.bias_delay)
+        if self.arith == 'int':
+            spiked, q_overflowed, u_overflowed = update_neurons_int(*args)
+            for key, overflowed in (('input', q_overflowed), ('current', u_overflowed)):
+                if overflowed.any(): # per-core counts from a prefix sum over the chip
+                    csum = np.concatenate(([0], np.cumsum(overflowed)))
+                    for core, n in zip(self.cores, csum[self.offsets[1:]] - csum[self.offsets[:-1]]):
+                        core.overflow_count[key] += int(n)
+        else:
+            spiked = update_neurons(*args)
+        self.spiked[:] = spiked
+        return np.flatnonzero(spiked)
+
+    def split_by_core(self, nrn_ids):
+        """
+        split_by_core - map sorted chip-wide compartment indices to (core index, local ids) pairs
+        cores without any of the indices are skipped
+        """
+        bounds = np.searchsorted(nrn_ids, self.offsets)
+        for i in np.flatnonzero(bounds[1:] > bounds[:-1]):
+            yield i, nrn_ids[bounds[i]:bounds[i+1]] - self.offsets[i]
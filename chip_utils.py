@@ -1,7 +1,18 @@
 import numpy as np
-from noc_utils import SpikeMsg, Queue, Router
+from noc_utils import SpikeMsg, Queue, Router, unpack_coor, MSG_POOL
 from core_utils import Core
 from chip_programmer import ChipProgrammer
+from chip_state import ChipState
+from scheduler import EventScheduler
+from mesh_noc import MeshNoc
+from probes import Probe
+from parallel import ParallelRunner
+from telemetry import Telemetry
+from tracing import Tracer
+import checkpoint
+import compile_cache
+import os
+import time
 
 opp_map = {
     'north': 'south',
@@ -30,34 +41,102 @@ class SimController:
     def conditional_run(self):
         return self.tstep < self.tmax
 
+def deliver_functional(chip, msgs):
+    # hand the messages to the destination cores of chip (a Chip or a Board), in order per core
+    per_core = {}
+    for msg in msgs:
+        for dst in (msg.dst if type(msg.dst) is list else (msg.dst,)):
+            per_core.setdefault(dst, []).append(msg)
+    for dst, core_msgs in per_core.items():
+        chip.cores[chip.get_ind(*unpack_coor(dst))].deliver_batch(core_msgs)
+    for msg in msgs:
+        MSG_POOL.release(msg)
+
 class Chip:
     """
     Class that maps cores to routers and defines the topology of the system
     """
-    def __init__(self, x_dim=4, y_dim=4, util_arr=None):
-        self.controller = SimController()
+    def __init__(self, x_dim=4, y_dim=4, util_arr=None, mode='cycle', soa=False, scheduler='sync', arith='float', workers=1, capacity=50, pQ=True, multicast=False,
+                 routing='xy', arbitration='round_robin', fast_forward=False, origin=(0, 0), controller=None,
+                 noc='objects', weight_exp=0):
+        """
+        mode: 'cycle' steps every compartment and message through the cores and the NoC (stall studies)
+              'functional' updates each core in one vectorized pass per timestep and hands spike
+              messages straight to their destination cores. voltages and spikes match 'cycle' mode,
+              but core_cycle_count and the router buffers are not modelled
+        soa: pack the neuron state of all cores into one ChipState when the cores are prepared.
+             in 'functional' mode the whole chip is then updated in a single vectorized step
+        scheduler: 'sync' visits every core and router on every cycle, 'event' only visits those with
+                   work and skips empty cycles (same cycle counts). util_arr needs 'sync'
+        arith: 'float' or 'int' (Loihi fixed-point) neuron arithmetic, see Core. 'int' rounds the thresholds,
+               biases and weights to integers, prepare_computation reports how many of them changed
+        weight_exp: 'int' arithmetic holds the state and parameters in units of 2**-weight_exp, see Core
+        workers: run() splits the mesh into this many bands of columns, each simulated by its own
+                 process (see ParallelRunner). needs 'cycle' mode, the 'sync' scheduler and no util_arr
+        capacity, pQ: size and priority ordering of the router input buffers, see Queue
+        multicast: a spike sends one message per axon to all the cores it targets, forked by the routers
+                   along the XY tree (see Core.multicast_axon_out), instead of one message per core
+        routing, arbitration: routing algorithm and output port arbiter of the routers, see Router.
+                              workers > 1 needs 'xy' routing and an arbiter other than 'age', whose
+                              decisions only depend on the state of the own tile
+        fast_forward: 'cycle' mode updates a timestep in which the NoC is empty and no compartment spikes
+                      in one vectorized pass per core, see quiet_timestep (same state and cycle counts).
+                      needs a single worker and no util_arr
+        origin: global (x, y) of core (0, 0) of the chip. cores and routers carry global coordinates, so the
+                routers of the chips of a Board route to cores on other chips; get_ind and get_coor convert
+                between global coordinates and the index in this chip
+        controller: SimController shared with the other chips of a Board, default a new one
+        noc: 'objects' steps the Router objects, 'arrays' all routers at once with their buffers in NumPy arrays
+             (see mesh_noc.MeshNoc), with the same cycle counts. 'arrays' needs 'cycle' mode, the 'sync'
+             scheduler, a single worker, 'xy' routing, the 'round_robin' arbiter, no multicast and no util_arr,
+             telemetry or tracing
+        """
+        assert mode in ('cycle', 'functional')
+        assert scheduler in ('sync', 'event')
+        assert scheduler == 'sync' or util_arr is None
+        assert workers == 1 or (mode == 'cycle' and scheduler == 'sync' and util_arr is None)
+        assert workers == 1 or (routing == 'xy' and arbitration != 'age')
+        assert not fast_forward or (mode == 'cycle' and workers == 1 and util_arr is None)
+        assert noc in ('objects', 'arrays')
+        assert noc == 'objects' or (mode == 'cycle' and scheduler == 'sync' and workers == 1 and routing == 'xy' and
+            arbitration == 'round_robin' and not multicast and util_arr is None)
+        self.mode = mode
+        self.multicast = multicast
+        self.soa = soa
+        self.state = None
+        self.controller = SimController() if controller is None else controller
         self.x_dim = x_dim
         self.y_dim = y_dim
-        self.get_ind = lambda x, y: y + (x * self.y_dim) # for iterating x outer, y inner
-        self.get_coor = lambda i: (i//self.y_dim, i%self.y_dim)
+        self.origin = origin
+        x0, y0 = origin
+        self.get_ind = lambda x, y: (y - y0) + ((x - x0) * self.y_dim) # for iterating x outer, y inner
+        self.get_coor = lambda i: (x0 + i//self.y_dim, y0 + i%self.y_dim)
         self.core_cycle_count = 0
         self.cores = []
         self.cyc_counters = [{'stall': 0, 'run': 0} for _ in range(self.x_dim * self.y_dim)]
         self.routers = []
         self.util_arr_ref = util_arr
-        for x in range(self.x_dim):
-            for y in range(self.y_dim):
-                self.cores.append(Core((x, y), self.controller.get_tstep))
-                self.routers.append(Router((x, y)))
+        self.probes = []
+        self.telemetry = None
+        self.tracer = None
+        self.board = None # the Board the chip is part of, set by the Board
+        self.workers = workers
+        self.fast_forward = fast_forward
+        self.quiet_tsteps = 0 # timesteps taken by quiet_timestep
+        for x in range(x0, x0 + self.x_dim):
+            for y in range(y0, y0 + self.y_dim):
+                self.cores.append(Core((x, y), self.controller.get_tstep, arith=arith, multicast=multicast,
+                    weight_exp=weight_exp))
+                self.routers.append(Router((x, y), capacity=capacity, pQ=pQ, routing=routing, arbiter=arbitration))
         directions = ['north', 'east', 'south', 'west', 'local']
         self.buffers = {}
         self.sink_refs = {}
         for d in directions:
-            self.buffers[d] = Queue(capacity=1) # TODO - if multi-chip, will need to make decode more flexible
-            self.sink_refs[d] = Queue(capacity=1)
+            self.buffers[d] = Queue(capacity=1)
+            self.sink_refs[d] = Queue(capacity=1) # unconnected boundary ports, a Board links the inner ones
         for x in range(x_dim):
             for y in range(y_dim):
-                i = self.get_ind(x, y)
+                i = self.get_ind(x0 + x, y0 + y)
                 if (x == 0):
                     self.routers[i].set_sink_ref('west', self.sink_refs['east'])
                 else:
@@ -78,52 +157,241 @@ class Chip:
                 self.cores[i].set_sink_ref(self.routers[i].get_buffer_ref('local'))
             for router in self.routers:
                 router.initialize_crossbar()
+        self.scheduler = EventScheduler(self) if scheduler == 'event' else None
+        self.noc = MeshNoc(self) if noc == 'arrays' else None
 
-    def program_cores(self, filename):
+    def program_cores(self, filename, cache_dir=None, cache_bytes=compile_cache.CACHE_MAX_BYTES):
+        """
+        cache_dir: keep the prepared cores in this compile cache, a later call with the same network file and
+                   chip settings loads them instead of programming (see compile_cache), which keeps at most
+                   cache_bytes of entries
+        """
+        if cache_dir is not None:
+            compile_cache.program_cached(self, filename, cache_dir, max_bytes=cache_bytes)
+            return
         self.programmer = ChipProgrammer(filename, self)
         self.programmer.program()
-        # call prepare_computation() on all the cores
+        self.prepare_computation()
+
+    def prepare_computation(self, loaded=False):
+        # call prepare_computation() on all the cores, unless they were loaded prepared from the compile cache
         for core in self.cores:
-            core.prepare_computation()
+            if not loaded:
+                core.prepare_computation()
+        n_rounded = sum(core.n_rounded for core in self.cores)
+        if n_rounded > 0:
+            print("{} thresholds, biases and weights rounded by 'int' arithmetic, see weight_exp".format(n_rounded))
+        if self.soa:
+            self.state = ChipState(self.cores)
+
+    def add_probe(self, kind, **kwargs):
+        """
+        add_probe - record spikes, voltages or currents of the prepared cores, see Probe for the arguments
+        returns the Probe, read the recording with Probe.get_data()
+        """
+        probe = Probe(self, kind, **kwargs)
+        self.probes.append(probe)
+        return probe
+
+    def enable_telemetry(self, sample_every=None, latency_bins=1024):
+        """
+        enable_telemetry - attach a Telemetry to the routers and cores, see Telemetry for the counters
+        sample_every: cycles between buffer occupancy samples, None samples at timestep boundaries
+        """
+        assert self.telemetry is None and self.noc is None
+        self.telemetry = Telemetry(self, sample_every=sample_every, latency_bins=latency_bins)
+        return self.telemetry
+
+    def disable_telemetry(self):
+        if self.telemetry is not None:
+            self.telemetry.detach()
+            self.telemetry = None
+
+    def enable_tracing(self, sample=1, chunk=65536, filename=None):
+        """
+        enable_tracing - attach a Tracer that follows every sample-th spike message through the NoC
+        not on the chips of a Board, where messages leave the chip before they are consumed
+        """
+        assert self.tracer is None and self.noc is None
+        assert self.board is None, 'tracing is not supported on a Board'
+        self.tracer = Tracer(self, sample=sample, chunk=chunk, filename=filename)
+        return self.tracer
+
+    def disable_tracing(self):
+        if self.tracer is not None:
+            self.tracer.detach()
+            self.tracer = None
 
     def operate(self):
         if (self.controller.conditional_run()):
-            tic_toc = 0 # use tic_toc for relative timeing
-            while(not self.ready()):
-                if self.util_arr_ref is not None:
-                    self.util_arr_ref.append(list())
-                # first iterate through the matrix of cores and operate
-                if tic_toc%4==0:
-                    for i, core in enumerate(self.cores):
-                        core.operate(cyc_count=self.cyc_counters[i])
-                # iterate through the routers and operate
-                if tic_toc%1 == 0:
-                    # do this once before such that each message gets a chance to move once only
-                    self.noc_next_op_step()
-                    for router in self.routers:
-                        router.operate()
-                    if self.util_arr_ref is not None:
-                        for router in self.routers:
-                            self.util_arr_ref[-1].append(router.get_util())
-                        #print(router)
-                tic_toc = tic_toc + 1
-                self.core_cycle_count += 1
+            if self.mode == 'functional':
+                self.operate_functional()
+            elif self.fast_forward and self.quiet_timestep():
+                self.quiet_tsteps += 1
+            elif self.scheduler is not None:
+                self.scheduler.operate()
+            else:
+                self.operate_cycle()
+            for probe in self.probes:
+                probe.record(self.controller.get_tstep())
+            if self.telemetry is not None:
+                self.telemetry.timestep()
             self.controller.inc_tstep()
-            for core in self.cores:
-                core.next_timestep()
+            self.next_timestep()
+
+    def next_timestep(self):
+        if self.state is not None:
+            self.state.advance_input()
+        for core in self.cores:
+            core.next_timestep()
+        if self.scheduler is not None: # idle routers have nothing to age
+            self.scheduler.next_timestep()
+        elif self.noc is not None:
+            self.noc.next_timestep()
+        else:
             for router in self.routers:
                 router.next_timestep()
 
+    def operate_cycle(self):
+        tic_toc = 0 # use tic_toc for relative timeing
+        while(not self.ready()):
+            self.operate_tick(tic_toc)
+            tic_toc = tic_toc + 1
+
+    def operate_tick(self, tic_toc):
+        # one cycle: the cores every 4th cycle, then one op step of the routers
+        telemetry = self.telemetry
+        if self.util_arr_ref is not None:
+            self.util_arr_ref.append(list())
+        if telemetry is not None:
+            t0 = time.perf_counter()
+        # first iterate through the matrix of cores and operate
+        if tic_toc%4==0:
+            for i, core in enumerate(self.cores):
+                core.operate(cyc_count=self.cyc_counters[i])
+        if telemetry is not None:
+            t1 = time.perf_counter()
+            telemetry.time['core'] += t1 - t0
+        # iterate through the routers and operate
+        if self.noc is not None:
+            self.noc.operate()
+        elif tic_toc%1 == 0:
+            # do this once before such that each message gets a chance to move once only
+            self.noc_next_op_step()
+            for router in self.routers:
+                router.operate()
+            if self.util_arr_ref is not None:
+                for router in self.routers:
+                    self.util_arr_ref[-1].append(router.get_util())
+                #print(router)
+        self.core_cycle_count += 1
+        if telemetry is not None:
+            telemetry.time['noc'] += time.perf_counter() - t1
+            telemetry.tick()
+
+    def quiet_timestep(self):
+        """
+        quiet_timestep - fast-forward of a cycle-mode timestep that starts with an empty NoC and in which no
+        compartment spikes. every core updates all of its compartments in one vectorized pass, as in
+        'functional' mode, and the cycle counters advance by what the cycle loop takes without messages:
+        one compartment per core every 4 cycles, the cores with fewer compartments stalling
+        returns False, with the state untouched, if a message is buffered or a compartment spikes
+        """
+        if self.noc is not None and not self.noc.is_empty():
+            return False
+        for core, router in zip(self.cores, self.routers):
+            if not (core.in_buffer.is_empty() and core.out_buffer.is_empty() and router.is_empty()):
+                return False
+        owners = self.cores if self.state is None else [self.state]
+        saved = [(owner.current.copy(), owner.voltage.copy(), owner.input[owner.input_head].copy()) for owner in owners]
+        overflow_counts = [dict(core.overflow_count) for core in self.cores]
+        if self.state is not None:
+            spiked = len(self.state.process_neurons(self.controller.get_tstep())) > 0
+        else:
+            spiked = any(core.update_compartments(slice(0, core.n_neurons)).any() for core in self.cores)
+        if spiked: # roll back, the cycle loop sends the messages
+            for owner, (current, voltage, input_now) in zip(owners, saved):
+                owner.current[...] = current
+                owner.voltage[...] = voltage
+                owner.input[owner.input_head] = input_now
+            if self.state is not None:
+                self.state.spiked[:] = False
+            for core, overflow_count in zip(self.cores, overflow_counts):
+                core.overflow_count = overflow_count
+            return False
+        n_max = max(core.n_neurons for core in self.cores)
+        for core, cyc_count in zip(self.cores, self.cyc_counters):
+            core.cur_nrn = core.n_neurons
+            cyc_count['run'] += core.n_neurons
+            cyc_count['stall'] += n_max - core.n_neurons
+        cycles = 4*(n_max-1) + 1 if n_max > 0 else 0
+        self.core_cycle_count += cycles
+        if self.telemetry is not None:
+            self.telemetry.idle(cycles)
+        return True
+
+    def operate_functional(self):
+        # every core updates all of its compartments, then the batch of spikes is delivered
+        # messages land at delay >= 1, so delivery order within the timestep does not matter
+        # as long as the messages to each core keep their order
+        deliver_functional(self, self.functional_spikes())
+
+    def functional_spikes(self):
+        # spike messages of a functional timestep of every core
+        msgs = []
+        if self.state is not None:
+            spikes = self.state.process_neurons(self.controller.get_tstep())
+            for i, core in enumerate(self.cores):
+                self.cyc_counters[i]['run'] += core.n_neurons
+                core.cur_nrn = core.n_neurons
+            for i, nrn_ids in self.state.split_by_core(spikes):
+                msgs.extend(self.cores[i].emit_spikes(nrn_ids))
+        else:
+            for i, core in enumerate(self.cores):
+                msgs.extend(core.process_neurons(cyc_count=self.cyc_counters[i]))
+        return msgs
+
     def noc_next_op_step(self):
         for router in self.routers:
             router.next_op_step()
 
-    def run(self):
+    def save_checkpoint(self, filename):
+        """
+        save_checkpoint - snapshot of the simulation state between two timesteps, see checkpoint.save_checkpoint
+        """
+        checkpoint.save_checkpoint(self, filename)
+
+    def load_checkpoint(self, filename, mmap=True):
+        """
+        load_checkpoint - continue from a save_checkpoint snapshot, the chip must be programmed with the
+        same network
+        """
+        checkpoint.load_checkpoint(self, filename, mmap=mmap)
+
+    def run(self, checkpoint_file=None, checkpoint_every=100):
+        """
+        checkpoint_file: rewrite this checkpoint every checkpoint_every timesteps (serial runs only), a run
+                         that dies can continue from it with load_checkpoint
+        """
+        assert checkpoint_file is None or (self.workers == 1 and checkpoint_every >= 1)
+        if self.workers > 1:
+            ParallelRunner(self, self.workers).run()
         while(self.controller.conditional_run()):
             print("tstep: {}".format(self.controller.get_tstep()))
             self.operate()
+            if checkpoint_file is not None and self.controller.get_tstep() % checkpoint_every == 0:
+                # the previous checkpoint stays intact until the new one is complete
+                self.save_checkpoint(checkpoint_file + '.tmp')
+                os.replace(checkpoint_file + '.tmp', checkpoint_file)
+        for probe in self.probes:
+            probe.flush()
+        if self.tracer is not None:
+            self.tracer.flush()
         print("Cycle Count: {}".format(self.core_cycle_count))
 
+    def get_overflow_counts(self):
+        return [core.overflow_count for core in self.cores]
+
     def get_last_nrn_vs(self):
         last_nrn_vs = []
         for core in self.cores:
@@ -135,7 +403,9 @@ class Chip:
         for core in self.cores:
             if is_ready:
                 is_ready = core.ready()
-        if is_ready:
+        if is_ready and self.noc is not None:
+            is_ready = self.noc.ready()
+        elif is_ready:
             for router in self.routers:
                 if is_ready:
                     is_ready = router.ready()
@@ -1,13 +1,21 @@
 from chip_utils import Chip 
+from chip_programmer import write_csv_network
+from netgen import random_sparse
 import numpy as np
+import os
+import tempfile
 from matplotlib import pyplot as plt
 import matplotlib.animation as animation
 from matplotlib.colors import hsv_to_rgb
 
 util_arr = []
 dim = (4, 4)
+netfile = 'out4x4.csv'
+if not os.path.exists(netfile): # synthetic stand-in for the inference network
+    netfile = os.path.join(tempfile.mkdtemp(), 'out4x4.csv')
+    write_csv_network(netfile, *random_sparse(x_dim=dim[0], y_dim=dim[1], npc=16, rate=0.1, tmax=160))
 chip = Chip(x_dim=dim[0], y_dim=dim[1], util_arr=util_arr)
-chip.program_cores('out4x4.csv')
+chip.program_cores(netfile)
 chip.run()
 last_nrn_vs = chip.get_last_nrn_vs()
 tmax = chip.controller.tmax
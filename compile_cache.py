@@ -0,0 +1,219 @@
+"""
+On-disk cache of the prepared cores of a Chip (or Board), so that a run with an unchanged network file and mesh
+skips ChipProgrammer.program and Core.prepare_computation.
+
+An entry is an uncompressed .npz in the cache directory, named by cache_key: a hash of the contents of the
+network file, the coordinates, arithmetic (with weight_exp) and multicast setting of the cores and the simulator
+version (CACHE_VERSION and the source of the modules that build the core tables). A changed network file, mesh or
+simulator gives another key, so stale entries are never read; they age out of the cache. Entries are loaded
+memory-mapped (see checkpoint.load_arrays), copy on write, so a run may still change e.g. the biases of its
+cores. The mtime of an entry is its last use, and the least recently used entries are evicted once the
+directory holds more than max_bytes.
+
+    chip.program_cores('net.npz', cache_dir='~/.cache/noc')
+"""
+import hashlib
+import os
+import tempfile
+from collections.abc import Mapping
+import numpy as np
+import chip_programmer
+import core_utils
+import discretize
+import noc_utils
+from checkpoint import load_arrays
+
+CACHE_VERSION = 1
+CACHE_MAX_BYTES = 1 << 30
+# modules whose code determines the prepared tables, a change to any of them invalidates the cache
+SOURCE_MODULES = (core_utils, chip_programmer, discretize, noc_utils)
+PARAM_ARRAYS = ['decay_u', 'decay_v', 'vth', 'vmin', 'vmax', 'bias', 'bias_delay']
+# one row per prepared message, lists are stored in the ragged msg_dsts and msg_axons arrays
+MSG_DTYPE = np.dtype([('core', np.int32), ('nrn', np.int32), ('dst', np.int64), ('n_dsts', np.int32),
+    ('n_axons', np.int32), ('delay', np.int32)])
+
+def simulator_version():
+    # hash of CACHE_VERSION and the source of SOURCE_MODULES
+    digest = hashlib.sha256(str(CACHE_VERSION).encode())
+    for module in SOURCE_MODULES:
+        with open(module.__file__, 'rb') as fhandle:
+            digest.update(fhandle.read())
+    return digest.hexdigest()
+
+def cache_key(filename, cores):
+    """
+    cache_key - name of the cache entry of a network file programmed into cores, see the module docstring
+    """
+    digest = hashlib.sha256(simulator_version().encode())
+    with open(filename, 'rb') as fhandle:
+        for block in iter(lambda: fhandle.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(repr([(core.core_id, core.arith, core.weight_exp, core.multicast) for core in cores]).encode())
+    return digest.hexdigest()
+
+class CompiledMessages(Mapping):
+    """
+    Read-only axon_out_msgs of a core loaded by load_compiled
+
+    The message list of a neuron is built from the message table of the cache entry when it is first looked
+    up, so loading does not pay for the neurons that never spike. Iterates the neurons in the saved order.
+    """
+
+    def __init__(self, nrns, ptr, table):
+        """
+        nrns: neurons with messages, ptr: their rows [ptr[g], ptr[g+1]) of the message table
+        table: (dst, n_dsts, delay, dst_ptr, axon_ptr, msg_dsts, msg_axons) message columns and ragged lists
+        """
+        self.index = dict(zip(nrns.tolist(), range(len(nrns))))
+        self.ptr = ptr.tolist()
+        self.table = table
+        self.built = dict()
+
+    def __getitem__(self, nrn):
+        msgs = self.built.get(nrn)
+        if msgs is None:
+            g = self.index[nrn]
+            dst, n_dsts, delay, dst_ptr, axon_ptr, msg_dsts, msg_axons = self.table
+            msgs = []
+            for m in range(self.ptr[g], self.ptr[g+1]):
+                dsts = msg_dsts[dst_ptr[m]:dst_ptr[m+1]].tolist() if n_dsts[m] > 0 else int(dst[m])
+                msgs.append((dsts, msg_axons[axon_ptr[m]:axon_ptr[m+1]].tolist(), int(delay[m])))
+            self.built[nrn] = msgs
+        return msgs
+
+    def __contains__(self, nrn):
+        return nrn in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+def save_compiled(cores, tmax, filename):
+    """
+    save_compiled - write the prepared tables of cores to an uncompressed .npz: the neuron parameters, the CSR
+    synapse tables and the prepared axon_out messages (axon_out_msgs). the state arrays are not saved,
+    load_compiled starts them at zero as prepare_computation does
+    """
+    rows, dsts, axons = [], [], []
+    for i, core in enumerate(cores):
+        for nrn, msgs in core.axon_out_msgs.items():
+            for dst, axon_ids, delay in msgs:
+                multi = type(dst) is list
+                if multi:
+                    dsts.extend(dst)
+                axons.extend(axon_ids)
+                rows.append((i, nrn, -1 if multi else dst, len(dst) if multi else 0, len(axon_ids), delay))
+    arrays = dict(
+        meta=np.array([CACHE_VERSION, tmax, len(cores)], dtype=np.int64),
+        core_ids=np.array([core.core_id for core in cores], dtype=np.int64).reshape(-1, 2),
+        counts=np.array([[core.n_neurons, len(core.axon_ids), core.n_synapse_in, core.n_axon_out, core.msg_slots,
+            core.n_rounded] for core in cores], dtype=np.int64).reshape(-1, 6),
+        axon_ids=np.concatenate([core.axon_ids for core in cores]),
+        syn_ptr=np.concatenate([core.syn_ptr for core in cores]),
+        msgs=np.array(rows, dtype=MSG_DTYPE), msg_dsts=np.array(dsts, dtype=np.int64),
+        msg_axons=np.array(axons, dtype=np.int64))
+    for name in PARAM_ARRAYS + ['syn_nrn', 'syn_weight', 'syn_delay']:
+        arrays[name] = np.concatenate([getattr(core, name) for core in cores])
+    with open(filename, 'wb') as fhandle: # a file object keeps np.savez from appending .npz
+        np.savez(fhandle, **arrays)
+
+def load_compiled(cores, filename):
+    """
+    load_compiled - set up cores that were not programmed from a save_compiled file of cores with the same
+    coordinates and settings, as prepare_computation leaves them. the parameters and synapse tables are views
+    into the copy-on-write mapped file, and axon_out_msgs is a CompiledMessages of the mapped messages.
+    axon_out, which only prepare_computation reads, stays empty
+    returns the tmax of the network
+    """
+    data = load_arrays(filename, mode='c')
+    version, tmax, n_cores = data['meta'].tolist()
+    assert version == CACHE_VERSION
+    assert data['core_ids'].tolist() == [list(core.core_id) for core in cores], 'compiled for a different mesh'
+    counts = np.asarray(data['counts'])
+    nrn_offsets = np.concatenate(([0], np.cumsum(counts[:, 0])))
+    axon_offsets = np.concatenate(([0], np.cumsum(counts[:, 1])))
+    syn_offsets = np.concatenate(([0], np.cumsum(counts[:, 2])))
+    msgs = data['msgs']
+    # the messages of a neuron are consecutive rows, in the order of the neurons in axon_out_msgs
+    new_group = np.ones(len(msgs), dtype=bool)
+    new_group[1:] = (np.diff(msgs['core']) != 0) | (np.diff(msgs['nrn']) != 0)
+    starts = np.flatnonzero(new_group)
+    group_ptr = np.append(starts, len(msgs))
+    core_groups = np.searchsorted(msgs['core'][starts], np.arange(len(cores)+1))
+    table = (msgs['dst'], msgs['n_dsts'], msgs['delay'], np.concatenate(([0], np.cumsum(msgs['n_dsts']))),
+        np.concatenate(([0], np.cumsum(msgs['n_axons']))), data['msg_dsts'], data['msg_axons'])
+    for i, core in enumerate(cores):
+        assert core.n_neurons == 0 and core.n_synapse_in == 0, 'core is already programmed'
+        core.n_neurons, n_axons, core.n_synapse_in, core.n_axon_out, core.msg_slots, core.n_rounded = counts[i].tolist()
+        nrns = slice(nrn_offsets[i], nrn_offsets[i+1])
+        for name in PARAM_ARRAYS:
+            setattr(core, name, data[name][nrns])
+        core.axon_ids = data['axon_ids'][axon_offsets[i]:axon_offsets[i+1]]
+        core.axon_rows = dict(zip(core.axon_ids.tolist(), range(n_axons)))
+        core.syn_ptr = data['syn_ptr'][axon_offsets[i] + i:axon_offsets[i+1] + i + 1]
+        syns = slice(syn_offsets[i], syn_offsets[i+1])
+        for name in ('syn_nrn', 'syn_weight', 'syn_delay'):
+            setattr(core, name, data[name][syns])
+        core.syn_max_delay = core_utils.row_max_delay(core.syn_ptr, core.syn_delay)
+        groups = slice(core_groups[i], core_groups[i+1])
+        core.axon_out_msgs = CompiledMessages(msgs['nrn'][starts[groups]],
+            group_ptr[core_groups[i]:core_groups[i+1]+1], table)
+        dtype = core.bias.dtype
+        core.cur_nrn = 0
+        core.input = np.zeros((core_utils.MAX_DELAY, core.n_neurons), dtype=dtype)
+        core.current = np.zeros(core.n_neurons, dtype=dtype)
+        core.voltage = np.zeros(core.n_neurons, dtype=dtype)
+        core.spiked = np.zeros(core.n_neurons, dtype=bool)
+    return tmax
+
+def evict(cache_dir, max_bytes, keep=()):
+    """
+    evict - remove the least recently used entries of cache_dir until it holds at most max_bytes
+    keep: file names that are never removed, e.g. the entry just written
+    returns the removed file names
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npz'):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, name, stat.st_size))
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, name, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name not in keep:
+            os.remove(os.path.join(cache_dir, name))
+            removed.append(name)
+            total -= size
+    return removed
+
+def program_cached(system, filename, cache_dir, max_bytes=CACHE_MAX_BYTES):
+    """
+    program_cached - program_cores of a Chip or Board through the compile cache in cache_dir
+    on a hit the prepared cores are loaded from the cache entry, otherwise the network is programmed and prepared
+    as usual and stored as a new entry
+    returns True on a cache hit
+    """
+    cache_dir = os.path.expanduser(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    name = cache_key(filename, system.cores) + '.npz'
+    entry = os.path.join(cache_dir, name)
+    if os.path.exists(entry):
+        system.programmer = None
+        system.controller.set_tmax(load_compiled(system.cores, entry))
+        system.prepare_computation(loaded=True)
+        os.utime(entry) # last use, for evict
+        return True
+    system.programmer = chip_programmer.ChipProgrammer(filename, system)
+    system.programmer.program()
+    system.prepare_computation()
+    # written under a temporary name, so other runs never read a partial entry
+    fhandle, tmp = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+    os.close(fhandle)
+    save_compiled(system.cores, system.controller.tmax, tmp)
+    os.replace(tmp, entry)
+    evict(cache_dir, max_bytes, keep=(name,))
+    return False
@@ -0,0 +1,117 @@
+from board import Board
+from chip_utils import Chip
+from chip_programmer import save_network, write_csv_network
+from netgen import random_sparse
+import compile_cache
+import numpy as np
+import os
+import tempfile
+import time
+
+tmpdir = tempfile.mkdtemp()
+cache_dir = os.path.join(tmpdir, 'cache')
+network = random_sparse(x_dim=3, y_dim=3, npc=12, fan_out=6, rate=0.3, tmax=30, seed=3)
+netfile = os.path.join(tmpdir, 'sparse.npz')
+save_network(netfile, *network)
+csvfile = os.path.join(tmpdir, 'sparse.csv')
+write_csv_network(csvfile, *network)
+
+def entries():
+    if not os.path.isdir(cache_dir):
+        return []
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith('.npz'))
+
+def build(filename=netfile, cache=True, **kwargs):
+    chip = Chip(x_dim=3, y_dim=3, **kwargs)
+    chip.program_cores(filename, cache_dir=cache_dir if cache else None)
+    return chip
+
+def same_tables(a, b):
+    assert a.controller.tmax == b.controller.tmax
+    for core_a, core_b in zip(a.cores, b.cores):
+        assert core_a.n_neurons == core_b.n_neurons and core_a.msg_slots == core_b.msg_slots
+        for name in compile_cache.PARAM_ARRAYS + ['axon_ids', 'syn_ptr', 'syn_nrn', 'syn_weight', 'syn_delay', 'input']:
+            assert getattr(core_a, name).dtype == getattr(core_b, name).dtype
+            assert np.array_equal(getattr(core_a, name), getattr(core_b, name))
+        assert core_a.axon_rows == core_b.axon_rows
+        assert core_a.axon_out_msgs == core_b.axon_out_msgs
+        assert list(core_a.axon_out_msgs) == list(core_b.axon_out_msgs) # same spike order
+
+def same_run(a, b):
+    a.run()
+    b.run()
+    assert a.core_cycle_count == b.core_cycle_count
+    for core_a, core_b in zip(a.cores, b.cores):
+        assert np.array_equal(core_a.voltage, core_b.voltage)
+        assert np.array_equal(core_a.get_last_nrn_v(), core_b.get_last_nrn_v())
+        assert core_a.overflow_count == core_b.overflow_count
+
+# the first run programs and stores an entry, the second loads it memory-mapped and runs the same.
+# the mode, soa and workers do not change the prepared tables, so they share the entry of the first chip
+for kwargs, new in ((dict(), 1), (dict(arith='int', soa=True), 1), (dict(multicast=True), 1),
+                    (dict(mode='functional', soa=True), 0), (dict(workers=3), 0)):
+    n = len(entries())
+    build(**kwargs)
+    assert len(entries()) == n + new
+    hit = build(**kwargs)
+    assert len(entries()) == n + new and hit.programmer is None
+    assert isinstance(hit.cores[0].syn_weight, np.memmap)
+    assert isinstance(hit.cores[0].axon_out_msgs, compile_cache.CompiledMessages)
+    same_tables(hit, build(cache=False, **kwargs))
+    same_run(hit, build(cache=False, **kwargs))
+    # copy on write: changing a loaded parameter does not change the entry
+    hit.cores[0].bias[...] = 1
+    same_tables(build(**kwargs), build(cache=False, **kwargs))
+
+# csv networks are cached the same way, under their own key
+same_run(build(csvfile), build(csvfile, cache=False))
+assert len(entries()) == 4
+
+# a changed network file, another mesh or another simulator version is a different entry
+key = compile_cache.cache_key(netfile, build(cache=False).cores)
+save_network(netfile, *random_sparse(x_dim=3, y_dim=3, npc=12, fan_out=6, rate=0.3, tmax=30, seed=4))
+assert compile_cache.cache_key(netfile, build(cache=False).cores) != key
+same_tables(build(), build(cache=False))
+assert len(entries()) == 5
+assert compile_cache.cache_key(netfile, Chip(x_dim=3, y_dim=3, origin=(3, 0)).cores) != \
+    compile_cache.cache_key(netfile, build(cache=False).cores)
+key = compile_cache.cache_key(netfile, build(cache=False).cores)
+compile_cache.CACHE_VERSION += 1
+assert compile_cache.cache_key(netfile, build(cache=False).cores) != key
+compile_cache.CACHE_VERSION -= 1
+
+# boards cache their global cores
+board = Board(3, 1, x_dim=1, y_dim=3)
+board.program_cores(netfile, cache_dir=cache_dir)
+board = Board(3, 1, x_dim=1, y_dim=3)
+assert compile_cache.program_cached(board, netfile, cache_dir)
+same_tables(board, build(cache=False))
+serial = Board(3, 1, x_dim=1, y_dim=3)
+serial.program_cores(netfile)
+same_run(board, serial)
+
+# least recently used entries go first once the cache is full
+names = entries()
+for i, name in enumerate(names):
+    os.utime(os.path.join(cache_dir, name), (1000 + i, 1000 + i))
+build(csvfile) # a hit, which makes its entry the most recently used
+csv_name = compile_cache.cache_key(csvfile, build(cache=False).cores) + '.npz'
+oldest = [name for name in names if name != csv_name][0]
+total = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in names)
+assert compile_cache.evict(cache_dir, total - 1) == [oldest]
+chip = Chip(x_dim=3, y_dim=3, arith='int')
+chip.program_cores(netfile, cache_dir=cache_dir, cache_bytes=0) # a miss that leaves only its own entry
+assert entries() == [compile_cache.cache_key(netfile, chip.cores) + '.npz']
+
+# loading the entry is faster than programming the network
+network = random_sparse(x_dim=4, y_dim=4, npc=400, fan_out=8, rate=0.05, tmax=10, seed=1)
+save_network(netfile, *network)
+start = time.time()
+chip = Chip(x_dim=4, y_dim=4)
+chip.program_cores(netfile, cache_dir=cache_dir)
+t_program = time.time() - start
+start = time.time()
+chip = Chip(x_dim=4, y_dim=4)
+chip.program_cores(netfile, cache_dir=cache_dir)
+t_load = time.time() - start
+print('program and store {:.3f}s, load {:.3f}s'.format(t_program, t_load))
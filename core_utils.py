@@ -1,6 +1,6 @@
-from noc_utils import Queue, SpikeMsg
+from noc_utils import Queue, SpikeMsg, MSG_POOL, pack_coor
 import numpy as np
-from discretize import overflow_signed, decay_int, U_BITS
+from discretize import overflow_signed, decay_int, quantize_decay, quantize_state, count_rounded, Q_BITS, U_BITS
 
 MAX_DELAY = 64
 MIN_DELAY = 1
@@ -8,9 +8,60 @@ COMPARTMENTS_PER_CORE = 1024
 MAX_AXON_IN = 4096
 MAX_AXON_OUT = 4096
 MAX_FAN_IN_STATE = 16384 # synapses 128KByte/8Byte
+SPIKE_MSG_SLOTS = 11 # free out_buffer slots a compartment needs before it updates, i.e. messages per spike
 
 
-DTYPE = np.float32 # TODO - discretization
+DTYPE = np.float32
+INT_DTYPE = np.int32 # state and parameters in 'int' (Loihi fixed-point) arithmetic
+
+# per-compartment arrays of a Core
+NEURON_ARRAYS = ['current', 'voltage', 'decay_u', 'decay_v', 'vth', 'vmin', 'vmax', 'bias', 'bias_delay', 'spiked']
+
+def row_max_delay(syn_ptr, syn_delay):
+    # largest synapse delay of every axon row of a CSR synapse table, 0 for rows without synapses
+    out = np.zeros(len(syn_ptr)-1, dtype=np.int64)
+    full = np.flatnonzero(np.diff(syn_ptr) > 0)
+    if len(full) > 0:
+        out[full] = np.maximum.reduceat(syn_delay, syn_ptr[full])
+    return out
+
+def update_neurons(current, voltage, input_now, decay_u, decay_v, vth, vmin, vmax, bias, bias_on):
+    """
+    update_neurons - vectorized counterpart of Core.process_neuron for a whole block of compartments
+    current, voltage: state arrays, updated in place
+    input_now: synaptic input for this timestep (row 0 of the delay line)
+    bias_on: boolean mask of compartments whose bias_delay has passed
+    returns a boolean mask of the compartments that spiked
+    """
+    current *= decay_u
+    current += input_now
+    # only add the bias if the delay is passed
+    c_b = np.where(bias_on, current + bias, current)
+    voltage *= decay_v
+    voltage += c_b
+    # same comparison order as Core.clip
+    voltage[...] = np.where(voltage > vmax, vmax, np.where(voltage < vmin, vmin, voltage))
+    spiked = voltage > vth
+    voltage[spiked] = 0.0
+    return spiked
+
+def update_neurons_int(current, voltage, input_now, decay_u, decay_v, vth, vmin, vmax, bias, bias_on):
+    """
+    update_neurons_int - update_neurons in Loihi fixed-point arithmetic (taken from nengo_loihi emulator)
+    all arrays are integer, decay_u/decay_v are decay_int constants
+    input_now is overflowed to Q_BITS and current to U_BITS in place
+    returns boolean masks of the compartments that spiked, and whose input and current overflowed
+    """
+    _, q_overflowed = overflow_signed(input_now, bits=Q_BITS, out=input_now)
+    current[...] = decay_int(current, decay_u, offset=1) + input_now
+    _, u_overflowed = overflow_signed(current, bits=U_BITS, out=current)
+    # only add the bias if the delay is passed
+    c_b = np.where(bias_on, current + bias, current)
+    voltage[...] = decay_int(voltage, decay_v) + c_b
+    voltage[...] = np.where(voltage > vmax, vmax, np.where(voltage < vmin, vmin, voltage))
+    spiked = voltage > vth
+    voltage[spiked] = 0
+    return spiked, q_overflowed, u_overflowed
 
 class SynapseState:
 
@@ -33,20 +84,52 @@ class SynapseState:
 
 class Core:
     """"""
-    def __init__(self, core_id, tstep_ref_func):
+    def __init__(self, core_id, tstep_ref_func, arith='float', multicast=False, weight_exp=0):
+        """
+        arith: 'float' keeps the neuron state in DTYPE, 'int' quantizes the parameters and weights
+               once in prepare_computation and keeps integer state, as on Loihi. thresholds, biases and
+               weights are rounded to integers after scaling by 2**weight_exp, values that do not fit
+               are counted in n_rounded
+        weight_exp: 'int' arithmetic only, like the Loihi weight exponent. the state (current, voltage,
+                    input) and vth, vmin, vmax, bias and the weights are held in units of 2**-weight_exp
+        multicast: send the messages of a spike that carry the same axon ids and delay to other cores
+                   as one multicast message, see multicast_axon_out
+        """
+        assert arith in ('float', 'int')
+        assert weight_exp >= 0 and (weight_exp == 0 or arith == 'int')
         self.core_id = core_id
+        self.arith = arith
+        self.weight_exp = weight_exp
+        self.n_rounded = 0 # parameters and weights changed by the 'int' rounding
+        self.multicast = multicast
+        self.msg_slots = SPIKE_MSG_SLOTS # free out_buffer slots a compartment needs before it updates
+        self.packed_id = pack_coor(core_id[0], core_id[1])
         self.cur_tstep = tstep_ref_func
+        self.msg_pool = MSG_POOL
         self.n_neurons = 0
         self.n_axon_out = 0
         self.n_synapse_in = 0
         self.in_buffer = Queue()
         self.out_buffer = Queue()
         self.noc_ref = None
+        self.state = None # chip-wide ChipState, if the arrays below are views into it
         self.cur_nrn = 0
         # variables
-        self.axon_in = dict() # map of axon_in to list of synapses, each synapse has a delay
+        self.axon_in = dict() # map of axon_in to list of synapses, each synapse has a delay (build time only)
         self.axon_out = dict()
-        self.input = None
+        self.axon_out_msgs = dict() # axon_out with packed destinations, built by prepare_computation
+        self.staged_synapses = [] # (axon_ids, nrn_ids, weights, delays) arrays from add_synapses_in
+        # CSR synapse tables compiled from axon_in by prepare_computation
+        # synapses of axon row r are syn_*[syn_ptr[r]:syn_ptr[r+1]], axon_rows maps axon_id -> r
+        self.axon_ids = np.zeros(0, dtype=np.int64)
+        self.axon_rows = dict()
+        self.syn_ptr = np.zeros(1, dtype=np.int64)
+        self.syn_nrn = np.zeros(0, dtype=np.int32)
+        self.syn_weight = np.zeros(0, dtype=DTYPE)
+        self.syn_delay = np.zeros(0, dtype=np.int32)
+        self.syn_max_delay = np.zeros(0, dtype=np.int64) # largest syn_delay of each axon row
+        self.input = None # delay line, a ring of MAX_DELAY rows
+        self.input_head = 0 # row of input holding the input of the current timestep
         self.current = []
         self.voltage = []
         self.decay_u = []
@@ -56,19 +139,25 @@ class Core:
         self.vmax = []
         self.bias = []
         self.bias_delay = []
+        self.spiked = [] # compartments that spiked in the current timestep, read by probes
         self.last_nrn_v = []
+        self.overflow_count = {'input': 0, 'current': 0} # 'int' arithmetic only
+        self.stats = None # Telemetry, if attached
+        self.stats_ind = None # index of this core in the Telemetry arrays
+        self.tracer = None # Tracer, if attached
 
-        # discretization methods
-        # self._decay_current = lambda x, u: decay_int(x, self.decay_u, offset=1) + u
-        # self._decay_voltage = lambda x, u: decay_int(x, self.decay_v) + u
-        # self._overflow = lambda x, b: overflow_signed(x, bits=b, out=x)
-        self._decay_current = lambda ind: self.current[ind] * self.decay_u[ind] + self.input[0][ind]
+        # scalar float updates, 'int' arithmetic uses update_neurons_int
+        self._decay_current = lambda ind: self.current[ind] * self.decay_u[ind] + self.input[self.input_head][ind]
         self._decay_voltage = lambda ind, c: self.voltage[ind] * self.decay_v[ind] + c
 
-    # taken from nengo_loihi emulator
     def advance_input(self):
-        self.input[:-1] = self.input[1:]
-        self.input[-1] = 0
+        # the consumed row becomes the last delay of the ring, only it is cleared
+        self.input[self.input_head] = 0
+        self.input_head = (self.input_head + 1) % MAX_DELAY
+
+    def delay_line(self):
+        # copy of the input rows in delay order, row d is due in d timesteps
+        return np.roll(self.input, -self.input_head, axis=0)
 
     def next_op_step(self):
         self.in_buffer.next_op_step()
@@ -76,7 +165,9 @@ class Core:
 
     def next_timestep(self):
         assert self.ready()
-        self.advance_input()
+        if self.state is None: # a chip-wide state advances all delay lines at once
+            self.advance_input()
+            self.spiked[:] = False
         self.cur_nrn = 0
         self.in_buffer.dec_delays()
         self.out_buffer.dec_delays()
@@ -106,7 +197,8 @@ class Core:
             axon_ids: list of axon_ids within dst core that this message targets
             delay: optional delay variable. default is 1, the minimum delay
         """
-        assert spike_msg_data[2] <= MAX_DELAY
+        # the delay line holds MAX_DELAY timesteps, the current one included
+        assert spike_msg_data[2] < MAX_DELAY, 'message delay beyond the delay line'
         assert spike_msg_data[2] >= MIN_DELAY
         if not neuron_id in self.axon_out.keys():
             self.axon_out[neuron_id] = []
@@ -125,15 +217,115 @@ class Core:
         self.bias_delay.append(bias_delay)
         return self.n_neurons - 1
 
+    def add_neurons(self, decay_u, decay_v, vth, bias, bias_delay, vmin, vmax):
+        """
+        add_neurons - bulk version of add_neuron, every argument is an array with one entry per neuron
+        returns the core-local ids of the new neurons
+        """
+        n = len(vth)
+        assert self.n_neurons + n <= COMPARTMENTS_PER_CORE
+        for name, values in zip(('decay_u', 'decay_v', 'vth', 'bias', 'bias_delay', 'vmin', 'vmax'),
+                                (decay_u, decay_v, vth, bias, bias_delay, vmin, vmax)):
+            assert len(values) == n
+            getattr(self, name).extend(np.asarray(values).tolist())
+        self.n_neurons += n
+        return np.arange(self.n_neurons - n, self.n_neurons)
+
+    def add_synapses_in(self, ax_in, nrn_ids, weights, delays):
+        """
+        add_synapses_in - bulk version of add_synapse_in, arrays with one entry per synapse
+        synapses are staged as arrays and packed by compile_synapses after the axon_in lists
+        """
+        assert len(ax_in) == len(nrn_ids) == len(weights) == len(delays)
+        self.staged_synapses.append((np.asarray(ax_in, dtype=np.int64), np.asarray(nrn_ids, dtype=np.int32),
+                                     np.asarray(weights, dtype=DTYPE), np.asarray(delays, dtype=np.int32)))
+        self.n_synapse_in += len(ax_in)
+
+    def compile_synapses(self):
+        """
+        compile_synapses - pack the axon_in lists into the CSR synapse tables
+        synapses keep the order in which they were added to their axon, so the scatter-add in
+        deliver accumulates in the same order as walking the lists. compiled synapses are merged
+        with any tables from a previous call, and the SynapseState objects and staged arrays are released
+        """
+        ax = [np.repeat(self.axon_ids, np.diff(self.syn_ptr))]
+        nrn = [self.syn_nrn]
+        wgt = [self.syn_weight]
+        dly = [self.syn_delay]
+        for ax_in, synapse_list in self.axon_in.items():
+            ax.append(np.full(len(synapse_list), ax_in, dtype=np.int64))
+            nrn.append(np.asarray([syn.get_neuron_id() for syn in synapse_list], dtype=np.int32))
+            wgt.append(np.asarray([syn.get_weight() for syn in synapse_list], dtype=DTYPE))
+            dly.append(np.asarray([syn.get_delay() for syn in synapse_list], dtype=np.int32))
+        for staged, arrs in zip(zip(*self.staged_synapses), (ax, nrn, wgt, dly)):
+            arrs.extend(staged)
+        ax = np.concatenate(ax)
+        # axon rows in order of first appearance, synapses grouped by row with a stable sort
+        uniq, first, row = np.unique(ax, return_index=True, return_inverse=True)
+        rank = np.empty(len(uniq), dtype=np.int64)
+        rank[np.argsort(first, kind='stable')] = np.arange(len(uniq))
+        row = rank[row]
+        order = np.argsort(row, kind='stable')
+        self.axon_ids = uniq[np.argsort(first, kind='stable')]
+        self.axon_rows = dict(zip(self.axon_ids.tolist(), range(len(self.axon_ids))))
+        self.syn_ptr = np.zeros(len(self.axon_ids)+1, dtype=np.int64)
+        self.syn_ptr[1:] = np.cumsum(np.bincount(row, minlength=len(self.axon_ids)))
+        self.syn_nrn = np.concatenate(nrn)[order]
+        self.syn_weight = np.concatenate(wgt)[order]
+        self.syn_delay = np.concatenate(dly)[order]
+        self.syn_max_delay = row_max_delay(self.syn_ptr, self.syn_delay)
+        self.axon_in = dict()
+        self.staged_synapses = []
+
+    def coalesce_axon_out(self):
+        """
+        coalesce_axon_out - merge the efferent messages of each neuron that share destination core and delay
+        into one message, with the axon ids concatenated in the order the messages were added. a repeated
+        axon id is delivered once per repeat, as before the merge
+        """
+        for nrn, smsg_list in self.axon_out.items():
+            merged = dict()
+            for core_id, axon_ids, delay in smsg_list:
+                merged.setdefault((tuple(core_id), delay), []).extend(axon_ids)
+            self.axon_out[nrn] = [(core_id, axon_ids, delay) for (core_id, delay), axon_ids in merged.items()]
+        self.n_axon_out = sum(len(smsg_list) for smsg_list in self.axon_out.values())
+
+    def multicast_axon_out(self):
+        """
+        multicast_axon_out - merge the prepared messages of each neuron to other cores that carry the same
+        axon ids and delay into one message with a list of destinations, which the routers fork along
+        the XY tree. messages to the own core keep the local bypass
+        """
+        for nrn, msgs in self.axon_out_msgs.items():
+            merged = []
+            groups = dict() # (axon ids, delay) -> index in merged
+            for dst, axon_ids, delay in msgs:
+                key = (tuple(axon_ids), delay)
+                if dst == self.packed_id:
+                    merged.append((dst, axon_ids, delay))
+                elif key in groups:
+                    merged[groups[key]][0].append(dst)
+                else:
+                    groups[key] = len(merged)
+                    merged.append(([dst], axon_ids, delay))
+            self.axon_out_msgs[nrn] = [(dst[0] if type(dst) is list and len(dst) == 1 else dst, axon_ids, delay)
+                for dst, axon_ids, delay in merged]
+
     def prepare_computation(self):
         assert self.n_neurons <= COMPARTMENTS_PER_CORE
-        assert len(self.axon_in.keys()) <= MAX_AXON_IN
+        self.compile_synapses()
+        self.coalesce_axon_out()
+        assert len(self.axon_ids) <= MAX_AXON_IN
         assert self.n_axon_out <= MAX_AXON_OUT
         assert self.n_synapse_in <= MAX_FAN_IN_STATE
+        self.axon_out_msgs = {nrn: [(pack_coor(smsg_data[0][0], smsg_data[0][1]), smsg_data[1], smsg_data[2]) \
+            for smsg_data in smsg_list] for nrn, smsg_list in self.axon_out.items()}
+        if self.multicast:
+            self.multicast_axon_out()
+        # a neuron with more messages than SPIKE_MSG_SLOTS waits for room for all of them
+        self.msg_slots = max([SPIKE_MSG_SLOTS] + [len(msgs) for msgs in self.axon_out_msgs.values()])
+        assert self.msg_slots <= self.out_buffer.capacity
         self.cur_nrn = 0
-        self.input = np.zeros((MAX_DELAY, self.n_neurons), dtype=DTYPE)
-        self.current = np.zeros(self.n_neurons, dtype=DTYPE)
-        self.voltage = np.zeros(self.n_neurons, dtype=DTYPE)
         self.decay_u = np.asarray(self.decay_u, dtype=DTYPE)
         self.decay_v = np.asarray(self.decay_v, dtype=DTYPE)
         self.vth = np.asarray(self.vth, dtype=DTYPE)
@@ -141,22 +333,91 @@ class Core:
         self.vmax = np.asarray(self.vmax, dtype=DTYPE)
         self.bias = np.asarray(self.bias, dtype=DTYPE)
         self.bias_delay = np.asarray(self.bias_delay, dtype=np.int32)
+        dtype = DTYPE
+        if self.arith == 'int': # quantize once, at program time
+            dtype = INT_DTYPE
+            self.decay_u = quantize_decay(self.decay_u, offset=1)
+            self.decay_v = quantize_decay(self.decay_v)
+            exp = self.weight_exp
+            self.n_rounded = sum(count_rounded(x, exp=exp) for x in
+                (self.vth, self.vmin, self.vmax, self.bias, self.syn_weight))
+            self.vth = quantize_state(self.vth, exp=exp)
+            self.vmin = quantize_state(self.vmin, exp=exp)
+            self.vmax = quantize_state(self.vmax, exp=exp)
+            self.bias = quantize_state(self.bias, exp=exp)
+            self.syn_weight = quantize_state(self.syn_weight, bits=Q_BITS, exp=exp)
+        self.input = np.zeros((MAX_DELAY, self.n_neurons), dtype=dtype)
+        self.current = np.zeros(self.n_neurons, dtype=dtype)
+        self.voltage = np.zeros(self.n_neurons, dtype=dtype)
+        self.spiked = np.zeros(self.n_neurons, dtype=bool)
+
+    def attach_state(self, state, offset):
+        """
+        attach_state - move the compartment arrays into chip-wide storage and keep views of it
+        state: ChipState holding the chip-wide arrays
+        offset: index of this core's first compartment in the chip-wide arrays
+        """
+        nrns = slice(offset, offset + self.n_neurons)
+        assert self.input_head == state.input_head # the cores follow the head of the chip-wide ring
+        state.input[:, nrns] = self.input
+        self.input = state.input[:, nrns]
+        for name in NEURON_ARRAYS:
+            getattr(state, name)[nrns] = getattr(self, name)
+            setattr(self, name, getattr(state, name)[nrns])
+        self.state = state
 
     def process_noc(self):
         # fill in_buffer
         if not self.out_buffer.is_empty() and not self.noc_ref.is_full():
-            self.noc_ref.enqueue(self.out_buffer.dequeue())
+            msg = self.out_buffer.dequeue()
+            if self.tracer is not None:
+                self.tracer.leave_core(self, msg)
+            self.noc_ref.enqueue(msg)
         # out_buffer will be emptied by the Router
 
     def process_msg(self):
         if not self.in_buffer.is_empty():
             msg = self.in_buffer.dequeue()
             # print('Process message! {}'.format(str(msg)))
+            self.deliver(msg)
+            if self.stats is not None:
+                self.stats.deliver(self, msg)
+            if self.tracer is not None:
+                self.tracer.deliver(self, msg)
+            self.msg_pool.release(msg)
+
+    def deliver(self, msg):
+        if len(msg.axon_ids) == 1:
+            row = self.axon_rows[msg.axon_ids[0]]
+            # a total delay of MAX_DELAY or more would wrap around the ring into an earlier timestep
+            assert self.syn_max_delay[row] + msg.get_delay() < MAX_DELAY, 'synapse and message delay beyond the delay line'
+            syns = slice(self.syn_ptr[row], self.syn_ptr[row+1])
+            rows = (self.syn_delay[syns] + (msg.get_delay() + self.input_head)) % MAX_DELAY
+            np.add.at(self.input, (rows, self.syn_nrn[syns]), self.syn_weight[syns]) # TODO - quantization
+        else:
+            self.deliver_batch((msg,))
+
+    def deliver_batch(self, msgs):
+        """
+        deliver_batch - apply the synapses of several messages with a single scatter-add
+        accumulates in message order, then axon order, then synapse order, like repeated deliver calls
+        """
+        starts = []
+        delays = []
+        for msg in msgs:
             for ax_in in msg.axon_ids: # index into synapse state
-                # print(self.axon_in)
-                synapse_list = self.axon_in[ax_in]
-                for syn in synapse_list:
-                    self.input[syn.get_delay() + msg.get_delay()][syn.get_neuron_id()] += syn.get_weight() # TODO - quantization
+                starts.append(self.axon_rows[ax_in])
+                delays.append(msg.get_delay())
+        if len(starts) == 0:
+            return
+        rows = np.asarray(starts)
+        starts = self.syn_ptr[rows]
+        lens = self.syn_ptr[rows+1] - starts
+        # concatenate the synapse ranges without a python loop
+        syns = np.arange(lens.sum()) + np.repeat(starts - (np.cumsum(lens) - lens), lens)
+        assert (self.syn_max_delay[rows] + delays).max() < MAX_DELAY, 'synapse and message delay beyond the delay line'
+        rows = (self.syn_delay[syns] + np.repeat(delays, lens) + self.input_head) % MAX_DELAY
+        np.add.at(self.input, (rows, self.syn_nrn[syns]), self.syn_weight[syns]) # TODO - quantization
 
     @staticmethod
     def clip(_val, _min, _max):
@@ -167,34 +428,86 @@ class Core:
         return _val
 
     def process_neuron(self, cyc_count=None):
-        if self.cur_nrn < self.n_neurons and not self.out_buffer.is_full(amt=11):
+        if self.cur_nrn < self.n_neurons and not self.out_buffer.is_full(amt=self.msg_slots):
             if cyc_count is not None:
                 cyc_count['run'] += 1
-            # add input to current and decay
-            self.current[self.cur_nrn] = self._decay_current(self.cur_nrn)
-            # self._overflow(self.current[self.cur_nrn], U_BITS)
-            c_b = self.current[self.cur_nrn]
-            # only add the bias if the delay is passed
-            if self.cur_tstep() >= self.bias_delay[self.cur_nrn]:
-                c_b += self.bias[self.cur_nrn]
-            # self._overflow(self.current[self.cur_nrn], U_BITS)
-            self.voltage[self.cur_nrn] = self._decay_voltage(self.cur_nrn, c_b)
-            self.voltage[self.cur_nrn] = Core.clip(self.voltage[self.cur_nrn], self.vmin[self.cur_nrn], \
-                self.vmax[self.cur_nrn])
-            if (self.voltage[self.cur_nrn] > self.vth[self.cur_nrn]): # spike
-                self.voltage[self.cur_nrn] = 0.0
+            if self.arith == 'int': # fixed-point goes through the vectorized update, overflow included
+                spike = self.update_compartments(slice(self.cur_nrn, self.cur_nrn+1))[0]
+            else:
+                # add input to current and decay
+                self.current[self.cur_nrn] = self._decay_current(self.cur_nrn)
+                c_b = self.current[self.cur_nrn]
+                # only add the bias if the delay is passed
+                if self.cur_tstep() >= self.bias_delay[self.cur_nrn]:
+                    c_b += self.bias[self.cur_nrn]
+                self.voltage[self.cur_nrn] = self._decay_voltage(self.cur_nrn, c_b)
+                self.voltage[self.cur_nrn] = Core.clip(self.voltage[self.cur_nrn], self.vmin[self.cur_nrn], \
+                    self.vmax[self.cur_nrn])
+                spike = self.voltage[self.cur_nrn] > self.vth[self.cur_nrn]
+                if spike:
+                    self.voltage[self.cur_nrn] = 0.0
+            if spike:
+                self.spiked[self.cur_nrn] = True
                 # create spike message(s)
-                if self.cur_nrn in self.axon_out.keys(): # prevent KeyError
-                    for smsg_data in self.axon_out[self.cur_nrn]:
-                        if smsg_data[0] != self.core_id or self.in_buffer.is_full(): # do not use local bypass if in_buffer is full
-                            self.out_buffer.enqueue(SpikeMsg(smsg_data[0], smsg_data[1], delay=smsg_data[2]))
+                if self.cur_nrn in self.axon_out_msgs: # prevent KeyError
+                    for dst, axon_ids, delay in self.axon_out_msgs[self.cur_nrn]:
+                        msg = self.msg_pool.acquire(dst, axon_ids, delay)
+                        msg.src = self.packed_id
+                        if self.stats is not None:
+                            self.stats.inject(self, msg)
+                        if self.tracer is not None:
+                            self.tracer.inject(self, msg)
+                        if dst != self.packed_id or self.in_buffer.is_full(): # do not use local bypass if in_buffer is full
+                            self.out_buffer.enqueue(msg)
                         else: # local, use local bypass
-                            self.in_buffer.enqueue(SpikeMsg(smsg_data[0], smsg_data[1], delay=smsg_data[2]))
+                            self.in_buffer.enqueue(msg)
             self.cur_nrn += 1 # program counter for next neuron
         else:
             if cyc_count is not None:
                 cyc_count['stall'] += 1
 
+    def process_neurons(self, cyc_count=None):
+        """
+        process_neurons - functional mode: update every compartment of the core in one pass
+        gives the same voltages and spikes as calling process_neuron once per compartment
+        returns the list of SpikeMsgs emitted by the spiking compartments, in compartment order
+        """
+        if cyc_count is not None:
+            cyc_count['run'] += self.n_neurons - self.cur_nrn
+        spiked = self.update_compartments(slice(self.cur_nrn, self.n_neurons))
+        self.spiked[self.cur_nrn:] = spiked
+        spikes = np.flatnonzero(spiked) + self.cur_nrn
+        self.cur_nrn = self.n_neurons
+        return self.emit_spikes(spikes)
+
+    def update_compartments(self, nrns):
+        """
+        update_compartments - vectorized neuron update of the compartments in slice nrns
+        returns a boolean mask of the compartments that spiked
+        """
+        args = (self.current[nrns], self.voltage[nrns], self.input[self.input_head][nrns], self.decay_u[nrns], \
+            self.decay_v[nrns], self.vth[nrns], self.vmin[nrns], self.vmax[nrns], self.bias[nrns], \
+            self.cur_tstep() >= self.bias_delay[nrns])
+        if self.arith == 'int':
+            spiked, q_overflowed, u_overflowed = update_neurons_int(*args)
+            self.overflow_count['input'] += int(np.count_nonzero(q_overflowed))
+            self.overflow_count['current'] += int(np.count_nonzero(u_overflowed))
+            return spiked
+        return update_neurons(*args)
+
+    def emit_spikes(self, nrn_ids):
+        """
+        emit_spikes - create the efferent spike messages of a batch of spiking compartments
+        """
+        msgs = []
+        for nrn in nrn_ids:
+            for dst, axon_ids, delay in self.axon_out_msgs.get(int(nrn), ()):
+                msgs.append(self.msg_pool.acquire(dst, axon_ids, delay))
+        return msgs
+
+    def is_idle(self):
+        return self.cur_nrn == self.n_neurons and self.in_buffer.is_empty() and self.out_buffer.is_empty()
+
     def ready(self):
         return self.cur_nrn == self.n_neurons and self.in_buffer.ready() and self.out_buffer.ready()
 
@@ -38,6 +38,40 @@ for tstep in range(200):
         opstep += 1
     core.next_timestep()
 
+# the ring delay line keeps the rows of a shifted array across wrap-arounds
+import numpy as np
+from core_utils import MAX_DELAY
+ring = Core((0, 0), tstepfunc)
+ring.add_neuron(0.5, 1.0, 1e9)
+ring.add_synapse_in(0, SynapseState(0, 1.0, 0))
+ring.add_synapse_in(1, SynapseState(0, 2.0, 5))
+ring.prepare_computation()
+shifted = np.zeros((MAX_DELAY, 1))
+for tstep in range(2*MAX_DELAY + 7):
+    ring.deliver(SpikeMsg((0, 0), [tstep % 2], tstep % 7))
+    shifted[tstep % 7 + 5*(tstep % 2), 0] += 1.0 + tstep % 2
+    assert np.array_equal(ring.delay_line(), shifted)
+    ring.advance_input()
+    shifted[:-1] = shifted[1:]
+    shifted[-1] = 0
+
+# a synapse and message delay of MAX_DELAY or more would wrap into an earlier row of the ring
+ring.add_synapse_in(2, SynapseState(0, 1.0, MAX_DELAY - 4))
+ring.prepare_computation()
+ring.deliver(SpikeMsg((0, 0), [2], 3))
+assert ring.delay_line()[MAX_DELAY - 1, 0] == 1.0
+for msgs in ([SpikeMsg((0, 0), [2], 4)], [SpikeMsg((0, 0), [0], 1), SpikeMsg((0, 0), [2, 1], 4)]):
+    try:
+        ring.deliver(msgs[0]) if len(msgs) == 1 else ring.deliver_batch(msgs)
+        assert False
+    except AssertionError as err:
+        assert 'delay line' in str(err)
+try:
+    ring.add_axon_out(0, ((0, 0), [0], MAX_DELAY))
+    assert False
+except AssertionError as err:
+    assert 'message delay' in str(err)
+
 # to do
 # measure output of SNN, plot
 # create slides
\ No newline at end of file
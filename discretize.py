@@ -30,6 +30,10 @@ def overflow_signed(x, bits=7, out=None):
         Boolean array indicating which values of ``x`` actually overflowed.
     """
 
+    if out is None:
+        out = np.array(x)
+    elif out is not x:
+        out[...] = x
     assert np.issubdtype(out.dtype, np.integer)
     x1 = np.array(1, dtype=out.dtype)
     smask = np.left_shift(x1, bits)  # mask for the sign bit (2**bits)
@@ -41,10 +45,9 @@ def overflow_signed(x, bits=7, out=None):
     zmask = out & smask  # if `out` has negative sign bit, == 2**bits
     out &= xmask  # mask out all bits > `bits`
     out -= zmask  # subtract 2**bits if negative sign bit
-    if (overflowed):
-        print("Overflowed!")
+    return out, overflowed
 
-# modified to only operate on scalar values
+# operates elementwise on arrays as well as on scalar values
 def decay_int(x, decay, bits=12, offset=0):
     """Decay integer values using a decay constant.
 
@@ -54,3 +57,26 @@ def decay_int(x, decay, bits=12, offset=0):
     """
     r = (2 ** bits - offset - np.int64(decay))
     return np.sign(x) * np.right_shift(np.abs(x) * r, bits)
+
+def quantize_decay(factor, bits=12, offset=0):
+    """Integer decay constant for ``decay_int`` that keeps about ``factor`` of a value per timestep.
+
+    The inverse of ``decay_int``: ``2**bits - offset - decay == round(factor * 2**bits)``,
+    saturated to the range of valid decay constants.
+    """
+    decay = 2 ** bits - offset - np.round(np.asarray(factor, dtype=np.float64) * 2 ** bits)
+    return np.clip(decay, 0, 2 ** bits - offset).astype(np.int32)
+
+def quantize_state(x, bits=U_BITS, exp=0):
+    """Round values scaled by ``2**exp`` to integers, saturating at the signed range of ``bits`` (inf included).
+
+    ``exp`` plays the part of the Loihi weight exponent: with the thresholds, biases and weights all scaled
+    by the same power of two, fractional values keep ``exp`` bits of precision.
+    """
+    lim = 2 ** bits - 1
+    return np.clip(np.round(np.asarray(x, dtype=np.float64) * 2.0 ** exp), -lim, lim).astype(np.int32)
+
+def count_rounded(x, exp=0):
+    """Number of finite values that ``quantize_state`` with ``exp`` does not represent exactly."""
+    x = np.asarray(x, dtype=np.float64) * 2.0 ** exp
+    return int(np.count_nonzero(np.isfinite(x) & (np.round(x) != x)))
@@ -0,0 +1,22 @@
+from discretize import overflow_signed, decay_int, quantize_decay, quantize_state, count_rounded, U_BITS
+import numpy as np
+
+# overflow wraps like a 23 bit + sign register and reports which values overflowed
+x = np.array([2**23 - 1, 2**23, -2**23, -2**23 - 1], dtype=np.int32)
+y, overflowed = overflow_signed(x, bits=U_BITS, out=x)
+print(y, overflowed)
+assert list(y) == [2**23 - 1, -2**23, -2**23, 2**23 - 1]
+assert list(overflowed) == [False, True, False, True]
+
+# decay_int works on whole arrays, and agrees with the scalar call
+x = np.array([1000, -1000, 7], dtype=np.int32)
+decay = quantize_decay([0.5, 0.75, 1.0], offset=1)
+print(decay, decay_int(x, decay, offset=1))
+assert list(decay_int(x, decay, offset=1)) == [decay_int(x[i], decay[i], offset=1) for i in range(3)]
+assert list(decay_int(x, quantize_decay([0.5, 0.75, 1.0]))) == [500, -750, 7]
+
+# state saturates at the register range, inf included
+assert list(quantize_state([np.inf, -np.inf, 2.4])) == [2**23 - 1, -(2**23 - 1), 2]
+# weight_exp scales before rounding, count_rounded tells the finite values that still lose bits
+assert list(quantize_state([0.4, -1.25, 3.0], exp=2)) == [2, -5, 12]
+assert count_rounded([0.4, -1.25, 3.0, np.inf]) == 2 and count_rounded([0.4, -1.25, 3.0], exp=2) == 1
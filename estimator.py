@@ -0,0 +1,200 @@
+"""
+Analytical estimate of the cycle counts of a cycle-mode Chip from its spike traffic, without running the cycle loop.
+
+A core updates one compartment, moves one message from its out buffer into its router and consumes one
+message from its in buffer every 4 cycles, and a router output port forwards one message per cycle. A
+timestep therefore takes at least as long as its slowest resource:
+
+    compute: 4*(n_max-1)+1 cycles for the cores with the most compartments (see Chip.quiet_timestep)
+    inject, eject: 4 cycles per message of the core that sends (receives) the most messages
+    link: the messages through the busiest router output port under XY routing (see Router.route_xy)
+
+plus the hop distance of the longest route to drain it. NocEstimator predicts the cycles of a timestep
+as a linear function of these features, see FEATURES. The default coefficients take the bound plus the
+drain. calibrate() fits them by least squares to the per-timestep cycle counts of cycle-accurate runs
+(see measure) and reports the error. The traffic comes from the prepared axon_out messages of the chip and
+the spikes of a run, or from assumed firing rates.
+
+    estimator = NocEstimator()
+    estimator.calibrate([measure(chip) + (chip,) for chip in training_chips])
+    estimator.predict(other_chip, rates=0.05)['total']
+"""
+import numpy as np
+from noc_utils import unpack_coor
+from placement import xy_port_load
+from telemetry import PORTS
+
+# per-timestep features of the linear model, see NocEstimator.features
+FEATURES = ('const', 'compute', 'inject', 'eject', 'link', 'hops', 'backlog', 'bound')
+DEFAULT_COEF = {'bound': 1.0, 'hops': 1.0}
+
+def fan_out(chip):
+    """
+    fan_out - (compartment, destination core) of every spike message of the prepared cores, compartments
+    numbered core by core in get_ind order as in a Probe of all cores. a multicast message counts once per
+    destination, as if it were sent as unicast messages
+    """
+    comps, dsts = [], []
+    offset = 0
+    for core in chip.cores:
+        for nrn, msgs in core.axon_out_msgs.items():
+            for dst, _, _ in msgs:
+                for packed in (dst if type(dst) is list else (dst,)):
+                    comps.append(offset + nrn)
+                    dsts.append(chip.get_ind(*unpack_coor(packed)))
+        offset += core.n_neurons
+    return np.array(comps, dtype=np.int64), np.array(dsts, dtype=np.int64)
+
+def traffic_entries(chip, spikes=None, rates=None):
+    """
+    traffic_entries - spike messages between the cores of a prepared Chip, as the nonzero entries of the
+    [timestep, src core, dst core] traffic
+    spikes: (times, compartments) of the spikes of a run (see fan_out for the numbering), timesteps up to
+            the tmax of the chip
+    rates: instead of spikes, the expected spikes per timestep of every compartment (or one rate for all),
+           gives a single timestep of expected messages
+    returns (n_tsteps, t, src, dst, count), the entries ordered by timestep, src and dst
+    """
+    assert (spikes is None) != (rates is None)
+    n_cores = len(chip.cores)
+    n_neurons = np.array([core.n_neurons for core in chip.cores], dtype=np.int64)
+    core_of = np.repeat(np.arange(n_cores), n_neurons)
+    comps, dsts = fan_out(chip)
+    if rates is not None:
+        rates = np.broadcast_to(np.asarray(rates, dtype=np.float64), (int(n_neurons.sum()),))
+        counts = np.bincount(core_of[comps] * n_cores + dsts, weights=rates[comps], minlength=n_cores * n_cores)
+        pairs = np.flatnonzero(counts)
+        return 1, np.zeros(len(pairs), dtype=np.int64), pairs // n_cores, pairs % n_cores, counts[pairs]
+    times, nrns = [np.asarray(col, dtype=np.int64) for col in spikes]
+    order = np.argsort(comps, kind='stable')
+    dsts = dsts[order]
+    ptr = np.zeros(len(core_of) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum(np.bincount(comps, minlength=len(core_of)))
+    starts = ptr[nrns]
+    lens = ptr[nrns+1] - starts
+    msgs = np.arange(lens.sum()) + np.repeat(starts - (np.cumsum(lens) - lens), lens)
+    keys = (np.repeat(times, lens) * n_cores + np.repeat(core_of[nrns], lens)) * n_cores + dsts[msgs]
+    keys, counts = np.unique(keys, return_counts=True)
+    pairs = keys % (n_cores * n_cores)
+    return chip.controller.tmax, keys // (n_cores * n_cores), pairs // n_cores, pairs % n_cores, counts.astype(np.float64)
+
+def traffic_matrix(chip, spikes=None, rates=None):
+    """
+    traffic_matrix - the traffic_entries as a dense [timestep, src core, dst core] array, for inspection
+    """
+    n_tsteps, t, src, dst, count = traffic_entries(chip, spikes=spikes, rates=rates)
+    traffic = np.zeros((n_tsteps, len(chip.cores), len(chip.cores)))
+    traffic[t, src, dst] = count
+    return traffic
+
+def measure(chip):
+    """
+    measure - run a prepared cycle-mode Chip to its tmax one timestep at a time
+    returns the spikes (times, compartments) and the cycles of every timestep, see NocEstimator.calibrate
+    """
+    assert chip.mode == 'cycle' and chip.workers == 1
+    probe = chip.add_probe('spikes')
+    cycles = []
+    while chip.controller.conditional_run():
+        start = chip.core_cycle_count
+        chip.operate()
+        cycles.append(chip.core_cycle_count - start)
+    chip.probes.remove(probe)
+    return probe.get_data(), np.array(cycles, dtype=np.int64)
+
+class NocEstimator:
+    """
+    Linear model of the cycles of a timestep over the traffic features of FEATURES
+
+    coef: feature name -> coefficient, missing features count 0 (default DEFAULT_COEF)
+    after calibrate, error holds the fit statistics
+    """
+
+    def __init__(self, coef=None):
+        coef = DEFAULT_COEF if coef is None else coef
+        assert all(name in FEATURES for name in coef)
+        self.coef = np.array([coef.get(name, 0.0) for name in FEATURES])
+        self.error = None
+
+    def features(self, chip, traffic):
+        """
+        features - [timestep, feature] matrix of the traffic entries (see traffic_entries), and the
+        [timestep, router, port] loads
+        compute: cycles for the compartments of the largest core, inject/eject: 4 cycles per message of the
+        busiest core, link: messages through the busiest router link port, hops: longest route of the
+        timestep, backlog: link messages beyond one router buffer, bound: largest of compute, inject,
+        eject and link
+        """
+        n_tsteps, t, src, dst, count = traffic
+        n_cores = len(chip.cores)
+        n_max = max(core.n_neurons for core in chip.cores)
+        capacity = chip.routers[0].buffers['local'].capacity
+        hops = np.abs(src // chip.y_dim - dst // chip.y_dim) + np.abs(src % chip.y_dim - dst % chip.y_dim)
+        remote = src != dst
+        x = np.zeros((n_tsteps, len(FEATURES)))
+        x[:, FEATURES.index('const')] = 1.0
+        x[:, FEATURES.index('compute')] = 4*(n_max-1) + 1 if n_max > 0 else 0
+        sent = np.bincount(t[remote] * n_cores + src[remote], weights=count[remote], minlength=n_tsteps * n_cores)
+        x[:, FEATURES.index('inject')] = 4 * sent.reshape(n_tsteps, n_cores).max(axis=1)
+        received = np.bincount(t * n_cores + dst, weights=count, minlength=n_tsteps * n_cores)
+        x[:, FEATURES.index('eject')] = 4 * received.reshape(n_tsteps, n_cores).max(axis=1)
+        firsts = np.flatnonzero(np.diff(t, prepend=-1)) # the entries are ordered by timestep
+        if len(firsts) > 0:
+            x[t[firsts], FEATURES.index('hops')] = np.maximum.reduceat(hops, firsts)
+        ports = xy_port_load(src, dst, count, chip.x_dim, chip.y_dim, t=t, n_t=n_tsteps)
+        x[:, FEATURES.index('link')] = ports[:, :, :PORTS.index('local')].max(axis=(1, 2))
+        x[:, FEATURES.index('backlog')] = np.maximum(x[:, FEATURES.index('link')] - capacity, 0)
+        x[:, FEATURES.index('bound')] = x[:, [FEATURES.index(name) for name in ('compute', 'inject', 'eject', 'link')]].max(axis=1)
+        return x, ports
+
+    def predict(self, chip, spikes=None, rates=None):
+        """
+        predict - estimated cycles of a prepared Chip for the spikes of a run or for firing rates (see traffic_entries)
+        returns a dict with
+            cycles: cycles of every timestep (of the expected timestep for rates)
+            total: cycles of the whole run, rates assume tmax expected timesteps
+            stall: stall cycles of every core, as in Chip.cyc_counters
+            ports: [router, port] messages in the layout of Telemetry.flits, summed over the run
+        """
+        x, ports = self.features(chip, traffic_entries(chip, spikes=spikes, rates=rates))
+        cycles = np.maximum(x @ self.coef, 0)
+        n_tsteps = chip.controller.tmax if rates is not None else len(cycles)
+        scale = n_tsteps / max(len(cycles), 1)
+        visits = np.ceil(cycles / 4).sum() * scale # a core is visited every 4 cycles
+        stall = [float(visits - core.n_neurons * n_tsteps) for core in chip.cores]
+        return dict(cycles=cycles, total=float(cycles.sum() * scale), stall=stall, ports=ports.sum(axis=0) * scale)
+
+    def calibrate(self, runs):
+        """
+        calibrate - fit the coefficients by least squares to cycle-accurate runs
+        runs: (spikes, cycles, chip) per run, spikes and cycles as returned by measure, chip the prepared
+              chip of the run (its state does not matter)
+        returns and keeps in self.error the errors of the fit, relative to the measured cycles:
+        tstep_error (mean over timesteps with cycles), run_error (mean over runs of the total) and
+        max_run_error, each also for the coefficients before the fit (prefixed 'prior_')
+        """
+        xs, ys, lens = [], [], []
+        for spikes, cycles, chip in runs:
+            x, _ = self.features(chip, traffic_entries(chip, spikes=spikes))
+            assert len(x) == len(cycles)
+            xs.append(x)
+            ys.append(np.asarray(cycles, dtype=np.float64))
+            lens.append(len(cycles))
+        x = np.concatenate(xs)
+        y = np.concatenate(ys)
+        prior = self.fit_error(x, y, lens, self.coef)
+        self.coef = np.linalg.lstsq(x, y, rcond=None)[0]
+        self.error = dict(self.fit_error(x, y, lens, self.coef), **{'prior_' + key: value for key, value in prior.items()})
+        return self.error
+
+    @staticmethod
+    def fit_error(x, y, lens, coef):
+        pred = np.maximum(x @ coef, 0)
+        busy = y > 0
+        runs = np.cumsum([0] + lens)
+        run_errors = [abs(pred[a:b].sum() - y[a:b].sum()) / max(y[a:b].sum(), 1) for a, b in zip(runs[:-1], runs[1:])]
+        return dict(tstep_error=float(np.mean(np.abs(pred[busy] - y[busy]) / y[busy])) if busy.any() else 0.0,
+            run_error=float(np.mean(run_errors)), max_run_error=float(np.max(run_errors)))
+
+    def coefficients(self):
+        return dict(zip(FEATURES, self.coef.tolist()))
@@ -0,0 +1,67 @@
+from chip_utils import Chip
+from chip_programmer import save_network
+from estimator import NocEstimator, measure, traffic_entries, traffic_matrix
+from placement import xy_port_load
+from netgen import random_sparse
+import numpy as np
+import os
+import tempfile
+import time
+
+tmpdir = tempfile.mkdtemp()
+
+def build(rate, fan_out, seed, **kwargs):
+    netfile = os.path.join(tmpdir, 'sparse_{}.npz'.format(seed))
+    save_network(netfile, *random_sparse(x_dim=4, y_dim=4, npc=16, fan_out=fan_out, rate=rate, tmax=40, seed=seed))
+    chip = Chip(x_dim=4, y_dim=4, **kwargs)
+    chip.program_cores(netfile)
+    return chip
+
+# the traffic of a run follows the XY routes of the routers: port loads match the telemetry flits
+chip = build(0.2, 6, 0)
+telemetry = chip.enable_telemetry()
+spikes, cycles = measure(chip)
+assert len(cycles) == chip.controller.tmax and cycles.sum() == chip.core_cycle_count
+for core in chip.cores: # drain the messages still in flight without new spikes
+    core.vth[:] = np.inf
+chip.controller.tmax += 10
+chip.run()
+estimate = NocEstimator().predict(chip, spikes=spikes)
+assert np.array_equal(estimate['ports'][:, :-1], telemetry.flits[:, :-1])
+# messages to the own core go through the router only when the in buffer is full
+own = np.diagonal(traffic_matrix(chip, spikes=spikes).sum(axis=0))
+assert np.array_equal(estimate['ports'][:, -1] + own - telemetry.bypass, telemetry.flits[:, -1])
+# expected traffic of firing rates is the mean traffic of the spikes
+n = sum(core.n_neurons for core in chip.cores)
+rates = np.bincount(spikes[1], minlength=n) / 40.0
+assert np.allclose(traffic_matrix(chip, rates=rates)[0], traffic_matrix(chip, spikes=spikes)[:40].mean(axis=0))
+# the traffic is kept as the nonzero entries, routed for all timesteps at once
+n_tsteps, t, src, dst, count = traffic_entries(chip, spikes=spikes)
+keys = (t * len(chip.cores) + src) * len(chip.cores) + dst
+assert n_tsteps == chip.controller.tmax and np.all(np.diff(keys) > 0) and np.all(count > 0)
+assert count.sum() == traffic_matrix(chip, spikes=spikes).sum()
+ports = xy_port_load(src, dst, count, 4, 4, t=t, n_t=n_tsteps)
+for tstep in (0, 17, 39):
+    used = t == tstep
+    assert np.array_equal(ports[tstep], xy_port_load(src[used], dst[used], count[used], 4, 4))
+
+# calibrated on some networks, the estimate of others is close to the cycle-accurate count
+runs = []
+for seed, (rate, fan_out) in enumerate([(0.05, 4), (0.1, 4), (0.2, 8), (0.3, 8), (0.15, 6), (0.4, 4), (0.25, 5)]):
+    chip = build(rate, fan_out, seed + 1)
+    t0 = time.perf_counter()
+    spikes, cycles = measure(chip)
+    run_s = time.perf_counter() - t0
+    runs.append((spikes, cycles, chip))
+estimator = NocEstimator()
+error = estimator.calibrate(runs[::2])
+assert error['run_error'] < error['prior_run_error'] and error['max_run_error'] < 0.05
+for spikes, cycles, chip in runs[1::2]:
+    t0 = time.perf_counter()
+    estimate = estimator.predict(chip, spikes=spikes)
+    predict_s = time.perf_counter() - t0
+    assert abs(estimate['total'] - cycles.sum()) < 0.1 * cycles.sum()
+    stall = np.array([cyc_count['stall'] for cyc_count in chip.cyc_counters])
+    assert np.all(np.abs(np.array(estimate['stall']) - stall) < 0.1 * (stall + 640))
+print('Calibrated error {:.1%}, cycles {} estimated {:.0f} in {:.3f}s (run {:.3f}s)'.format(error['run_error'],
+    cycles.sum(), estimate['total'], predict_s, run_s))
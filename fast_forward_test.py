@@ -0,0 +1,41 @@
+from chip_utils import Chip
+from core_utils import SynapseState
+import numpy as np
+
+# slow bias ramps on a 3x3 mesh, one compartment per core reaches the threshold: quiet stretches between bursts
+def build(fast_forward, scheduler='sync', arith='float', soa=False):
+    chip = Chip(x_dim=3, y_dim=3, scheduler=scheduler, arith=arith, soa=soa, fast_forward=fast_forward)
+    chip.controller.set_tmax(80)
+    for i, core in enumerate(chip.cores):
+        for n in range(2 + i%4): # cores with fewer compartments stall
+            core.add_neuron(0.5, 0.9, 60.0 + 200*n, bias=7.0 + i%2, bias_delay=5*(i%3) + n)
+    for i, core in enumerate(chip.cores):
+        for n in range(2):
+            dst = chip.get_coor((i*4 + n*5 + 1) % len(chip.cores))
+            core.add_axon_out(n, (dst, [10*i + n], 1 + 2*n))
+            chip.cores[chip.get_ind(dst[0], dst[1])].add_synapse_in(10*i + n, SynapseState(n, 5.0 - 20*n, 1 + 3*n))
+    chip.prepare_computation()
+    telemetry = chip.enable_telemetry(sample_every=3)
+    probe = chip.add_probe('spikes')
+    chip.run()
+    return chip, telemetry, probe
+
+for kwargs in (dict(), dict(scheduler='event'), dict(arith='int'), dict(soa=True)):
+    chip, telemetry, probe = build(False, **kwargs)
+    ff_chip, ff_telemetry, ff_probe = build(True, **kwargs)
+    assert 0 < ff_chip.quiet_tsteps < ff_chip.controller.tmax
+    assert ff_chip.core_cycle_count == chip.core_cycle_count
+    assert ff_chip.cyc_counters == chip.cyc_counters
+    for core, ff_core in zip(chip.cores, ff_chip.cores):
+        assert np.array_equal(core.voltage, ff_core.voltage)
+        assert np.array_equal(core.current, ff_core.current)
+        assert np.array_equal(core.input, ff_core.input)
+        assert np.array_equal(core.get_last_nrn_v(), ff_core.get_last_nrn_v())
+        assert core.overflow_count == ff_core.overflow_count
+    for a, b in zip(probe.get_data(), ff_probe.get_data()):
+        assert np.array_equal(a, b)
+    assert len(probe.get_data()[0]) > 0
+    assert np.array_equal(telemetry.occupancy, ff_telemetry.occupancy)
+    assert np.array_equal(telemetry.flits, ff_telemetry.flits)
+print('Cycle Count: {} ({} of {} timesteps fast-forwarded)'.format(ff_chip.core_cycle_count, ff_chip.quiet_tsteps,
+    ff_chip.controller.tmax))
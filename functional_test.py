@@ -0,0 +1,52 @@
+from chip_utils import Chip
+from core_utils import SynapseState
+import numpy as np
+
+# same small network on a cycle-accurate and a functional chip
+def build(mode, soa=False, arith='float', scale=1.0, weight_exp=0):
+    chip = Chip(x_dim=2, y_dim=2, mode=mode, soa=soa, arith=arith, weight_exp=weight_exp)
+    chip.controller.set_tmax(60)
+    for i, core in enumerate(chip.cores):
+        for n in range(4):
+            core.add_neuron(0.5, 0.9, 100.0 * scale, bias=(10.0 + 5*n + i) * scale, bias_delay=n)
+    for i, core in enumerate(chip.cores):
+        dst = chip.get_coor((i + 1) % len(chip.cores))
+        for n in range(4):
+            core.add_axon_out(n, (dst, [10*i + n], 1 + n))
+            chip.cores[chip.get_ind(dst[0], dst[1])].add_synapse_in(10*i + n, SynapseState((n + 1) % 4, (40.0 - 20*n) * scale, n))
+    chip.prepare_computation()
+    probe = chip.add_probe('spikes')
+    chip.run()
+    chip.spikes = probe.get_data()
+    return chip
+
+cyc_chip = build('cycle')
+fun_chip = build('functional')
+soa_chip = build('functional', soa=True)
+for cyc_core, fun_core, soa_core in zip(cyc_chip.cores, fun_chip.cores, soa_chip.cores):
+    for core in (fun_core, soa_core):
+        assert np.array_equal(cyc_core.voltage, core.voltage)
+        assert np.array_equal(cyc_core.current, core.current)
+        assert np.array_equal(cyc_core.get_last_nrn_v(), core.get_last_nrn_v())
+# fixed-point arithmetic agrees between the modes as well
+int_chips = [build('cycle', arith='int'), build('functional', arith='int'), build('functional', soa=True, arith='int')]
+for cores in zip(*[chip.cores for chip in int_chips]):
+    for core in cores[1:]:
+        assert core.voltage.dtype == np.int32
+        assert np.array_equal(cores[0].voltage, core.voltage)
+        assert np.array_equal(cores[0].get_last_nrn_v(), core.get_last_nrn_v())
+        assert cores[0].overflow_count == core.overflow_count
+# fractional parameters are rounded away in 'int' arithmetic and counted, unless weight_exp keeps their
+# fraction bits. the integer state is then in units of 2**-weight_exp
+assert sum(core.n_rounded for core in int_chips[0].cores) == 0
+for chip in int_chips:
+    assert sum(core.n_rounded for core in chip.cores) == 0
+small = build('functional', arith='int', scale=1/64)
+assert sum(core.n_rounded for core in small.cores) > 0 and len(small.spikes[0]) == 0
+scaled = build('functional', arith='int', scale=1/64, weight_exp=6)
+assert sum(core.n_rounded for core in scaled.cores) == 0
+for core, int_core in zip(scaled.cores, int_chips[1].cores):
+    assert np.array_equal(core.voltage, int_core.voltage) and core.vth[0] == int_core.vth[0]
+for a, b in zip(scaled.spikes, int_chips[1].spikes):
+    assert np.array_equal(a, b)
+print('Cycle Count: {} (functional: {})'.format(cyc_chip.core_cycle_count, fun_chip.core_cycle_count))
@@ -0,0 +1,269 @@
+"""
+Whole-mesh NoC engine for Chip(noc='arrays'): the router input buffers of the chip as NumPy arrays, and one op
+step of all routers in a few dozen array operations instead of ~25 Python calls per router.
+
+Buffer b = 5*router + port (ports NORTH, EAST, SOUTH, WEST, LOCAL, the keys of Router) is a ring of capacity
+slots with the fields of its messages: the SpikeMsg, its packed destination, its remaining delay and the output
+port decoded by XY routing. Position k of the buffer, in the queue order of Queue, is slot (head + k) % capacity.
+
+An op step (Router.operate of every router in index order, each arbiter in key order granting one input by
+round robin, see Arbiter) is computed with the routers as the vector dimension and a loop over the output
+ports. It makes the same grants as the Router objects:
+    - messages enqueued in an op step have traveled. they sit behind the messages that were in the buffer at
+      the start of the op step, so the traveled flag is implied by the position and the arbiters only look at
+      the first n positions of a buffer
+    - a router sends north and east into routers that operate after it and have not freed slots yet, and south
+      and west into routers that already operated. a full south or west sink accepts the message if its own
+      router forwarded out of it, so the op step is repeated with the forwarding of the previous pass until
+      none of these sinks changes (a router only waits for lower indices, which ends the repetition)
+    - pQ: on every op step and timestep the delay-1 messages of a buffer move to the front in reverse order, as
+      in Queue, without pQ the buffers are FIFOs and delays are not decremented
+
+The core side (the in and out buffers of the cores) is unchanged, a core injects through a LocalPort.
+"""
+import numpy as np
+from noc_utils import NORTH, EAST, SOUTH, WEST, LOCAL, COOR_BITS, COOR_MASK
+
+N_PORTS = 5
+# input port of the neighbour that receives what an output port sends, and the step to that neighbour
+OPPOSITE = (SOUTH, WEST, NORTH, EAST, LOCAL)
+PORT_STEPS = ((0, 1), (1, 0), (0, -1), (-1, 0), (0, 0))
+
+def route_xy(dst, x, y):
+    # Router.route_xy of packed destinations dst at routers (x, y), vectorized
+    dx, dy = dst >> COOR_BITS, dst & COOR_MASK
+    return np.where(dx != x, np.where(dx > x, EAST, WEST), np.where(dy == y, LOCAL, np.where(dy > y, NORTH, SOUTH)))
+
+class LocalPort:
+    """
+    Local input buffer of a router of a MeshNoc, the noc_ref of its core (see Core.process_noc)
+    """
+
+    def __init__(self, noc, router):
+        self.noc = noc
+        self.buff = N_PORTS*router + LOCAL
+        self.capacity = noc.capacity
+
+    @property
+    def n_msgs(self):
+        return int(self.noc.n[self.buff])
+
+    def is_full(self, amt=1):
+        return self.noc.n[self.buff] + amt - 1 >= self.capacity
+
+    def enqueue(self, msg):
+        self.noc.enqueue(self.buff, msg)
+
+class MeshNoc:
+    """
+    Router buffers of a Chip as ring arrays, stepped for the whole mesh at once
+
+    Takes over the messages and round robin pointers of the Router objects of the chip, which stay empty
+    until store() writes the state back to them (see checkpoint.chip_queues).
+    """
+
+    def __init__(self, chip):
+        routers = chip.routers
+        assert all(router.routing == 'xy' and router.arbiter == 'round_robin' for router in routers)
+        self.chip = chip
+        self.cores = chip.cores
+        self.routers = routers
+        self.n_routers = len(routers)
+        local = routers[0].buffers['local']
+        self.capacity = local.capacity
+        self.pQ = local.pQ
+        self.x = np.array([router.x for router in routers], dtype=np.int64)
+        self.y = np.array([router.y for router in routers], dtype=np.int64)
+        # buffer each output port sends to, -1 for the boundary ports and the local port (the core)
+        x0, y0 = chip.origin
+        self.sink = np.full((self.n_routers, N_PORTS), -1, dtype=np.int64)
+        for p, (dx, dy) in enumerate(PORT_STEPS[:LOCAL]):
+            nx, ny = self.x + dx, self.y + dy
+            inside = (nx >= x0) & (nx < x0 + chip.x_dim) & (ny >= y0) & (ny < y0 + chip.y_dim)
+            self.sink[inside, p] = N_PORTS*chip.get_ind(nx[inside], ny[inside]) + OPPOSITE[p]
+        n_buffs = N_PORTS * self.n_routers
+        self.msg = np.full((n_buffs, self.capacity), None, dtype=object)
+        self.dst = np.zeros((n_buffs, self.capacity), dtype=np.int64)
+        self.delay = np.zeros((n_buffs, self.capacity), dtype=np.int64)
+        self.op = np.zeros((n_buffs, self.capacity), dtype=np.int64)
+        self.head = np.zeros(n_buffs, dtype=np.int64)
+        self.n = np.zeros(n_buffs, dtype=np.int64)
+        self.n1 = np.zeros(n_buffs, dtype=np.int64) # messages with delay 1
+        self.start_ind = np.zeros((self.n_routers, N_PORTS), dtype=np.int64)
+        self.load()
+        for i, core in enumerate(self.cores):
+            core.set_sink_ref(LocalPort(self, i))
+
+    def enqueue(self, b, msg):
+        # append msg to buffer b, decoded for its router
+        assert self.n[b] < self.capacity and type(msg.dst) is int
+        slot = (self.head[b] + self.n[b]) % self.capacity
+        self.msg[b, slot] = msg
+        self.dst[b, slot] = msg.dst
+        self.delay[b, slot] = msg.delay
+        self.op[b, slot] = self.routers[b // N_PORTS].route_xy(msg.dst, msg.src)
+        self.n[b] += 1
+        if msg.delay == 1:
+            self.n1[b] += 1
+
+    def positions(self, rows):
+        # [row, k] slots of positions k of the buffers rows, and which of them hold a message
+        k = np.arange(self.capacity)
+        return (self.head[rows, None] + k) % self.capacity, k < self.n[rows, None]
+
+    def promote(self, rows):
+        # pQ: move the delay-1 messages of the buffers rows to the front in reverse order, see Queue.next_op_step
+        slots, valid = self.positions(rows)
+        k = np.arange(self.capacity)
+        urgent = valid & (self.delay[rows[:, None], slots] == 1)
+        key = np.where(urgent, -1 - k, np.where(valid, k, self.capacity + k))
+        order = np.take_along_axis(slots, np.argsort(key, axis=1), axis=1)
+        for arr in (self.msg, self.dst, self.delay, self.op):
+            arr[rows[:, None], slots] = arr[rows[:, None], order]
+
+    def operate(self):
+        # one op step of every router, see Chip.operate_tick
+        if not self.n.any():
+            return
+        if self.pQ:
+            rows = np.flatnonzero(self.n1)
+            # a single delay-1 message at the head stays where it is
+            rows = rows[(self.n1[rows] > 1) | (self.delay[rows, self.head[rows]] != 1)]
+            if len(rows) > 0:
+                self.promote(rows)
+        active = np.flatnonzero(self.n.reshape(self.n_routers, N_PORTS).any(axis=1))
+        buffs = N_PORTS*active[:, None] + np.arange(N_PORTS)
+        sinks = self.sink[active]
+        full = self.n >= self.capacity
+        blocked = (sinks < 0) | full[sinks]
+        blocked[:, LOCAL] = [self.cores[r].in_buffer.is_full() for r in active.tolist()]
+        # full south and west sinks, which accept a message if their router forwards out of it
+        waiting = blocked & (sinks >= 0)
+        waiting[:, [NORTH, EAST, LOCAL]] = False
+        index = np.full(self.n_routers, -1, dtype=np.int64) # router -> row of active
+        index[active] = np.arange(len(active))
+        sink_rows = N_PORTS*index[sinks[waiting] // N_PORTS] + sinks[waiting] % N_PORTS # in taken.ravel()
+        drained = np.zeros(len(sink_rows), dtype=bool)
+        for _ in range(self.n_routers + 1):
+            blocked[waiting] = ~drained
+            taken, start, grants = self.arbitrate(buffs, blocked)
+            if np.array_equal(taken.ravel()[sink_rows] > 0, drained):
+                break
+            drained = taken.ravel()[sink_rows] > 0
+        else:
+            assert False, 'op step did not settle'
+        self.start_ind[active] = start
+        self.forward(active, buffs, taken, grants)
+
+    def arbitrate(self, buffs, blocked):
+        """
+        arbitrate - grants of the output ports of the routers of buffs ([router, port] input buffers) whose sinks
+        are not blocked. returns the messages taken from each input, the round robin pointers and the
+        (output ports, routers, inputs, positions) of the grants, routers as rows of buffs
+        """
+        ports = np.arange(N_PORTS)
+        heads = self.head[buffs]
+        n_buffs = self.n[buffs]
+        taken = np.zeros(buffs.shape, dtype=np.int64)
+        start = self.start_ind[buffs[:, 0] // N_PORTS]
+        grants = []
+        for p in range(N_PORTS):
+            requests = (taken < n_buffs) & (self.op[buffs, (heads + taken) % self.capacity] == p)
+            rows = np.flatnonzero(requests.any(axis=1) & ~blocked[:, p])
+            if len(rows) == 0:
+                continue
+            # the first requesting input after the last grant of the port, see Arbiter.arbitrate
+            order = np.where(requests[rows], (ports - start[rows, p, None] - 1) % N_PORTS, N_PORTS)
+            inputs = np.argmin(order, axis=1)
+            start[rows, p] = inputs
+            grants.append((np.full(len(rows), p), rows, inputs, taken[rows, inputs]))
+            taken[rows, inputs] += 1
+        if len(grants) == 0:
+            return taken, start, (np.zeros(0, dtype=np.int64),) * 4
+        return taken, start, tuple(np.concatenate(cols) for cols in zip(*grants))
+
+    def forward(self, active, buffs, taken, grants):
+        # move the granted messages out of their buffers, into the sink buffers or the in buffers of the cores
+        ports, rows, inputs, pos = grants
+        b = buffs[rows, inputs]
+        slots = (self.head[b] + pos) % self.capacity
+        msgs, dsts, delays = self.msg[b, slots], self.dst[b, slots], self.delay[b, slots]
+        self.msg[b, slots] = None
+        urgent = delays == 1
+        np.subtract.at(self.n1, b, urgent)
+        self.head[buffs] = (self.head[buffs] + taken) % self.capacity
+        self.n[buffs] -= taken
+        local = ports == LOCAL
+        for r, msg, delay in zip(active[rows[local]].tolist(), msgs[local], delays[local].tolist()):
+            msg.delay = delay
+            self.cores[r].in_buffer.enqueue(msg)
+        out = ~local
+        sinks = self.sink[active[rows[out]], ports[out]]
+        slots = (self.head[sinks] + self.n[sinks]) % self.capacity
+        self.msg[sinks, slots] = msgs[out]
+        self.dst[sinks, slots] = dsts[out]
+        self.delay[sinks, slots] = delays[out]
+        self.op[sinks, slots] = route_xy(dsts[out], self.x[sinks // N_PORTS], self.y[sinks // N_PORTS])
+        self.n[sinks] += 1
+        self.n1[sinks] += urgent[out]
+
+    def ready(self):
+        # Router.ready of every router: no message with delay 1 (pQ), or no message at all
+        return not (self.n1.any() if self.pQ else self.n.any())
+
+    def is_empty(self):
+        return not self.n.any()
+
+    def next_timestep(self):
+        # Router.next_timestep of every router: decrement the delays (pQ), the new delay-1 messages move to the front
+        assert self.ready()
+        if not self.pQ:
+            return
+        rows = np.flatnonzero(self.n)
+        if len(rows) == 0:
+            return
+        slots, valid = self.positions(rows)
+        delay = self.delay[rows[:, None], slots]
+        delay[valid] -= 1
+        self.delay[rows[:, None], slots] = delay
+        self.n1[rows] = np.count_nonzero(valid & (delay == 1), axis=1)
+        urgent = rows[self.n1[rows] > 0]
+        if len(urgent) > 0:
+            self.promote(urgent)
+
+    def load(self):
+        # take over the buffered messages and round robin pointers of the Router objects, which are emptied
+        self.head[:] = 0
+        self.n[:] = 0
+        self.n1[:] = 0
+        self.msg[...] = None
+        for r, router in enumerate(self.routers):
+            for k, buff in enumerate(router.buffers.values()):
+                for msg in buff.messages():
+                    self.enqueue(N_PORTS*r + k, msg)
+                buff.load(buff.epoch, buff.op_step, [], 0)
+            self.start_ind[r] = [arb.start_ind for arb in router.xbar.arbiters.values()]
+
+    def store(self):
+        """
+        store - write the buffers and round robin pointers back to the Router objects between two timesteps, e.g.
+        for a checkpoint. the arrays keep the messages, load() takes the Router state over again
+        """
+        for r, router in enumerate(self.routers):
+            for k, buff in enumerate(router.buffers.values()):
+                b = N_PORTS*r + k
+                slots = (self.head[b] + np.arange(self.n[b])) % self.capacity
+                msgs = list(self.msg[b, slots])
+                for msg, delay, op in zip(msgs, self.delay[b, slots].tolist(), self.op[b, slots].tolist()):
+                    msg.delay = delay
+                    msg.op = op
+                    msg.q_op = buff.op_step - 1 # not traveled
+                    msg.due = delay + buff.epoch
+                # after a timestep the delay-1 messages are the promoted group at the front
+                n_urgent = 0
+                if self.pQ:
+                    while n_urgent < len(msgs) and msgs[n_urgent].delay == 1:
+                        n_urgent += 1
+                buff.load(buff.epoch, buff.op_step, msgs, n_urgent)
+            for arb, start_ind in zip(router.xbar.arbiters.values(), self.start_ind[r].tolist()):
+                arb.start_ind = start_ind
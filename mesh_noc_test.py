@@ -0,0 +1,95 @@
+from board import Board
+from chip_utils import Chip
+from chip_programmer import save_network
+from netgen import random_sparse, hot_spot
+import numpy as np
+import os
+import tempfile
+import time
+
+tmpdir = tempfile.mkdtemp()
+nets = {}
+for name, gen in (('sparse', random_sparse), ('hot_spot', hot_spot)):
+    nets[name] = os.path.join(tmpdir, name + '.npz')
+    save_network(nets[name], *gen(x_dim=4, y_dim=3, npc=12, fan_out=6, rate=0.3, tmax=12, seed=2))
+
+def build(net, noc, **kwargs):
+    chip = Chip(x_dim=4, y_dim=3, noc=noc, **kwargs)
+    chip.program_cores(nets[net])
+    return chip
+
+def same_run(a, b):
+    assert a.controller.get_tstep() == b.controller.get_tstep()
+    assert a.core_cycle_count == b.core_cycle_count
+    assert a.cyc_counters == b.cyc_counters
+    for core_a, core_b in zip(a.cores, b.cores):
+        assert np.array_equal(core_a.voltage, core_b.voltage)
+        assert np.array_equal(core_a.current, core_b.current)
+        assert np.array_equal(core_a.get_last_nrn_v(), core_b.get_last_nrn_v())
+        assert core_a.overflow_count == core_b.overflow_count
+
+def run_to(chip, tstep):
+    while chip.controller.get_tstep() < tstep:
+        chip.operate()
+
+# the array NoC takes the same cycles as the Router objects, also with full buffers (capacity 1 and 2)
+# and without pQ ordering
+for net in nets:
+    for kwargs in (dict(), dict(capacity=1), dict(capacity=2, pQ=False), dict(capacity=3, arith='int', soa=True),
+                   dict(fast_forward=True)):
+        objects = build(net, 'objects', **kwargs)
+        arrays = build(net, 'arrays', **kwargs)
+        objects.run()
+        arrays.run()
+        same_run(objects, arrays)
+
+# stopped with messages in flight (pQ, without it a timestep ends with an empty NoC), the buffers and
+# round robin pointers written back to the routers match
+for kwargs in (dict(capacity=2), dict(capacity=4)):
+    objects = build('hot_spot', 'objects', **kwargs)
+    arrays = build('hot_spot', 'arrays', **kwargs)
+    run_to(objects, 8)
+    run_to(arrays, 8)
+    arrays.noc.store()
+    assert any(not buff.is_empty() for router in objects.routers for buff in router.buffers.values())
+    for router_o, router_a in zip(objects.routers, arrays.routers):
+        for key, buff in router_o.buffers.items():
+            assert [(msg.dst, msg.delay, msg.op) for msg in buff.messages()] == \
+                [(msg.dst, msg.delay, msg.op) for msg in router_a.buffers[key].messages()]
+            assert len(buff.urgent) == len(router_a.buffers[key].urgent)
+        assert [arb.start_ind for arb in router_o.xbar.arbiters.values()] == \
+            [arb.start_ind for arb in router_a.xbar.arbiters.values()]
+    arrays.noc.load()
+    # checkpoints move between the two engines
+    ckpt = os.path.join(tmpdir, 'arrays.ckpt')
+    arrays.save_checkpoint(ckpt)
+    restored = build('hot_spot', 'objects', **kwargs)
+    restored.load_checkpoint(ckpt)
+    objects.save_checkpoint(ckpt)
+    restored_arrays = build('hot_spot', 'arrays', **kwargs)
+    restored_arrays.load_checkpoint(ckpt)
+    for chip in (objects, arrays, restored, restored_arrays):
+        chip.run()
+    for chip in (arrays, restored, restored_arrays):
+        same_run(objects, chip)
+
+# the array NoC has no inter-chip Link sinks, a Board keeps the Router objects
+try:
+    Board(2, 2, x_dim=2, y_dim=2, noc='arrays')
+    assert False
+except AssertionError as err:
+    assert 'noc' in str(err)
+
+# a larger mesh, where the array NoC pays off
+net = os.path.join(tmpdir, 'large.npz')
+save_network(net, *random_sparse(x_dim=12, y_dim=12, npc=8, rate=0.3, tmax=8, seed=3))
+walls = {}
+for noc in ('objects', 'arrays'):
+    chip = Chip(x_dim=12, y_dim=12, noc=noc)
+    chip.program_cores(net)
+    start = time.time()
+    chip.run()
+    walls[noc] = time.time() - start
+    cycles = chip.core_cycle_count
+print('12x12 mesh, {} cycles: {:.2f}s with Router objects, {:.2f}s with arrays'.format(cycles, walls['objects'],
+    walls['arrays']))
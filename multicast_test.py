@@ -0,0 +1,50 @@
+from chip_utils import Chip
+from chip_programmer import save_network
+from netgen import broadcast
+from noc_utils import unpack_coor
+import numpy as np
+import os
+import tempfile
+
+# a broadcast layer sent as one message per core and as multicast messages forked along the XY tree
+netfile = os.path.join(tempfile.mkdtemp(), 'broadcast.npz')
+tmax, neurons, synapses = broadcast(x_dim=4, y_dim=3, npc=8, sources=3, rate=0.2, tmax=30, seed=4)
+synapses['delay_pre'] = 1 # every message is consumed before the run ends
+save_network(netfile, tmax, neurons, synapses)
+
+def build(multicast, capacity=50, workers=1, mode='cycle', trace=False):
+    chip = Chip(x_dim=4, y_dim=3, mode=mode, capacity=capacity, workers=workers, multicast=multicast)
+    chip.program_cores(netfile)
+    if trace:
+        chip.enable_telemetry()
+        chip.enable_tracing()
+    chip.run()
+    return chip
+
+def same_state(a, b):
+    for core_a, core_b in zip(a.cores, b.cores):
+        assert np.array_equal(core_a.voltage, core_b.voltage)
+        assert np.array_equal(core_a.current, core_b.current)
+        assert np.array_equal(core_a.input, core_b.input)
+
+for capacity in (50, 1): # capacity 1 makes forks wait for some of their outputs
+    unicast = build(False, capacity, trace=True)
+    multicast = build(True, capacity, trace=True)
+    same_state(unicast, multicast)
+    # every core still consumes one message per spike, with fewer flits in the mesh
+    assert multicast.telemetry.hop_count.sum() == unicast.telemetry.hop_count.sum()
+    assert multicast.telemetry.flits.sum() < unicast.telemetry.flits.sum()
+    assert multicast.core_cycle_count <= unicast.core_cycle_count
+    # a traced multicast message follows the XY route to the core that consumed it
+    trace = multicast.tracer.get_data()
+    assert len(trace['id']) > 0
+    for src, dst, hops in zip(trace['src'], trace['dst'], trace['hops']):
+        (sx, sy), (dx, dy) = unpack_coor(int(src)), unpack_coor(int(dst))
+        assert hops == 0 or hops == abs(sx - dx) + abs(sy - dy) + 1
+    for workers in (2, 3):
+        chip = build(True, capacity, workers=workers)
+        same_state(chip, multicast)
+        assert chip.core_cycle_count == multicast.core_cycle_count
+        assert chip.cyc_counters == multicast.cyc_counters
+same_state(build(True, mode='functional'), build(False, mode='functional'))
+print('Cycle Count: {} (unicast: {})'.format(multicast.core_cycle_count, unicast.core_cycle_count))
@@ -0,0 +1,136 @@
+"""
+Parametric synthetic networks for benchmarking, as (tmax, neurons, synapses) tables of the binary
+network format (see chip_programmer.save_network). Neurons are numbered core by core in get_ind order.
+
+Neurons are non-leaky integrators driven by their bias, so rate sets the fraction of timesteps in which
+a neuron spikes without synaptic input. bias_delay is drawn per neuron to spread the spikes in time.
+A spike sends one message per destination core and delay_pre of the synapses of its neuron, at most
+SPIKE_MSG_SLOTS; generators with synapses between random cores limit the out-degree to SPIKE_MSG_SLOTS.
+"""
+import numpy as np
+from chip_programmer import NEURON_DTYPE, SYNAPSE_DTYPE
+from core_utils import SPIKE_MSG_SLOTS
+
+VTH = 100.0
+
+def make_neurons(x_dim, y_dim, npc, rate, rng, driven=None):
+    """
+    make_neurons - npc neurons on every core of an x_dim by y_dim mesh
+    driven: optional boolean mask of the neurons that get a bias, default all of them
+    """
+    n = x_dim * y_dim * npc
+    neurons = np.zeros(n, dtype=NEURON_DTYPE)
+    core = np.arange(n) // npc
+    neurons['nrn_id'] = np.arange(n)
+    neurons['x'] = core // y_dim
+    neurons['y'] = core % y_dim
+    neurons['decay_u'] = 0.5
+    neurons['decay_v'] = 1.0
+    neurons['vth'] = VTH
+    period = max(int(round(1.0 / rate)), 1) if rate > 0 else 1
+    if rate > 0:
+        # v grows by bias per timestep, so the neuron spikes every 1/rate timesteps
+        neurons['bias'] = VTH * rate * 1.01
+    if driven is not None:
+        neurons['bias'][~driven] = 0.0
+    neurons['bias_delay'] = rng.randint(0, period, size=n)
+    return neurons
+
+def make_synapses(src, dst, rng, weight=(-20.0, 60.0), max_delay=4):
+    synapses = np.zeros(len(src), dtype=SYNAPSE_DTYPE)
+    synapses['src'] = src
+    synapses['dst'] = dst
+    synapses['weight'] = rng.randint(int(weight[0]), int(weight[1]), size=len(src))
+    synapses['delay_pre'] = rng.randint(1, max_delay + 1, size=len(src))
+    synapses['delay_post'] = rng.randint(0, max_delay, size=len(src))
+    return synapses
+
+def random_sparse(x_dim=4, y_dim=4, npc=16, fan_out=4, rate=0.1, tmax=50, seed=0):
+    """
+    random_sparse - every neuron projects to fan_out neurons drawn uniformly from the whole mesh
+    """
+    assert fan_out <= SPIKE_MSG_SLOTS
+    rng = np.random.RandomState(seed)
+    neurons = make_neurons(x_dim, y_dim, npc, rate, rng)
+    n = len(neurons)
+    src = np.repeat(np.arange(n), fan_out)
+    dst = rng.randint(0, n, size=len(src))
+    return tmax, neurons, make_synapses(src, dst, rng)
+
+def feed_forward(x_dim=4, y_dim=4, npc=16, layers=4, fan_out=8, rate=0.1, tmax=50, seed=0):
+    """
+    feed_forward - the cores are split into layers in get_ind order, each neuron of a layer projects
+    to fan_out random neurons of the next layer. only the first layer is bias driven, the weights of
+    each layer are scaled by its mean fan-in. a single layer has no synapses
+    """
+    assert fan_out <= SPIKE_MSG_SLOTS
+    rng = np.random.RandomState(seed)
+    n_cores = x_dim * y_dim
+    assert 1 <= layers <= n_cores
+    layer_of_core = np.arange(n_cores) * layers // n_cores
+    layer = np.repeat(layer_of_core, npc)
+    neurons = make_neurons(x_dim, y_dim, npc, rate, rng, driven=layer == 0)
+    synapses = [np.zeros(0, dtype=SYNAPSE_DTYPE)]
+    for l in range(1, layers):
+        pre = np.flatnonzero(layer == l - 1)
+        post = np.flatnonzero(layer == l)
+        dst = post[rng.randint(0, len(post), size=len(pre) * fan_out)]
+        fan_in = max(fan_out * len(pre) // len(post), 1)
+        synapses.append(make_synapses(np.repeat(pre, fan_out), dst, rng, weight=(VTH / fan_in, 4 * VTH / fan_in)))
+    return tmax, neurons, np.concatenate(synapses)
+
+def all_to_all(x_dim=4, y_dim=4, npc=16, group=None, rate=0.1, tmax=50, seed=0):
+    """
+    all_to_all - the neurons of each core form groups of group neurons (default all of them) and every
+    neuron projects to every neuron of its group. no traffic between cores
+    """
+    group = npc if group is None else group
+    rng = np.random.RandomState(seed)
+    neurons = make_neurons(x_dim, y_dim, npc, rate, rng)
+    n = len(neurons)
+    # group g of a core holds its neurons [g*group, (g+1)*group), the last group may be smaller
+    core_first = np.arange(n) // npc * npc
+    group_first = core_first + (np.arange(n) - core_first) // group * group
+    group_len = np.minimum(group, core_first + npc - group_first)
+    src = np.repeat(np.arange(n), group_len)
+    dst = np.repeat(group_first, group_len) + np.arange(len(src)) - np.repeat(np.cumsum(group_len) - group_len, group_len)
+    return tmax, neurons, make_synapses(src, dst, rng, weight=(-5.0, 10.0))
+
+def hot_spot(x_dim=4, y_dim=4, npc=16, fan_out=4, hot=(0, 0), frac=0.5, rate=0.1, tmax=50, seed=0):
+    """
+    hot_spot - like random_sparse, but a fraction frac of the synapses target neurons of core hot
+    """
+    assert fan_out <= SPIKE_MSG_SLOTS
+    rng = np.random.RandomState(seed)
+    neurons = make_neurons(x_dim, y_dim, npc, rate, rng)
+    n = len(neurons)
+    src = np.repeat(np.arange(n), fan_out)
+    dst = rng.randint(0, n, size=len(src))
+    hot_first = (hot[1] + hot[0] * y_dim) * npc
+    to_hot = rng.rand(len(src)) < frac
+    dst[to_hot] = hot_first + rng.randint(0, npc, size=int(to_hot.sum()))
+    return tmax, neurons, make_synapses(src, dst, rng)
+
+def broadcast(x_dim=4, y_dim=4, npc=16, sources=2, rate=0.1, tmax=50, seed=0):
+    """
+    broadcast - the first sources neurons of every core project to one random neuron of every core, with
+    one delay per source neuron. a spike is one message per core, or a single multicast message
+    """
+    assert sources <= npc
+    rng = np.random.RandomState(seed)
+    neurons = make_neurons(x_dim, y_dim, npc, rate, rng)
+    n_cores = x_dim * y_dim
+    pre = (np.arange(n_cores)[:, None] * npc + np.arange(sources)).reshape(-1)
+    src = np.repeat(pre, n_cores)
+    dst = np.tile(np.arange(n_cores) * npc, len(pre)) + rng.randint(0, npc, size=len(src))
+    synapses = make_synapses(src, dst, rng, weight=(-VTH / n_cores, 4 * VTH / n_cores))
+    synapses['delay_pre'] = np.repeat(synapses['delay_pre'][::n_cores], n_cores)
+    return tmax, neurons, synapses
+
+GENERATORS = {
+    'random_sparse': random_sparse,
+    'feed_forward': feed_forward,
+    'all_to_all': all_to_all,
+    'hot_spot': hot_spot,
+    'broadcast': broadcast,
+}
@@ -0,0 +1,62 @@
+from chip_utils import Chip
+from chip_programmer import save_network
+from core_utils import SPIKE_MSG_SLOTS
+import bench
+import netgen
+import numpy as np
+import json
+import os
+import tempfile
+
+tmpdir = tempfile.mkdtemp()
+x_dim, y_dim, npc = 3, 2, 8
+
+def run(network, **kwargs):
+    netfile = os.path.join(tmpdir, 'net.npz')
+    save_network(netfile, *network)
+    chip = Chip(x_dim=x_dim, y_dim=y_dim, **kwargs)
+    chip.program_cores(netfile)
+    probe = chip.add_probe('spikes')
+    chip.run()
+    return chip, probe.get_data()
+
+# every generator gives a valid table that programs and runs, the same one for the same seed
+for name, gen in netgen.GENERATORS.items():
+    tmax, neurons, synapses = gen(x_dim=x_dim, y_dim=y_dim, npc=npc, rate=0.2, tmax=10, seed=1)
+    n = x_dim * y_dim * npc
+    assert np.array_equal(neurons['nrn_id'], np.arange(n))
+    core = np.arange(n) // npc
+    assert np.array_equal(neurons['x'], core // y_dim) and np.array_equal(neurons['y'], core % y_dim)
+    assert np.all((0 <= synapses['src']) & (synapses['src'] < n) & (0 <= synapses['dst']) & (synapses['dst'] < n))
+    # one message per destination core and delay_pre of a neuron
+    msgs = np.unique(np.stack([synapses['src'], core[synapses['dst']], synapses['delay_pre']]), axis=1)
+    assert len(msgs[0]) == 0 or np.bincount(msgs[0]).max() <= SPIKE_MSG_SLOTS
+    _, neurons_again, synapses_again = gen(x_dim=x_dim, y_dim=y_dim, npc=npc, rate=0.2, tmax=10, seed=1)
+    assert np.array_equal(neurons, neurons_again) and np.array_equal(synapses, synapses_again)
+    chip, spikes = run((tmax, neurons, synapses))
+    assert chip.controller.get_tstep() == tmax and len(spikes[0]) > 0
+
+# feed_forward: the synapses go from each layer to the next, with weights scaled by the fan-in of that
+# layer (3 layers on 6 cores hold 2 cores each, 4 layers 1 or 2 cores)
+for layers in (1, 2, 3, 4):
+    tmax, neurons, synapses = netgen.feed_forward(x_dim=x_dim, y_dim=y_dim, npc=npc, layers=layers, fan_out=4,
+        rate=0.2, tmax=20, seed=2)
+    layer = np.repeat(np.arange(x_dim * y_dim) * layers // (x_dim * y_dim), npc)
+    assert np.all(neurons['bias'][layer > 0] == 0) and np.all(neurons['bias'][layer == 0] > 0)
+    assert len(synapses) == 4 * np.count_nonzero(layer < layers - 1)
+    assert np.all(layer[synapses['dst']] == layer[synapses['src']] + 1)
+    for l in range(1, layers):
+        fan_in = max(4 * np.count_nonzero(layer == l - 1) // np.count_nonzero(layer == l), 1)
+        weights = synapses['weight'][layer[synapses['dst']] == l]
+        assert np.all((int(netgen.VTH / fan_in) <= weights) & (weights < int(4 * netgen.VTH / fan_in)))
+    _, (times, nrns) = run((tmax, neurons, synapses), mode='functional')
+    assert set(layer[nrns]) == set(range(layers)) # the spikes reach the last layer
+
+# bench sweeps generators and settings into JSON lines
+out = os.path.join(tmpdir, 'bench.jsonl')
+records = bench.sweep(['random_sparse', 'feed_forward'], [(2, 2)], [4, 50], [True], [0.2], dict(npc=4, tmax=10),
+    dict(), out)
+assert len(records) == 4 and all('error' not in record and record['core_cycle_count'] > 0 for record in records)
+with open(out) as fhandle:
+    assert [json.loads(line) for line in fhandle] == records
+print('{} generators, {} bench records'.format(len(netgen.GENERATORS), len(records)))
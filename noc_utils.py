@@ -1,20 +1,87 @@
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from itertools import count
 import numpy as np
 
+# enqueue stamps are unique across all queues, so a message that moved on cannot match a stale entry
+_enqueue_seq = count(1)
+# creation stamps of the messages, older messages have lower stamps (age arbitration)
+_inject_seq = count(1)
+
+# integer-encoded router ports, in the order of the default Router keys
+NORTH, EAST, SOUTH, WEST, LOCAL = range(5)
+NOP = -1
+MULTICAST = -2 # a multicast message that leaves the router through several ports, see SpikeMsg.branches
+OP_CODES = {'north': NORTH, 'east': EAST, 'south': SOUTH, 'west': WEST, 'local': LOCAL, 'nop': NOP, 'multicast': MULTICAST}
+OP_NAMES = {code: name for name, code in OP_CODES.items()}
+
+# core coordinates are packed into one int, x in the high bits
+COOR_BITS = 16
+COOR_MASK = (1 << COOR_BITS) - 1
+
+def advance_enqueue_seq(seq=0):
+    # later enqueue stamps are above seq, returns the next stamp. used when queues move between processes
+    global _enqueue_seq
+    nxt = max(seq + 1, next(_enqueue_seq))
+    _enqueue_seq = count(nxt)
+    return nxt
+
+def advance_inject_seq(seq=0):
+    # later creation stamps are above seq, returns the next stamp. used when messages are restored
+    global _inject_seq
+    nxt = max(seq + 1, next(_inject_seq))
+    _inject_seq = count(nxt)
+    return nxt
+
+def pack_coor(x, y):
+    return (x << COOR_BITS) | y
+
+def unpack_coor(packed):
+    return (packed >> COOR_BITS, packed & COOR_MASK)
+
 class SpikeMsg:
 
+    __slots__ = ('dst', 'axon_ids', 'delay', 'traveled', 'op', 'q_seq', 'q_op', 'due', 'src', 'born', 'trace', 'hop_t',
+                 'branches', 'seq')
+
     def __init__(self, core_id, axon_ids, delay=1):
         """
         Parameters:
-        core_id: destination core for this message
-        axon_ids: list of destination axon_id instances
+        core_id: destination core for this message, (x, y) tuple or packed with pack_coor.
+                 a multicast message has a list of at least two packed destinations
+        axon_ids: list of destination axon_id instances, the same in every destination core
         delay: delay value for the message. may have additional delay added at destination
         """
-        self.core_id = core_id
+        self.reset(core_id, axon_ids, delay)
+
+    def reset(self, dst, axon_ids, delay):
+        # also reached by MsgPool.acquire, so a pooled message normalizes dst the same way as a new one
+        if type(dst) is not int and type(dst) is not list:
+            # packed as a numpy integer from a table, or an (x, y) tuple
+            dst = int(dst) if isinstance(dst, np.integer) else pack_coor(dst[0], dst[1])
+        self.dst = dst
         self.axon_ids = axon_ids
         self.delay = delay
         self.traveled = False
-        self.op = 'nop'
+        self.op = NOP
+        # output port -> destinations of a multicast message that forks at the router buffering it
+        self.branches = None
+        self.seq = next(_inject_seq)
+        # Queue bookkeeping, only meaningful while the message is buffered
+        self.q_seq = -1
+        self.q_op = -1
+        self.due = 0
+        # packed source core, stamped by the source core, and injection cycle, stamped when telemetry or
+        # tracing is on
+        self.src = -1
+        self.born = -1
+        self.trace = -1 # Tracer record id
+        self.hop_t = -1 # cycle the traced message entered its current buffer
+
+    @property
+    def core_id(self):
+        if type(self.dst) is list:
+            return [unpack_coor(dst) for dst in self.dst]
+        return unpack_coor(self.dst)
 
     def decrement_delay(self):
         self.delay -= 1
@@ -27,80 +94,231 @@ class SpikeMsg:
         return self.traveled
 
     def set_op(self, op):
-        assert type(op) is type('I am a string')
+        assert type(op) is int
         self.op = op
 
     def get_delay(self):
         return self.delay
 
     def __repr__(self):
-        return 'SpikeMsg(core_id: {} axon_id: {} delay: {} op: {} tr: {})'.format(self.core_id, self.axon_ids, self.delay, self.op, self.traveled)
+        return 'SpikeMsg(core_id: {} axon_id: {} delay: {} op: {} tr: {})'.format(self.core_id, self.axon_ids, self.delay, OP_NAMES[self.op], self.traveled)
+
+class MsgPool:
+    """
+    Free list of SpikeMsg objects, so that the spike path stops allocating once the pool is warm
+    messages are released by the core that consumes them
+    """
+
+    def __init__(self):
+        self.free = []
+
+    def acquire(self, dst, axon_ids, delay):
+        if len(self.free) > 0:
+            msg = self.free.pop()
+            msg.reset(dst, axon_ids, delay)
+            return msg
+        return SpikeMsg(dst, axon_ids, delay=delay)
+
+    def release(self, msg):
+        self.free.append(msg)
+
+MSG_POOL = MsgPool()
 
 class Queue:
+    """
+    Bounded message buffer with optional priority (pQ) ordering of delay-1 messages
+
+    Delay-1 messages are moved to the front of the queue on every op step and whenever a timestep
+    makes them due, in the same order as a list that moves each of them to the front in turn
+    (so the delay-1 group is reversed on each op step). All other messages stay in arrival order.
+
+    Messages are kept in deques: the delay-1 group (with an orientation flag so that reversing it
+    is O(1)), an arrival-order FIFO, and buckets of the FIFO keyed by the timestep a message
+    becomes due. Remaining delays are due - epoch, where the epoch counts timesteps, so
+    dec_delays does not touch every message. The traveled flag is an op step stamp.
+    """
 
-    def __init__(self, capacity=50, decode = lambda msg: msg.set_op('nop'), pQ=True):
-        self.buffer = []
+    def __init__(self, capacity=50, decode = lambda msg: msg.set_op(NOP), pQ=True):
         self.capacity = capacity
         self.decode = decode
         self.pQ = pQ
+        self.listener = None # called on every enqueue, used to wake the owner of the queue
+        self.n_msgs = 0
+        self.epoch = 0 # number of dec_delays calls
+        self.op_step = 0 # messages enqueued during the current op step have traveled
+        self.urgent = deque() # delay-1 group at the front of the queue
+        self.urgent_rev = False # the delay-1 group is stored back to front
+        self.fifo = deque() # remaining messages in arrival order, promoted entries are skipped lazily
+        self.fifo_seq = deque()
+        self.due = {} # due epoch -> deque of the FIFO messages with that due epoch, in arrival order
 
     def enqueue(self, msg):
         assert not self.is_full() # should not be calling this if buffer at capacity
         # do decode step here
         msg.set_traveled(True)
         self.decode(msg)
-        self.buffer.append(msg) # do pQ stuff on op step
+        msg.q_seq = next(_enqueue_seq) # tells live FIFO entries from promoted ones
+        msg.q_op = self.op_step
+        msg.due = msg.delay + self.epoch
+        self.fifo.append(msg) # do pQ stuff on op step
+        self.fifo_seq.append(msg.q_seq)
+        if self.pQ:
+            if msg.due in self.due:
+                self.due[msg.due].append(msg)
+            else:
+                self.due[msg.due] = deque((msg,))
+        self.n_msgs += 1
+        if self.listener is not None:
+            self.listener()
+
+    def _promote(self, msg):
+        # move a FIFO message to the front of the delay-1 group
+        msg.q_seq = -1
+        if self.urgent_rev:
+            self.urgent.append(msg)
+        else:
+            self.urgent.appendleft(msg)
+
+    def _head(self):
+        if len(self.urgent) > 0:
+            return self.urgent[-1] if self.urgent_rev else self.urgent[0]
+        while self.fifo[0].q_seq != self.fifo_seq[0]: # promoted entry
+            self.fifo.popleft()
+            self.fifo_seq.popleft()
+        return self.fifo[0]
 
     def dequeue(self):
         assert not self.is_empty()
-        return self.buffer.pop(0)
+        if len(self.urgent) > 0:
+            msg = self.urgent.pop() if self.urgent_rev else self.urgent.popleft()
+        else:
+            msg = self._head()
+            self.fifo.popleft()
+            self.fifo_seq.popleft()
+            msg.q_seq = -1
+            if self.pQ:
+                bucket = self.due[msg.due]
+                bucket.popleft()
+                if len(bucket) == 0:
+                    del self.due[msg.due]
+        msg.set_traveled(msg.q_op == self.op_step)
+        if self.pQ:
+            msg.delay = msg.due - self.epoch
+        self.n_msgs -= 1
+        return msg
+
+    def fork(self, op):
+        """
+        fork - dequeue the branch of the multicast message at the head that leaves through port op
+        the message stays at the head until its last branch is taken, the other branches are copies
+        that carry the injection stamps but are not traced
+        """
+        msg = self._head()
+        dsts = msg.branches.pop(op)
+        dst = dsts[0] if len(dsts) == 1 else dsts
+        if len(msg.branches) > 0:
+            branch = MSG_POOL.acquire(dst, msg.axon_ids, msg.due - self.epoch if self.pQ else msg.delay)
+            branch.src = msg.src
+            branch.born = msg.born
+            branch.seq = msg.seq
+            branch.hop_t = msg.hop_t
+            return branch
+        msg = self.dequeue()
+        msg.dst = dst
+        msg.branches = None
+        return msg
 
     def next_op_step(self):
-        for i, msg in enumerate(self.buffer):
-            msg.set_traveled(False)
-            if self.pQ and msg.get_delay() == 1 and i > 0:
-                self.buffer.insert(0, self.buffer.pop(i))
+        self.op_step += 1
+        if self.pQ:
+            # every delay-1 message moves to the front in turn, which reverses the delay-1 group
+            self.urgent_rev = not self.urgent_rev
+            fresh = self.due.pop(self.epoch + 1, ())
+            for msg in fresh:
+                self._promote(msg)
 
     def is_empty(self):
-        return len(self.buffer) == 0
+        return self.n_msgs == 0
 
     def is_full(self, amt=1):
-        return len(self.buffer)+amt-1 >= self.capacity
+        return self.n_msgs+amt-1 >= self.capacity
 
     def dec_delays(self):
-        # iterate through the messages in the buffer and decrement delay
+        # decrement the delay of every message in the buffer
         if self.pQ:
-            tmp = len(self.buffer)
-            for i, msg in enumerate(self.buffer):
-                msg.decrement_delay()
-                msg.set_traveled(False)
-                assert msg.get_delay() > 0
-                if msg.get_delay() == 1:
-                    self.buffer.insert(0, self.buffer.pop(i))
-            assert len(self.buffer) == tmp
-                    
+            assert len(self.urgent) == 0 and not (self.epoch + 1) in self.due # no delay may reach 0
+            self.epoch += 1
+            self.op_step += 1
+            # messages now at delay 1 move to the front in turn, i.e. in reverse arrival order
+            self.urgent_rev = False
+            for msg in self.due.pop(self.epoch + 1, ()):
+                self._promote(msg)
+
+    def messages(self):
+        """
+        messages - list of the buffered messages in queue order, with their remaining delays
+        """
+        urgent = reversed(self.urgent) if self.urgent_rev else self.urgent
+        msgs = list(urgent) + [msg for msg, seq in zip(self.fifo, self.fifo_seq) if msg.q_seq == seq]
+        for msg in msgs:
+            msg.set_traveled(msg.q_op == self.op_step)
+            if self.pQ:
+                msg.delay = msg.due - self.epoch
+        return msgs
+
+    def load(self, epoch, op_step, msgs, n_urgent):
+        """
+        load - replace the contents by msgs, in the queue order of messages(), of which the first n_urgent
+        form the delay-1 group. the messages keep their op, q_op and due (pQ) or delay
+        """
+        assert len(msgs) <= self.capacity and (self.pQ or n_urgent == 0)
+        self.epoch = epoch
+        self.op_step = op_step
+        self.urgent = deque(msgs[:n_urgent])
+        self.urgent_rev = False
+        self.fifo = deque()
+        self.fifo_seq = deque()
+        self.due = {}
+        for msg in msgs[:n_urgent]:
+            msg.q_seq = -1
+        for msg in msgs[n_urgent:]:
+            msg.q_seq = next(_enqueue_seq)
+            self.fifo.append(msg)
+            self.fifo_seq.append(msg.q_seq)
+            if self.pQ:
+                self.due.setdefault(msg.due, deque()).append(msg)
+        self.n_msgs = len(msgs)
+        if self.n_msgs > 0 and self.listener is not None:
+            self.listener()
 
     def __repr__(self):
-        return str(self.buffer)
+        return str(self.messages())
 
     def req(self):
         if self.is_empty():
-            return 'nop', True # since this doesn't match the keys in the arbiter, it won't try to use it
-        return self.buffer[0].op, self.buffer[0].get_traveled()
+            return NOP, True # since this doesn't match the ports of the arbiters, it won't try to use it
+        msg = self._head()
+        return msg.op, msg.q_op == self.op_step
+
+    def head(self):
+        # the message dequeue would return, the queue must not be empty
+        return self._head()
+
+    def head_urgent(self):
+        # the message at the head has delay 1, i.e. must be consumed in this timestep
+        if self.pQ:
+            return len(self.urgent) > 0 or self._head().due - self.epoch == 1
+        return self._head().delay == 1
 
     def ready(self):
-        if self.pQ and not self.is_empty():
-            no_delay_one = True
-            for msg in self.buffer:
-                if no_delay_one and msg.get_delay() == 1:
-                    no_delay_one = False
-                    break
-            return no_delay_one
+        if self.pQ:
+            # no delay-1 messages, neither promoted nor enqueued since the last op step
+            return len(self.urgent) == 0 and not (self.epoch + 1) in self.due
         else:
             return self.is_empty()
 
     def get_util(self):
-        return float(len(self.buffer))/self.capacity
+        return float(self.n_msgs)/self.capacity
 
 
 class Router:
@@ -114,17 +332,30 @@ class Router:
         selection/control logic/arbitration // handled by xbar
     """
 
-    def __init__(self, router_id, keys=['north', 'east', 'south', 'west', 'local']):
+    def __init__(self, router_id, keys=['north', 'east', 'south', 'west', 'local'], capacity=50, pQ=True, routing='xy',
+                 arbiter='round_robin'):
+        """
+        routing: 'xy' dimension-ordered routing, or the adaptive turn models 'west_first' and 'odd_even',
+                 which pick among the allowed minimal ports the one with the most free downstream slots
+        arbiter: output port arbitration, a key of ARBITERS
+        """
+        assert routing in ROUTING and arbiter in ARBITERS
         self.router_id = router_id
+        self.x, self.y = router_id
+        self.packed_id = pack_coor(self.x, self.y)
         #self.in_cap = in_cap
         self.arity = len(keys)
         self.keys = keys
         self.buffers = OrderedDict()
         self.sink_refs = OrderedDict()
         for key in keys:
-            self.buffers[key] = Queue(decode=self.decode)
+            self.buffers[key] = Queue(capacity=capacity, decode=self.decode, pQ=pQ)
             self.sink_refs[key] = None
         self.xbar = None
+        self.routing = routing
+        self.arbiter = arbiter
+        self.route = getattr(self, ROUTING[routing])
+        self.op_sinks = {} # port code -> sink, for the adaptive routes
 
     def set_sink_ref(self, key, ref):
         self.sink_refs[key] = ref
@@ -133,7 +364,8 @@ class Router:
         return self.buffers[key]
 
     def initialize_crossbar(self):
-        self.xbar = Crossbar(self.buffers, self.sink_refs)
+        self.xbar = Crossbar(self.buffers, self.sink_refs, arbiter=ARBITERS[self.arbiter])
+        self.op_sinks = {OP_CODES[key]: sink for key, sink in self.sink_refs.items()}
 
     def operate(self):
         assert type(self.xbar) is Crossbar
@@ -143,19 +375,85 @@ class Router:
         for buffkey in self.buffers.keys():
             self.buffers[buffkey].next_op_step()
 
-    def decode(self, msg):
-        if (msg.core_id == self.router_id):
-                msg.set_op('local')
-        elif (msg.core_id[0] != self.router_id[0]): # DOR is x then y
-            if msg.core_id[0] > self.router_id[0]:
-                msg.set_op('east')
-            else:
-                msg.set_op('west')
+    def route_xy(self, dst, src):
+        # output port towards the packed core coordinates dst
+        if (dst == self.packed_id):
+            return LOCAL
+        elif ((dst >> COOR_BITS) != self.x): # DOR is x then y
+            if (dst >> COOR_BITS) > self.x:
+                return EAST
+            return WEST
         else: # delta_y must be different
-            if msg.core_id[1] > self.router_id[1]:
-                msg.set_op('north')
+            if (dst & COOR_MASK) > self.y:
+                return NORTH
+            return SOUTH
+
+    def least_loaded(self, ops):
+        # the port of ops whose sink has the most free slots, the first of them on ties
+        best = ops[0]
+        best_free = self.op_sinks[best].capacity - self.op_sinks[best].n_msgs
+        for op in ops[1:]:
+            free = self.op_sinks[op].capacity - self.op_sinks[op].n_msgs
+            if free > best_free:
+                best, best_free = op, free
+        return best
+
+    def route_west_first(self, dst, src):
+        # west-first turn model: all west hops first, then any minimal east/north/south port
+        if (dst == self.packed_id):
+            return LOCAL
+        dx, dy = dst >> COOR_BITS, dst & COOR_MASK
+        if dx < self.x:
+            return WEST
+        ops = []
+        if dx > self.x:
+            ops.append(EAST)
+        if dy > self.y:
+            ops.append(NORTH)
+        elif dy < self.y:
+            ops.append(SOUTH)
+        return ops[0] if len(ops) == 1 else self.least_loaded(ops)
+
+    def route_odd_even(self, dst, src):
+        # odd-even turn model (Chiu): no east to north/south turns in even columns and no north/south to
+        # west turns in odd columns, src is the packed source core
+        if (dst == self.packed_id):
+            return LOCAL
+        dx, dy = dst >> COOR_BITS, dst & COOR_MASK
+        vertical = NORTH if dy > self.y else SOUTH
+        if dx == self.x:
+            return vertical
+        ops = []
+        if dx > self.x:
+            if dy == self.y:
+                return EAST
+            if dx % 2 == 1 or dx - self.x != 1:
+                ops.append(EAST)
+            if self.x % 2 == 1 or self.x == (src >> COOR_BITS):
+                ops.append(vertical)
+        else:
+            ops.append(WEST)
+            if dy != self.y and self.x % 2 == 0:
+                ops.append(vertical)
+        return ops[0] if len(ops) == 1 else self.least_loaded(ops)
+
+    def decode(self, msg):
+        if type(msg.dst) is list:
+            # routing tree: the destinations split by output port, the message forks if there are several
+            branches = {}
+            for dst in msg.dst:
+                op = self.route(dst, msg.src)
+                if op in branches:
+                    branches[op].append(dst)
+                else:
+                    branches[op] = [dst]
+            if len(branches) == 1:
+                msg.set_op(op)
             else:
-                msg.set_op('south')
+                msg.set_op(MULTICAST)
+                msg.branches = branches
+        else:
+            msg.set_op(self.route(msg.dst, msg.src))
 
     def __repr__(self):
         basestr = 'Router ID: {}\n'.format(self.router_id)
@@ -172,6 +470,12 @@ class Router:
                 break
         return r
 
+    def is_empty(self):
+        for buffkey in self.buffers.keys():
+            if not self.buffers[buffkey].is_empty():
+                return False
+        return True
+
     def next_timestep(self):
         assert self.ready()
         for buffkey in self.buffers.keys():
@@ -194,27 +498,102 @@ class Arbiter:
         @param resource_dict: dictionary of resource refs
         """
         self.direction = direction
+        self.op = OP_CODES[direction]
         self.resource_refs = in_buffs_dict
+        self.inputs = list(in_buffs_dict.values()) # in key order, for round robin by index
         self.sink = sink
         self.start_ind = 0
+        self.stats = None # Telemetry, if attached
+        self.stats_ind = None # (router, port) index of this arbiter in the Telemetry arrays
+        self.tracer = None # Tracer, if attached
+        self.trace_ind = None # router index of this arbiter for the Tracer
 
     def arbitrate(self):
+        # a multicast message at the head of an input requests every port in its branches, each
+        # arbiter takes its branch, so one input can be granted to several outputs in an op step
+        if self.stats is not None:
+            self.stats.arbitrate(self)
         if (not self.sink.is_full()):
             msg = None
-            for i, key in enumerate(self.resource_refs.keys()):
-                mop, trav = self.resource_refs[key].req()
-                if ((not trav) and i > self.start_ind and mop == self.direction):
+            for i, buff in enumerate(self.inputs):
+                mop, trav = buff.req()
+                if ((not trav) and i > self.start_ind and (mop == self.op or (mop == MULTICAST and self.op in buff.head().branches))):
                     self.start_ind = i
-                    msg = self.resource_refs[key].dequeue()
+                    msg = buff.dequeue() if mop == self.op else buff.fork(self.op)
+                    break # one grant per op step, a second dequeue would drop this message
             if msg is None: # loop back around
-                for i, key in enumerate(self.resource_refs.keys()):
-                    mop, trav = self.resource_refs[key].req()
-                    if ((not trav) and i <= self.start_ind and mop == self.direction):
+                for i, buff in enumerate(self.inputs):
+                    mop, trav = buff.req()
+                    if ((not trav) and i <= self.start_ind and (mop == self.op or (mop == MULTICAST and self.op in buff.head().branches))):
                         self.start_ind = i
-                        msg = self.resource_refs[key].dequeue()
+                        msg = buff.dequeue() if mop == self.op else buff.fork(self.op)
+                        break
             if msg is not None: # send the message to its designated endpoint
-                assert type(msg) is SpikeMsg
-                self.sink.enqueue(msg)
+                self.send(msg)
+
+    def requests(self, buff):
+        # the head of buff may move in this op step and asks for this port, returns its op or None
+        mop, trav = buff.req()
+        if (not trav) and (mop == self.op or (mop == MULTICAST and self.op in buff.head().branches)):
+            return mop
+        return None
+
+    def grant(self, i, mop):
+        self.start_ind = i
+        buff = self.inputs[i]
+        self.send(buff.dequeue() if mop == self.op else buff.fork(self.op))
+
+    def send(self, msg):
+        assert type(msg) is SpikeMsg
+        if self.tracer is not None:
+            self.tracer.forward(self, msg)
+        self.sink.enqueue(msg)
+
+class AgeArbiter(Arbiter):
+    """
+    Grants the oldest requesting message (lowest SpikeMsg.seq), which cannot starve
+    """
+
+    def arbitrate(self):
+        if self.stats is not None:
+            self.stats.arbitrate(self)
+        if (not self.sink.is_full()):
+            best = None
+            for i, buff in enumerate(self.inputs):
+                mop = self.requests(buff)
+                if mop is not None and (best is None or buff.head().seq < best_seq):
+                    best, best_mop, best_seq = i, mop, buff.head().seq
+            if best is not None:
+                self.grant(best, best_mop)
+
+class DelayArbiter(Arbiter):
+    """
+    Round robin in the order of Arbiter, but a request whose message has delay 1 goes before the requests
+    with slack, so that messages due in this timestep are not held up
+    """
+
+    def arbitrate(self):
+        if self.stats is not None:
+            self.stats.arbitrate(self)
+        if (not self.sink.is_full()):
+            best = None
+            n = len(self.inputs)
+            for k in range(1, n+1):
+                i = (self.start_ind + k) % n
+                mop = self.requests(self.inputs[i])
+                if mop is not None:
+                    if self.inputs[i].head_urgent():
+                        best, best_mop = i, mop
+                        break
+                    if best is None:
+                        best, best_mop = i, mop
+            if best is not None:
+                self.grant(best, best_mop)
+
+# Router arbiter names
+ARBITERS = {'round_robin': Arbiter, 'age': AgeArbiter, 'delay': DelayArbiter}
+# Router routing names -> Router methods
+ROUTING = {'xy': 'route_xy', 'west_first': 'route_west_first', 'odd_even': 'route_odd_even'}
 
 class Crossbar:
     """
@@ -222,13 +601,14 @@ class Crossbar:
     Contains arbiter objects that collectively handle crossbar resource allocation
     """
 
-    def __init__(self, in_buffs_dict, sinks_dict):
+    def __init__(self, in_buffs_dict, sinks_dict, arbiter=None):
         # store references to incoming buffers
         self.in_buff_refs = in_buffs_dict
         self.sink_refs = sinks_dict
         self.arbiters = {}
+        arbiter = Arbiter if arbiter is None else arbiter
         for key in self.sink_refs.keys():
-            self.arbiters[key] = Arbiter(key, self.in_buff_refs, self.sink_refs[key])
+            self.arbiters[key] = arbiter(key, self.in_buff_refs, self.sink_refs[key])
 
     def operate(self):
         for key in self.sink_refs.keys():
@@ -0,0 +1,305 @@
+import multiprocessing as mp
+import os
+import sys
+import numpy as np
+from noc_utils import advance_enqueue_seq
+
+QUEUE_LOCAL = ('decode', 'listener') # Queue attributes that stay with the owner process
+
+def queue_state(queue):
+    return {key: value for key, value in queue.__dict__.items() if not key in QUEUE_LOCAL}
+
+def chip_result(chip, inds):
+    # state of the cores and routers inds of a chip simulated in a worker, for merge_result in the parent
+    cores = {}
+    for i in inds:
+        core = chip.cores[i]
+        cores[i] = dict(current=core.current, voltage=core.voltage, input=core.input, input_head=core.input_head,
+            spiked=core.spiked,
+            last_nrn_v=core.last_nrn_v, cur_nrn=core.cur_nrn, overflow_count=core.overflow_count,
+            in_buffer=queue_state(core.in_buffer), out_buffer=queue_state(core.out_buffer),
+            cyc_count=chip.cyc_counters[i])
+    routers = {}
+    for i in inds:
+        router = chip.routers[i]
+        routers[i] = dict(buffers={key: queue_state(buff) for key, buff in router.buffers.items()},
+            start_inds={key: arb.start_ind for key, arb in router.xbar.arbiters.items()})
+    return dict(cores=cores, routers=routers)
+
+def merge_result(chip, result):
+    # copy a chip_result into the chip of the parent process
+    for i, state in result['cores'].items():
+        core = chip.cores[i]
+        for name in ('current', 'voltage', 'input', 'spiked'):
+            getattr(core, name)[...] = state[name] # in place, these may be views into a ChipState
+        core.input_head = state['input_head']
+        core.last_nrn_v = state['last_nrn_v']
+        core.cur_nrn = state['cur_nrn']
+        core.overflow_count = state['overflow_count']
+        core.in_buffer.__dict__.update(state['in_buffer'])
+        core.out_buffer.__dict__.update(state['out_buffer'])
+        chip.cyc_counters[i].update(state['cyc_count'])
+    for i, state in result['routers'].items():
+        router = chip.routers[i]
+        for key, buff in router.buffers.items():
+            buff.__dict__.update(state['buffers'][key])
+        for key, arb in router.xbar.arbiters.items():
+            arb.start_ind = state['start_inds'][key]
+    if chip.state is not None:
+        chip.state.set_input_head(chip.cores[0].input_head)
+
+def fork_workers(n_workers, work):
+    """
+    fork_workers - run work(w, conn) in n_workers forked processes, work sends its result through conn
+    (None if it gave up). returns the results in worker order, raises RuntimeError if a worker failed
+    """
+    sys.stdout.flush() # forked children would print buffered output again
+    ctx = mp.get_context('fork')
+    procs = []
+    for w in range(n_workers):
+        recv_end, send_end = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=work, args=(w, send_end))
+        proc.start()
+        send_end.close()
+        procs.append((proc, recv_end))
+    results = []
+    for proc, recv_end in procs:
+        try:
+            results.append(recv_end.recv())
+        except EOFError: # the worker died before sending its result
+            results.append(None)
+    for proc, _ in procs:
+        proc.join()
+    if any(result is None for result in results):
+        raise RuntimeError('parallel worker failed')
+    return results
+
+class WorkerFailed(Exception):
+    pass
+
+class ProxySink:
+    """
+    Stands in for the input buffer of a router in another tile, as the sink of a boundary arbiter
+
+    The buffer has a single upstream router, so its fill level when the arbiter looks at it is the level
+    at the start of the op step, minus the messages its owner dequeued if the owner operates first in
+    the serial router order (owner < pusher). Only in that case, and only if the buffer started full,
+    the proxy waits for the owner to publish its level. Enqueued messages are forwarded at the end of
+    the op step, a message enqueued during an op step cannot move before the next one anyway.
+    """
+
+    def __init__(self, tile, link, pusher, owner, dst_tile, capacity, start_len, pQ=True):
+        self.tile = tile
+        self.link = link
+        self.pusher = pusher
+        self.owner = owner
+        self.dst_tile = dst_tile
+        self.capacity = capacity
+        self.start_len = start_len
+        self.pQ = pQ
+        self.sent = False
+
+    def is_full(self, amt=1):
+        if self.start_len + amt - 1 < self.capacity:
+            return False
+        if self.owner > self.pusher:
+            return True
+        tile = self.tile
+        tile.wait(lambda: tile.post_tick[self.owner] >= tile.tick)
+        return tile.post_len[tile.tick%2, self.link] + amt - 1 >= self.capacity
+
+    def enqueue(self, msg):
+        assert not self.is_full()
+        self.tile.outbox[self.dst_tile].append((self.link, msg.dst, msg.axon_ids, msg.delay))
+        # the owner will not be ready, without pQ while it holds any message
+        self.tile.sent_urgent = self.tile.sent_urgent or msg.delay == 1 or not self.pQ
+        self.sent = True
+        self.tile.chip.cores[self.pusher].msg_pool.release(msg)
+
+class Tile:
+    """
+    One worker of a ParallelRunner, simulates the cores and routers of a band of columns
+    runs the timestep loop of Chip.operate / Chip.operate_cycle on its own cores and routers
+    """
+
+    def __init__(self, runner, t):
+        self.runner = runner
+        self.chip = runner.chip
+        self.t = t
+        self.inds = runner.tile_inds[t]
+        self.tick = 0
+        self.arrive = runner.arrive
+        self.flags = runner.flags
+        self.post_len = runner.post_len
+        self.post_tick = runner.post_tick
+        self.sent = runner.sent
+        self.abort = runner.abort
+        self.outbox = {}
+        self.sent_urgent = False
+        self.proxies = []
+        self.owned = {} # router index -> [(link, buffer)] of boundary buffers owned by this tile
+        for link, (pusher, out_key, owner, in_key) in enumerate(runner.links):
+            if runner.tile_of[pusher] == t:
+                dst_tile = runner.tile_of[owner]
+                buff = self.chip.routers[owner].buffers[in_key]
+                proxy = ProxySink(self, link, pusher, owner, dst_tile, buff.capacity, buff.n_msgs, pQ=buff.pQ)
+                self.chip.routers[pusher].sink_refs[out_key] = proxy
+                self.chip.routers[pusher].xbar.arbiters[out_key].sink = proxy
+                self.proxies.append(proxy)
+                self.outbox[dst_tile] = []
+            if runner.tile_of[owner] == t:
+                self.owned.setdefault(owner, []).append((link, self.chip.routers[owner].buffers[in_key]))
+
+    def wait(self, cond):
+        while not cond():
+            if self.abort[0]:
+                raise WorkerFailed()
+            os.sched_yield()
+
+    def barrier(self):
+        self.arrive[self.t] = self.tick
+        self.wait(lambda: self.arrive.min() >= self.tick)
+
+    def local_ready(self):
+        chip = self.chip
+        for i in self.inds:
+            if not chip.cores[i].ready() or not chip.routers[i].ready():
+                return False
+        return True
+
+    def receive(self):
+        # messages the other tiles forwarded in the previous op step
+        chip = self.chip
+        for src_tile, conn in self.runner.conns[self.t].items():
+            if self.sent[(self.tick-1)%2, src_tile, self.t]:
+                for link, dst, axon_ids, delay in conn.recv():
+                    owner, in_key = self.runner.links[link][2:]
+                    chip.routers[owner].buffers[in_key].enqueue(chip.cores[owner].msg_pool.acquire(dst, axon_ids, delay))
+        for proxy in self.proxies:
+            proxy.start_len = self.post_len[(self.tick-1)%2, proxy.link] + int(proxy.sent)
+            proxy.sent = False
+
+    def send(self):
+        for dst_tile, msgs in self.outbox.items():
+            self.sent[self.tick%2, self.t, dst_tile] = len(msgs) > 0
+            if len(msgs) > 0:
+                self.runner.conns[dst_tile][self.t].send(msgs)
+                msgs.clear()
+
+    def operate_tick(self, tic_toc):
+        chip = self.chip
+        if tic_toc%4 == 0:
+            for i in self.inds:
+                chip.cores[i].operate(cyc_count=chip.cyc_counters[i])
+        for i in self.inds:
+            chip.routers[i].next_op_step()
+        for i in self.inds:
+            chip.routers[i].operate()
+            if i in self.owned:
+                for link, buff in self.owned[i]:
+                    self.post_len[self.tick%2, link] = buff.n_msgs
+                self.post_tick[i] = self.tick
+        self.send()
+
+    def run(self):
+        chip = self.chip
+        worked = False
+        while chip.controller.conditional_run():
+            if self.t == 0:
+                print("tstep: {}".format(chip.controller.get_tstep()))
+            tic_toc = 0
+            while True:
+                self.tick += 1
+                self.flags[self.tick%2, self.t] = self.local_ready() and not self.sent_urgent
+                self.sent_urgent = False
+                self.barrier()
+                if worked:
+                    self.receive()
+                worked = False
+                if self.flags[self.tick%2].all():
+                    break
+                self.operate_tick(tic_toc)
+                worked = True
+                tic_toc += 1
+                chip.core_cycle_count += 1
+            chip.controller.inc_tstep()
+            if chip.state is not None:
+                chip.state.advance_input()
+            for i in self.inds:
+                chip.cores[i].next_timestep()
+                chip.routers[i].next_timestep()
+        return self.result()
+
+    def result(self):
+        chip = self.chip
+        return dict(chip_result(chip, self.inds), core_cycle_count=chip.core_cycle_count,
+            tstep=chip.controller.get_tstep(), seq=advance_enqueue_seq())
+
+class ParallelRunner:
+    """
+    Runs a prepared cycle-mode Chip with the mesh split into bands of columns, one worker process each
+
+    Bands follow the get_ind layout (x outer), so each tile owns a contiguous index range and only the
+    east/west links cross tiles. Workers are forked after programming and share only small arrays:
+    op step barriers, readiness flags, and the fill levels of the boundary buffers. Messages cross tiles
+    through pipes at the end of every op step. Cycle counts, voltages and the NoC state come out identical
+    to the serial Chip.operate, and are merged back into the chip at the end of the run.
+    """
+
+    def __init__(self, chip, workers):
+        assert chip.mode == 'cycle' and chip.scheduler is None and chip.util_arr_ref is None
+        assert len(chip.probes) == 0 and chip.telemetry is None and chip.tracer is None
+        self.chip = chip
+        n_tiles = max(1, min(workers, chip.x_dim))
+        cols = np.array_split(np.arange(chip.x_dim), n_tiles)
+        self.tile_inds = [list(range(c[0]*chip.y_dim, (c[-1]+1)*chip.y_dim)) for c in cols]
+        self.tile_of = {i: t for t, inds in enumerate(self.tile_inds) for i in inds}
+        # boundary links: (pushing router, its output key, owning router, input key of the owner)
+        owner_of = {}
+        for j, router in enumerate(chip.routers):
+            for key, buff in router.buffers.items():
+                owner_of[id(buff)] = (j, key)
+        self.links = []
+        for i, router in enumerate(chip.routers):
+            for key, sink in router.sink_refs.items():
+                if id(sink) in owner_of and self.tile_of[owner_of[id(sink)][0]] != self.tile_of[i]:
+                    self.links.append((i, key) + owner_of[id(sink)])
+        n_links = max(len(self.links), 1)
+        self.arrive = np.frombuffer(mp.RawArray('q', n_tiles), dtype=np.int64)
+        self.flags = np.frombuffer(mp.RawArray('b', 2*n_tiles), dtype=np.bool_).reshape(2, n_tiles)
+        self.post_len = np.frombuffer(mp.RawArray('q', 2*n_links), dtype=np.int64).reshape(2, n_links)
+        self.post_tick = np.frombuffer(mp.RawArray('q', len(chip.routers)), dtype=np.int64)
+        self.sent = np.frombuffer(mp.RawArray('b', 2*n_tiles*n_tiles), dtype=np.bool_).reshape(2, n_tiles, n_tiles)
+        self.abort = np.frombuffer(mp.RawArray('b', 1), dtype=np.bool_)
+        # conns[dst_tile][src_tile] is the receiving end at dst_tile, and the sending end at src_tile
+        self.conns = [dict() for _ in range(n_tiles)]
+        pairs = set((self.tile_of[i], self.tile_of[j]) for i, _, j, _ in self.links)
+        self.pipes = {pair: mp.Pipe(duplex=False) for pair in pairs}
+
+    def work(self, t, conn):
+        # forked child, keeps its own ends of the pipes
+        for (src, dst), (recv_end, send_end) in self.pipes.items():
+            if dst == t:
+                self.conns[dst][src] = recv_end
+            if src == t:
+                self.conns[dst][src] = send_end
+        try:
+            conn.send(Tile(self, t).run())
+        except WorkerFailed:
+            conn.send(None)
+        except BaseException:
+            self.abort[0] = True
+            raise
+        finally:
+            sys.stdout.flush()
+
+    def run(self):
+        self.merge(fork_workers(len(self.tile_inds), self.work))
+
+    def merge(self, results):
+        chip = self.chip
+        for result in results:
+            merge_result(chip, result)
+            advance_enqueue_seq(result['seq'])
+        chip.core_cycle_count = results[0]['core_cycle_count']
+        chip.controller.tstep = results[0]['tstep']
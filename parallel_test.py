@@ -0,0 +1,56 @@
+from chip_utils import Chip
+from chip_programmer import save_network
+from core_utils import SynapseState
+from netgen import random_sparse
+import numpy as np
+import os
+import tempfile
+
+# cross-tile traffic on a 4x3 mesh, serial and split over worker processes
+def build(workers, capacity=50):
+    chip = Chip(x_dim=4, y_dim=3, workers=workers)
+    chip.controller.set_tmax(30)
+    for router in chip.routers:
+        for buff in router.buffers.values():
+            buff.capacity = capacity
+    for i, core in enumerate(chip.cores):
+        for n in range(4 + i%3):
+            core.add_neuron(0.5, 0.9, 60.0 + 10*n, bias=15.0 + i, bias_delay=i%3)
+    for i, core in enumerate(chip.cores):
+        for n in range(4):
+            dst = chip.get_coor((i*7 + n*5 + 3) % len(chip.cores))
+            core.add_axon_out(n, (dst, [10*i + n], 1 + n%3))
+            chip.cores[chip.get_ind(dst[0], dst[1])].add_synapse_in(10*i + n, SynapseState(n, 25.0 - 10*n, 1))
+    chip.prepare_computation()
+    chip.run()
+    return chip
+
+for capacity in (50, 1): # capacity 1 makes boundary arbiters wait for the neighbouring tile
+    serial = build(1, capacity)
+    for workers in (2, 4):
+        chip = build(workers, capacity)
+        assert chip.core_cycle_count == serial.core_cycle_count
+        assert chip.cyc_counters == serial.cyc_counters
+        for core, serial_core in zip(chip.cores, serial.cores):
+            assert np.array_equal(core.voltage, serial_core.voltage)
+            assert np.array_equal(core.input, serial_core.input)
+            assert core.get_last_nrn_v() == serial_core.get_last_nrn_v()
+        for router, serial_router in zip(chip.routers, serial.routers):
+            assert str(router) == str(serial_router)
+
+# without pQ a timestep only ends once every tile has an empty NoC, also after messages with a delay above 1
+# crossed to another tile
+netfile = os.path.join(tempfile.mkdtemp(), 'sparse.npz')
+save_network(netfile, *random_sparse(x_dim=4, y_dim=3, npc=8, fan_out=6, rate=0.3, tmax=15, seed=2))
+chips = {}
+for workers in (1, 2, 4):
+    chips[workers] = Chip(x_dim=4, y_dim=3, workers=workers, pQ=False)
+    chips[workers].program_cores(netfile)
+    chips[workers].run()
+for workers in (2, 4):
+    assert chips[workers].core_cycle_count == chips[1].core_cycle_count
+    assert chips[workers].cyc_counters == chips[1].cyc_counters
+    for core, serial_core in zip(chips[workers].cores, chips[1].cores):
+        assert np.array_equal(core.voltage, serial_core.voltage)
+        assert core.get_last_nrn_v() == serial_core.get_last_nrn_v()
+print('Cycle Count: {}'.format(serial.core_cycle_count))
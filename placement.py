@@ -0,0 +1,371 @@
+"""
+Placement of the neurons of a network file onto the cores of the mesh, minimizing the NoC traffic.
+
+A spike sends one message per axon of its neuron (see chip_programmer.axon_id), i.e. per destination
+core and delay, which crosses the manhattan distance between the cores under XY routing (no router for
+a message to the own core, which takes the local bypass). place() minimizes the total hop distance of
+the synapses, weighted by the expected spike count of their source, under the per-core limits of
+core_utils:
+
+    neurons <= COMPARTMENTS_PER_CORE (and the balance limit, see place)
+    axons of the afferent synapses (axon_in) <= MAX_AXON_IN
+    axons of the efferent synapses (axon_out entries) <= MAX_AXON_OUT, bounded by the efferent
+        synapses while placing
+    afferent synapses (fan-in state) <= MAX_FAN_IN_STATE
+
+The initial placement lays out a breadth-first ordering of the synapse graph along a serpentine walk of
+the mesh, so that connected neurons land on the same or neighbouring cores. Simulated annealing then
+refines it with single neuron moves and pairwise swaps.
+
+    python placement.py net.npz placed.npz --mesh 8x8
+"""
+import argparse
+import math
+import random
+from collections import deque
+import numpy as np
+from chip_programmer import read_network, write_network, nrn_rows, axon_id
+from core_utils import COMPARTMENTS_PER_CORE, MAX_AXON_IN, MAX_AXON_OUT, MAX_FAN_IN_STATE
+from telemetry import PORTS
+
+def core_of_neurons(neurons, y_dim):
+    # get_ind of the core of every neuron
+    return neurons['y'].astype(np.int64) + neurons['x'].astype(np.int64) * y_dim
+
+def synapse_rows(neurons, synapses):
+    """
+    synapse_rows - (source rows, destination rows, axon ids) of the synapses, rows of the neuron table
+    """
+    axons = axon_id(synapses['src'].astype(np.int64), synapses['delay_pre'].astype(np.int64))
+    return nrn_rows(neurons, synapses['src']), nrn_rows(neurons, synapses['dst']), axons
+
+def first_of_message(core_of, dst, axons):
+    # first synapse of every (axon, destination core), i.e. of every spike message
+    if len(axons) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.stack((axons, core_of[dst]), axis=1), axis=0, return_index=True)[1]
+
+def core_usage(core_of, src, dst, axons, n_cores):
+    """
+    core_usage - per-core resource counts of an assignment of neuron rows to cores
+    returns a dict of arrays: neurons, axon_in, axon_out, fan_in
+    """
+    first = first_of_message(core_of, dst, axons)
+    return dict(neurons=np.bincount(core_of, minlength=n_cores), axon_in=np.bincount(core_of[dst[first]], minlength=n_cores),
+        axon_out=np.bincount(core_of[src[first]], minlength=n_cores), fan_in=np.bincount(core_of[dst], minlength=n_cores))
+
+def within_limits(usage, max_neurons=COMPARTMENTS_PER_CORE):
+    return bool(np.all(usage['neurons'] <= max_neurons) and np.all(usage['axon_in'] <= MAX_AXON_IN) and
+        np.all(usage['axon_out'] <= MAX_AXON_OUT) and np.all(usage['fan_in'] <= MAX_FAN_IN_STATE))
+
+def hop_cost(core_of, src, dst, y_dim, weights=None):
+    """
+    hop_cost - total hop distance of the synapses, each weighted by the spike weight of its source row
+    """
+    a = core_of[src]
+    b = core_of[dst]
+    hops = np.abs(a // y_dim - b // y_dim) + np.abs(a % y_dim - b % y_dim)
+    return float(hops.sum() if weights is None else np.dot(hops, weights[src]))
+
+def noc_load(core_of, src, dst, axons, x_dim, y_dim, weights=None):
+    """
+    noc_load - estimated messages through every router output port under XY routing, one message per
+    axon and destination core for every source spike (weights, default 1 per neuron). the local bypass
+    does not enter a router
+    returns a dict with 'ports', a [router, port] array in the layout of Telemetry.flits, and totals
+    """
+    first = first_of_message(core_of, dst, axons)
+    src = src[first]
+    dst = dst[first]
+    w = np.ones(len(src)) if weights is None else np.asarray(weights, dtype=np.float64)[src]
+    a = core_of[src]
+    b = core_of[dst]
+    sx, sy, dx, dy = a // y_dim, a % y_dim, b // y_dim, b % y_dim
+    remote = a != b
+    ports = xy_port_load(a, b, w, x_dim, y_dim)
+    links = ports[:, :PORTS.index('local')]
+    return dict(ports=ports, messages=float(w.sum()), local=float(w[~remote].sum()),
+        hops=float(np.dot(np.abs(sx - dx) + np.abs(sy - dy), w)), max_link=float(links.max()) if len(links) > 0 else 0.0,
+        mean_link=float(links[links > 0].mean()) if np.any(links > 0) else 0.0)
+
+def xy_port_load(a, b, w, x_dim, y_dim, t=None, n_t=1):
+    """
+    xy_port_load - messages through every router output port under XY routing, for w messages from core a to
+    core b (get_ind arrays). messages to the own core take the local bypass and enter no router
+    t: optional timestep of every entry, the loads are then summed per timestep
+    returns a [router, port] array in the layout of Telemetry.flits, [timestep, router, port] for t
+    """
+    sx, sy, dx, dy = a // y_dim, a % y_dim, b // y_dim, b % y_dim
+    tt = np.zeros(len(a), dtype=np.int64) if t is None else t
+    # difference arrays [timestep, east/west or north/south, x, y] along the X and the Y segment of every route,
+    # cumulated over the axis the segment runs along. a segment runs over [lo, hi), shifted by one cell when
+    # it runs backwards. without a segment lo == hi and the weight is 0
+    shape = (n_t, 2, x_dim + 1, y_dim + 1)
+    size = int(np.prod(shape))
+    west = dx < sx
+    south = dy < sy
+    wx = np.where(dx != sx, w, 0.0)
+    wy = np.where(dy != sy, w, 0.0)
+    base = (tt * 2 + west) * shape[2] * shape[3] + sy
+    lo, hi = np.minimum(sx, dx) + west, np.maximum(sx, dx) + west
+    diff_x = np.bincount(np.concatenate((base + lo * shape[3], base + hi * shape[3])),
+        weights=np.concatenate((wx, -wx)), minlength=size).reshape(shape)
+    base = (tt * 2 + south) * shape[2] * shape[3] + dx * shape[3]
+    lo, hi = np.minimum(sy, dy) + south, np.maximum(sy, dy) + south
+    diff_y = np.bincount(np.concatenate((base + lo, base + hi)), weights=np.concatenate((wy, -wy)),
+        minlength=size).reshape(shape)
+    loads = np.cumsum(diff_x, axis=2)[:, :, :x_dim, :y_dim].reshape(n_t, 2, -1) # get_ind = y + x*y_dim
+    ports = np.zeros((n_t, x_dim * y_dim, len(PORTS)))
+    ports[:, :, PORTS.index('east')] = loads[:, 0]
+    ports[:, :, PORTS.index('west')] = loads[:, 1]
+    loads = np.cumsum(diff_y, axis=3)[:, :, :x_dim, :y_dim].reshape(n_t, 2, -1)
+    ports[:, :, PORTS.index('north')] = loads[:, 0]
+    ports[:, :, PORTS.index('south')] = loads[:, 1]
+    ports[:, :, PORTS.index('local')] = np.bincount(tt * (x_dim * y_dim) + b, weights=np.where(a != b, w, 0.0),
+        minlength=n_t * x_dim * y_dim).reshape(n_t, -1)
+    return ports[0] if t is None else ports
+
+def serpentine(x_dim, y_dim):
+    # get_ind of the cores, column by column with alternating direction
+    return [y + x * y_dim for x in range(x_dim) for y in (range(y_dim) if x % 2 == 0 else reversed(range(y_dim)))]
+
+def bfs_order(n, src, dst):
+    # breadth-first ordering of the undirected synapse graph, every component from a lowest-degree neuron
+    adj = [[] for _ in range(n)]
+    for s, d in zip(src.tolist(), dst.tolist()):
+        if s != d:
+            adj[s].append(d)
+            adj[d].append(s)
+    degree = [len(nbrs) for nbrs in adj]
+    seen = [False] * n
+    order = []
+    for root in sorted(range(n), key=degree.__getitem__):
+        if seen[root]:
+            continue
+        seen[root] = True
+        queue = deque([root])
+        while queue:
+            v = queue.popleft()
+            order.append(v)
+            for u in sorted(set(adj[v]), key=degree.__getitem__):
+                if not seen[u]:
+                    seen[u] = True
+                    queue.append(u)
+    return order
+
+def initial_placement(n, src, dst, axons, x_dim, y_dim, max_neurons):
+    """
+    initial_placement - fill the cores along serpentine() with the neurons in bfs_order(), at most
+    ceil(n / cores) neurons per core and within the core limits
+    """
+    per_core = min(max(-(-n // (x_dim * y_dim)), 1), max_neurons)
+    in_deg = np.bincount(dst, minlength=n).tolist()
+    out_deg = np.bincount(src, minlength=n).tolist()
+    sources = [[] for _ in range(n)] # axons of the afferent synapses
+    for ax, d in zip(axons.tolist(), dst.tolist()):
+        sources[d].append(ax)
+    cores = iter(serpentine(x_dim, y_dim))
+    core_of = np.zeros(n, dtype=np.int64)
+    core = None
+    for v in bfs_order(n, src, dst):
+        while True:
+            if core is not None and (count < per_core and fan_in + in_deg[v] <= MAX_FAN_IN_STATE and
+                    axon_out + out_deg[v] <= MAX_AXON_OUT and len(axon_in.union(sources[v])) <= MAX_AXON_IN):
+                break
+            if core is not None and count == 0:
+                raise ValueError('neuron row {} does not fit on a core'.format(v))
+            core = next(cores, None)
+            if core is None:
+                raise ValueError('network does not fit on a {}x{} mesh'.format(x_dim, y_dim))
+            count, fan_in, axon_out, axon_in = 0, 0, 0, set()
+        core_of[v] = core
+        count += 1
+        fan_in += in_deg[v]
+        axon_out += out_deg[v]
+        axon_in.update(sources[v])
+    return core_of
+
+def anneal(core_of, src, dst, axons, x_dim, y_dim, weights=None, max_neurons=COMPARTMENTS_PER_CORE, iters=None, t0=None,
+           cooling=1e-3, seed=0):
+    """
+    anneal - simulated annealing of a valid assignment of neuron rows to cores
+    a step moves a neuron to the core of one of its synaptic partners, or swaps it with a neuron there if
+    that core is full. steps that break a core limit are undone
+    iters: number of steps, default 50 per neuron
+    t0: initial temperature, default the mean cost increase of sampled steps. the temperature decays
+        geometrically to t0 * cooling
+    returns the refined assignment
+    """
+    rng = random.Random(seed)
+    n = len(core_of)
+    n_cores = x_dim * y_dim
+    iters = 50 * n if iters is None else iters
+    w = [1.0] * n if weights is None else np.asarray(weights, dtype=np.float64).tolist()
+    core = core_of.tolist()
+    cx = [c // y_dim for c in range(n_cores)]
+    cy = [c % y_dim for c in range(n_cores)]
+    # synaptic partners with the weight of the edge, and the axons of the afferent synapses
+    adj = [[] for _ in range(n)]
+    sources = [{} for _ in range(n)]
+    out_deg = [0] * n
+    for s, d, ax in zip(src.tolist(), dst.tolist(), axons.tolist()):
+        if s != d:
+            adj[s].append((d, w[s]))
+            adj[d].append((s, w[s]))
+        sources[d][ax] = sources[d].get(ax, 0) + 1
+        out_deg[s] += 1
+    in_deg = [sum(srcs.values()) for srcs in sources]
+    members = [[] for _ in range(n_cores)]
+    pos = [0] * n
+    for v, c in enumerate(core):
+        pos[v] = len(members[c])
+        members[c].append(v)
+    fan_in = [0] * n_cores
+    axon_out = [0] * n_cores
+    core_sources = [{} for _ in range(n_cores)] # axon -> afferent synapses of the core
+    for v, c in enumerate(core):
+        fan_in[c] += in_deg[v]
+        axon_out[c] += out_deg[v]
+        for s, m in sources[v].items():
+            core_sources[c][s] = core_sources[c].get(s, 0) + m
+
+    def delta(v, b):
+        # cost change of moving v to core b, the other neurons where they are
+        a = core[v]
+        total = 0.0
+        for u, wu in adj[v]:
+            c = core[u]
+            total += wu * (abs(cx[b] - cx[c]) + abs(cy[b] - cy[c]) - abs(cx[a] - cx[c]) - abs(cy[a] - cy[c]))
+        return total
+
+    def move(v, b):
+        a = core[v]
+        last = members[a].pop()
+        if last != v:
+            members[a][pos[v]] = last
+            pos[last] = pos[v]
+        pos[v] = len(members[b])
+        members[b].append(v)
+        core[v] = b
+        fan_in[a] -= in_deg[v]
+        fan_in[b] += in_deg[v]
+        axon_out[a] -= out_deg[v]
+        axon_out[b] += out_deg[v]
+        for s, m in sources[v].items():
+            left = core_sources[a][s] - m
+            if left == 0:
+                del core_sources[a][s]
+            else:
+                core_sources[a][s] = left
+            core_sources[b][s] = core_sources[b].get(s, 0) + m
+
+    def fits(c):
+        return (len(members[c]) <= max_neurons and fan_in[c] <= MAX_FAN_IN_STATE and axon_out[c] <= MAX_AXON_OUT
+            and len(core_sources[c]) <= MAX_AXON_IN)
+
+    def propose():
+        # (v, partner or None, target core), or None if v has no synaptic partner off its core
+        v = rng.randrange(n)
+        if len(adj[v]) == 0:
+            return None
+        b = core[adj[v][rng.randrange(len(adj[v]))][0]]
+        if b == core[v]:
+            return None
+        partner = None
+        if len(members[b]) >= max_neurons:
+            partner = members[b][rng.randrange(len(members[b]))]
+        return v, partner, b
+
+    def step_delta(v, partner, b):
+        a = core[v]
+        d = delta(v, b)
+        if partner is not None:
+            core[v] = b
+            d += delta(partner, a)
+            core[v] = a
+        return d
+
+    if t0 is None:
+        ups = []
+        for _ in range(min(200, iters)):
+            proposal = propose()
+            if proposal is not None:
+                d = step_delta(*proposal)
+                if d > 0:
+                    ups.append(d)
+        t0 = sum(ups) / len(ups) if len(ups) > 0 else 1.0
+    decay = cooling ** (1.0 / max(iters, 1))
+    temp = t0
+    for _ in range(iters):
+        temp *= decay
+        proposal = propose()
+        if proposal is None:
+            continue
+        v, partner, b = proposal
+        a = core[v]
+        d = step_delta(v, partner, b)
+        if d > 0 and rng.random() >= math.exp(-d / temp):
+            continue
+        move(v, b)
+        if partner is not None:
+            move(partner, a)
+        if not (fits(a) and fits(b)):
+            if partner is not None:
+                move(partner, b)
+            move(v, a)
+    return np.asarray(core, dtype=np.int64)
+
+def place(neurons, synapses, x_dim, y_dim, weights=None, balance=1.0, iters=None, seed=0):
+    """
+    place - core assignment of the neuron table rows (get_ind of the core, in row order)
+    weights: expected spikes of every neuron row, default 1 each
+    balance: at most ceil(balance * neurons / cores) neurons per core, since the cores step through their
+             neurons sequentially in cycle mode. a large balance allows packing up to COMPARTMENTS_PER_CORE
+    iters: annealing steps, see anneal
+    the annealing starts from the cheaper of initial_placement and the placement of the table, if that
+    is within the limits
+    """
+    assert balance >= 1.0
+    n = len(neurons)
+    n_cores = x_dim * y_dim
+    max_neurons = min(max(int(math.ceil(balance * n / n_cores)), 1), COMPARTMENTS_PER_CORE)
+    src, dst, axons = synapse_rows(neurons, synapses)
+    core_of = initial_placement(n, src, dst, axons, x_dim, y_dim, max_neurons)
+    given = core_of_neurons(neurons, y_dim)
+    if (np.all((neurons['x'] >= 0) & (neurons['x'] < x_dim) & (neurons['y'] >= 0) & (neurons['y'] < y_dim)) and
+            within_limits(core_usage(given, src, dst, axons, n_cores), max_neurons) and
+            hop_cost(given, src, dst, y_dim, weights) < hop_cost(core_of, src, dst, y_dim, weights)):
+        core_of = given
+    return anneal(core_of, src, dst, axons, x_dim, y_dim, weights=weights, max_neurons=max_neurons, iters=iters, seed=seed)
+
+def apply_placement(neurons, core_of, y_dim):
+    """
+    apply_placement - copy of the neuron table with the x/y coordinates of the given core assignment
+    """
+    placed = neurons.copy()
+    placed['x'] = core_of // y_dim
+    placed['y'] = core_of % y_dim
+    return placed
+
+def report(name, load):
+    print('{}: {:.0f} messages, {:.0f} hops ({:.2f} per message), {:.1%} local, max link {:.0f}, mean link {:.1f}'.format(
+        name, load['messages'], load['hops'], load['hops'] / max(load['messages'], 1), load['local'] / max(load['messages'], 1),
+        load['max_link'], load['mean_link']))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='place the neurons of a network file to minimize NoC traffic')
+    parser.add_argument('infile', help='.npz or csv network file')
+    parser.add_argument('outfile', help='placed network, .npz or csv by extension')
+    parser.add_argument('--mesh', required=True, help='XxY mesh size')
+    parser.add_argument('--balance', type=float, default=1.0)
+    parser.add_argument('--iters', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    x_dim, y_dim = (int(d) for d in args.mesh.split('x'))
+    tmax, neurons, synapses = read_network(args.infile)
+    src, dst, axons = synapse_rows(neurons, synapses)
+    core_of = place(neurons, synapses, x_dim, y_dim, balance=args.balance, iters=args.iters, seed=args.seed)
+    if np.all((neurons['x'] < x_dim) & (neurons['y'] < y_dim)):
+        report('before', noc_load(core_of_neurons(neurons, y_dim), src, dst, axons, x_dim, y_dim))
+    report('after', noc_load(core_of, src, dst, axons, x_dim, y_dim))
+    write_network(args.outfile, tmax, apply_placement(neurons, core_of, y_dim), synapses)
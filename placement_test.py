@@ -0,0 +1,81 @@
+from chip_utils import Chip
+from core_utils import MAX_AXON_IN, MAX_AXON_OUT, MAX_FAN_IN_STATE
+from chip_programmer import save_network
+from netgen import all_to_all
+from telemetry import PORTS
+import placement
+import numpy as np
+import os
+import tempfile
+
+tmpdir = tempfile.mkdtemp()
+x_dim, y_dim = 3, 3
+
+def simulate(netfile):
+    # spike counts per neuron table row and the measured port traffic
+    chip = Chip(x_dim=x_dim, y_dim=y_dim)
+    chip.program_cores(netfile)
+    chip.enable_telemetry()
+    probe = chip.add_probe('spikes')
+    chip.run()
+    _, nrn = probe.get_data()
+    per_compartment = np.bincount(nrn, minlength=probe.n)
+    return chip, per_compartment, probe.targets
+
+def row_counts(neurons, per_compartment, targets):
+    # neurons are added to their core in table row order
+    core_of = placement.core_of_neurons(neurons, y_dim)
+    local = np.zeros(len(neurons), dtype=np.int64)
+    for c in np.unique(core_of):
+        rows = np.flatnonzero(core_of == c)
+        local[rows] = np.arange(len(rows))
+    lookup = {(int(c), int(l)): j for j, (c, l) in enumerate(targets)}
+    return per_compartment[[lookup[(int(c), int(l))] for c, l in zip(core_of, local)]]
+
+# groups of fully connected neurons, scattered over the mesh
+tmax, neurons, synapses = all_to_all(x_dim=x_dim, y_dim=y_dim, npc=12, group=6, rate=0.2, tmax=30, seed=1)
+rng = np.random.RandomState(2)
+shuffle = rng.permutation(len(neurons))
+neurons['x'] = neurons['x'][shuffle]
+neurons['y'] = neurons['y'][shuffle]
+synapses['delay_pre'] = 1 # every message is consumed before the run ends
+scattered = os.path.join(tmpdir, 'scattered.npz')
+save_network(scattered, tmax, neurons, synapses)
+src, dst, axons = placement.synapse_rows(neurons, synapses)
+before = placement.core_of_neurons(neurons, y_dim)
+
+# the XY load estimate weighted by the spikes of every source is the measured port traffic
+chip, per_compartment, targets = simulate(scattered)
+spikes = row_counts(neurons, per_compartment, targets)
+load = placement.noc_load(before, src, dst, axons, x_dim, y_dim, weights=spikes)
+assert np.array_equal(load['ports'], chip.telemetry.flits)
+assert load['hops'] == load['ports'][:, :PORTS.index('local')].sum()
+assert load['ports'][:, PORTS.index('local')].sum() == load['messages'] - load['local']
+
+# placing brings every group onto one core, within the limits and balanced
+after = placement.place(neurons, synapses, x_dim, y_dim, iters=20000)
+usage = placement.core_usage(after, src, dst, axons, x_dim * y_dim)
+assert np.all(usage['neurons'] == 12)
+assert np.all(usage['axon_in'] <= MAX_AXON_IN) and np.all(usage['axon_out'] <= MAX_AXON_OUT)
+assert np.all(usage['fan_in'] <= MAX_FAN_IN_STATE)
+assert placement.hop_cost(after, src, dst, y_dim) == 0 < placement.hop_cost(before, src, dst, y_dim)
+
+# the placed network spikes the same, without NoC traffic
+placed = placement.apply_placement(neurons, after, y_dim)
+placed_file = os.path.join(tmpdir, 'placed.npz')
+save_network(placed_file, tmax, placed, synapses)
+placed_chip, per_compartment, targets = simulate(placed_file)
+assert np.array_equal(row_counts(placed, per_compartment, targets), spikes)
+assert placed_chip.telemetry.flits[:, :PORTS.index('local')].sum() == 0 # full in_buffers send local messages through the router
+assert placed_chip.core_cycle_count < chip.core_cycle_count
+
+# a random graph only gets cheaper, the load estimate of both placements
+_, neurons, synapses = all_to_all(x_dim=x_dim, y_dim=y_dim, npc=12, group=6, seed=3)
+src, dst, axons = placement.synapse_rows(neurons, synapses)
+dst = rng.permutation(dst)
+synapses['dst'] = neurons['nrn_id'][dst]
+before = placement.core_of_neurons(neurons, y_dim)
+after = placement.place(neurons, synapses, x_dim, y_dim, iters=5000)
+assert placement.hop_cost(after, src, dst, y_dim) <= placement.hop_cost(before, src, dst, y_dim)
+placement.report('before', placement.noc_load(before, src, dst, axons, x_dim, y_dim))
+placement.report('after', placement.noc_load(after, src, dst, axons, x_dim, y_dim))
@@ -0,0 +1,139 @@
+import tempfile
+import numpy as np
+
+PROBE_KINDS = ('spikes', 'voltage', 'current')
+
+def read_chunks(filename):
+    """
+    read_chunks - read back a chunk file written by ChunkWriter as a list of arrays
+    """
+    with open(filename, 'rb') as fhandle:
+        return load_chunks(fhandle)
+
+def load_chunks(fhandle):
+    # the .npy records from the position of fhandle to its end
+    chunks = []
+    while len(fhandle.peek(1)) > 0:
+        chunks.append(np.load(fhandle))
+    return chunks
+
+class ChunkWriter:
+    """
+    Appendable chunk file, every flushed chunk is written as one .npy record after the previous ones
+    without a filename the chunks go to an anonymous temporary file, removed once the writer is garbage collected
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.fhandle = None
+        if filename is None:
+            self.fhandle = tempfile.TemporaryFile()
+        else:
+            open(filename, 'wb').close() # truncate
+
+    def write(self, chunk):
+        if self.fhandle is not None:
+            np.save(self.fhandle, chunk)
+        else:
+            with open(self.filename, 'ab') as fhandle:
+                np.save(fhandle, chunk)
+
+    def read(self):
+        if self.fhandle is not None:
+            self.fhandle.seek(0)
+            return load_chunks(self.fhandle) # leaves the file at its end for the next write
+        return read_chunks(self.filename)
+
+class Probe:
+    """
+    Records the spikes or the sampled voltages/currents of a selection of compartments
+
+    The selection is resolved to core-local ids once. Samples go into a preallocated buffer of chunk
+    rows that is flushed to the ChunkWriter whenever it fills up, so memory stays bounded for any tmax
+    (the legacy Core.last_nrn_v output still grows by one value per core and timestep).
+    Compartment j of the probe is compartment targets[j][1] of core targets[j][0].
+    """
+
+    def __init__(self, chip, kind, cores=None, neurons=None, period=1, chunk=4096, filename=None):
+        """
+        chip: prepared Chip, probes see the compartment ids and ChipState of the prepared cores
+        kind: 'spikes' records (time, compartment) pairs, 'voltage' and 'current' record the state
+              after the neuron update every period timesteps
+        cores: (x, y) coordinates of the recorded cores, default all cores
+        neurons: per entry of cores, the core-local compartment ids to record (None for all of them)
+        chunk: rows of the in-memory buffer (spikes for 'spikes', samples otherwise)
+        filename: chunk file the buffer is flushed to, None a temporary file
+        """
+        assert kind in PROBE_KINDS
+        assert period >= 1 and chunk >= 1
+        if cores is None:
+            cores = [chip.get_coor(i) for i in range(len(chip.cores))]
+        if neurons is None:
+            neurons = [None] * len(cores)
+        assert len(neurons) == len(cores)
+        self.kind = kind
+        self.period = period
+        self.chunk = chunk
+        self.state = chip.state
+        self.groups = [] # (core index, core, local ids) per recorded core
+        targets = []
+        for coor, nrn_ids in zip(cores, neurons):
+            i = chip.get_ind(coor[0], coor[1])
+            core = chip.cores[i]
+            nrn_ids = np.arange(core.n_neurons) if nrn_ids is None else np.asarray(nrn_ids, dtype=np.int64)
+            assert np.all((nrn_ids >= 0) & (nrn_ids < core.n_neurons))
+            self.groups.append((i, core, nrn_ids))
+            targets.extend((i, int(nrn)) for nrn in nrn_ids)
+        self.targets = np.asarray(targets, dtype=np.int64).reshape(-1, 2)
+        self.n = len(self.targets)
+        if self.state is not None: # one gather from the chip-wide arrays
+            self.index = self.targets[:, 1] + self.state.offsets[self.targets[:, 0]]
+        self.writer = ChunkWriter(filename)
+        if kind == 'spikes':
+            self.dtype = np.dtype([('t', np.int64), ('nrn', np.int64)])
+        else:
+            self.dtype = np.dtype([('t', np.int64), (kind, getattr(chip.cores[0], kind).dtype, (self.n,))])
+        self.buf = np.zeros(chunk, dtype=self.dtype)
+        self.fill = 0
+
+    def gather(self, name):
+        if self.state is not None:
+            return getattr(self.state, name)[self.index]
+        if len(self.groups) == 0:
+            return np.zeros(0, dtype=bool)
+        return np.concatenate([getattr(core, name)[nrn_ids] for _, core, nrn_ids in self.groups])
+
+    def record(self, tstep):
+        if self.kind == 'spikes':
+            nrns = np.flatnonzero(self.gather('spiked'))
+            while len(nrns) > 0:
+                n = min(len(nrns), self.chunk - self.fill)
+                self.buf['t'][self.fill:self.fill+n] = tstep
+                self.buf['nrn'][self.fill:self.fill+n] = nrns[:n]
+                self.fill += n
+                nrns = nrns[n:]
+                if self.fill == self.chunk:
+                    self.flush()
+        elif tstep % self.period == 0:
+            self.buf['t'][self.fill] = tstep
+            self.buf[self.kind][self.fill] = self.gather(self.kind)
+            self.fill += 1
+            if self.fill == self.chunk:
+                self.flush()
+
+    def flush(self):
+        if self.fill == 0:
+            return
+        self.writer.write(self.buf[:self.fill])
+        self.fill = 0
+
+    def get_data(self):
+        """
+        get_data - flush and read back everything recorded so far
+        'spikes': (times, compartments) index arrays
+        'voltage'/'current': (times, samples) with one row of n values per sampled timestep
+        """
+        self.flush()
+        chunks = self.writer.read()
+        data = np.concatenate(chunks) if len(chunks) > 0 else np.zeros(0, dtype=self.dtype)
+        return data['t'], data['nrn' if self.kind == 'spikes' else self.kind]
@@ -0,0 +1,58 @@
+from chip_utils import Chip
+from core_utils import SynapseState
+from probes import read_chunks
+import numpy as np
+import os
+import tempfile
+
+tmpdir = tempfile.mkdtemp()
+
+# record the same network in every mode, with small chunks so the buffers are flushed many times
+def build(mode, soa=False, run=True):
+    chip = Chip(x_dim=2, y_dim=2, mode=mode, soa=soa)
+    chip.controller.set_tmax(80)
+    for i, core in enumerate(chip.cores):
+        for n in range(4):
+            core.add_neuron(0.5, 0.9, 100.0, bias=10.0 + 5*n + i, bias_delay=n)
+    for i, core in enumerate(chip.cores):
+        dst = chip.get_coor((i + 1) % len(chip.cores))
+        for n in range(4):
+            core.add_axon_out(n, (dst, [10*i + n], 1 + n))
+            chip.cores[chip.get_ind(dst[0], dst[1])].add_synapse_in(10*i + n, SynapseState((n + 1) % 4, 40.0 - 20*n, n))
+    chip.prepare_computation()
+    probes = {
+        'spikes': chip.add_probe('spikes', chunk=5, filename=os.path.join(tmpdir, mode + str(soa) + '.npy')),
+        'last': chip.add_probe('voltage', neurons=[[3]] * 4, chunk=7),
+        'current': chip.add_probe('current', cores=[(1, 0)], period=3, chunk=4),
+    }
+    if run:
+        chip.run()
+    return chip, probes
+
+runs = [build('cycle'), build('functional'), build('functional', soa=True)]
+cyc_chip, cyc_probes = runs[0]
+t, nrn = cyc_probes['spikes'].get_data()
+assert len(t) > 20 and np.all(np.diff(t) >= 0)
+assert sum(len(chunk) for chunk in read_chunks(cyc_probes['spikes'].writer.filename)) == len(t)
+# the last compartment of every core matches the per-core record
+t_v, v = cyc_probes['last'].get_data()
+assert np.array_equal(t_v, np.arange(80))
+for j, core in enumerate(cyc_chip.cores):
+    assert np.array_equal(v[:, j], np.asarray(core.get_last_nrn_v(), dtype=v.dtype))
+t_c, c = cyc_probes['current'].get_data()
+assert np.array_equal(t_c, np.arange(0, 80, 3)) and c.shape == (len(t_c), 4)
+# without a filename the chunks go to a temporary file, not to memory
+assert cyc_probes['last'].writer.filename is None and cyc_probes['last'].writer.fhandle.tell() > 0
+# reading back in the middle of a run keeps the chunks written after
+chip, probes = build('cycle', run=False)
+for _ in range(40):
+    chip.operate()
+assert len(probes['last'].get_data()[0]) == 40
+chip.run()
+for a, b in zip(cyc_probes['last'].get_data(), probes['last'].get_data()):
+    assert np.array_equal(a, b)
+for chip, probes in runs[1:]:
+    for key in probes:
+        for a, b in zip(cyc_probes[key].get_data(), probes[key].get_data()):
+            assert np.array_equal(a, b)
+print('{} spikes recorded'.format(len(t)))
@@ -1,4 +1,5 @@
-from noc_utils import Queue, SpikeMsg
+from noc_utils import Queue, SpikeMsg, MsgPool, pack_coor
+import numpy as np
 
 q = Queue(capacity=5, pQ=True)
 q.enqueue(SpikeMsg((0, 0), [3], delay=4))
@@ -9,4 +10,26 @@ q.enqueue(SpikeMsg((0, 0), [3], delay=2))
 print(q)
 print('IsReady: {}'.format(q.ready()))
 q.dec_delays()
-print(q)
\ No newline at end of file
+print(q)
+print('IsReady: {}'.format(q.ready()))
+q.enqueue(SpikeMsg((0, 0), [5], delay=1))
+q.next_op_step()
+print(q)
+# both delay-1 messages are at the front, the rest keep their arrival order
+assert [msg.get_delay() for msg in q.messages()] == [1, 1, 3, 2]
+assert not q.ready()
+q.dequeue()
+q.dequeue()
+assert q.ready()
+
+# destinations as (x, y), packed and packed numpy integers give the same message
+for core_id in ((2, 5), pack_coor(2, 5), np.int64(pack_coor(2, 5)), np.int32(pack_coor(2, 5))):
+    msg = SpikeMsg(core_id, [3])
+    assert msg.dst == pack_coor(2, 5) and type(msg.dst) is int
+# the same for a message reused from a warm pool
+pool = MsgPool()
+for core_id in ((2, 5), np.int64(pack_coor(2, 5)), pack_coor(2, 5)):
+    msg = pool.acquire(core_id, [3], 1)
+    assert msg.dst == pack_coor(2, 5) and type(msg.dst) is int
+    pool.release(msg)
+assert len(pool.free) == 1
@@ -0,0 +1,89 @@
+from chip_utils import Chip
+from chip_programmer import save_network
+from netgen import hot_spot
+from noc_utils import unpack_coor, NORTH, EAST, SOUTH, WEST, LOCAL
+import numpy as np
+import os
+import tempfile
+
+# half of the synapses of every core target the corner core
+netfile = os.path.join(tempfile.mkdtemp(), 'hot_spot.npz')
+tmax, neurons, synapses = hot_spot(x_dim=4, y_dim=4, npc=8, fan_out=4, hot=(3, 3), frac=0.5, rate=0.2, tmax=30, seed=5)
+synapses['delay_pre'] = 1 # every message is consumed before the run ends
+save_network(netfile, tmax, neurons, synapses)
+y_dim = 4
+
+def build(routing, arbitration, capacity=2, workers=1, trace=True):
+    chip = Chip(x_dim=4, y_dim=y_dim, capacity=capacity, workers=workers, routing=routing, arbitration=arbitration)
+    chip.program_cores(netfile)
+    if trace:
+        chip.enable_telemetry()
+        chip.enable_tracing()
+    chip.run()
+    return chip
+
+def same_state(a, b):
+    for core_a, core_b in zip(a.cores, b.cores):
+        assert np.array_equal(core_a.voltage, core_b.voltage)
+        assert np.array_equal(core_a.current, core_b.current)
+        assert np.array_equal(core_a.input, core_b.input)
+
+def paths(trace):
+    # (src, dst, [(x, y, port) per hop]) of every traced message that went through the NoC
+    hops = {}
+    for i, router, port in zip(trace['hop_id'], trace['hop_router'], trace['hop_port']):
+        hops.setdefault(int(i), []).append((int(router) // y_dim, int(router) % y_dim, int(port)))
+    for i, src, dst in zip(trace['id'], trace['src'], trace['dst']):
+        if int(i) in hops:
+            yield unpack_coor(int(src)), unpack_coor(int(dst)), hops[int(i)]
+
+step = {NORTH: (0, 1), EAST: (1, 0), SOUTH: (0, -1), WEST: (-1, 0)}
+
+reference = build('xy', 'round_robin')
+cycles = {}
+blocked = {}
+for routing in ('xy', 'west_first', 'odd_even'):
+    for arbitration in ('round_robin', 'age', 'delay'):
+        chip = build(routing, arbitration)
+        same_state(chip, reference)
+        cycles[(routing, arbitration)] = chip.core_cycle_count
+        blocked[(routing, arbitration)] = chip.telemetry.blocked.sum()
+        # minimal routes, the same number of flits in every direction
+        assert np.array_equal(chip.telemetry.flits.sum(axis=0), reference.telemetry.flits.sum(axis=0))
+        n_paths = 0
+        n_adaptive = 0
+        for (sx, sy), (dx, dy), path in paths(chip.tracer.get_data()):
+            n_paths += 1
+            # minimal, connected and ending at the destination
+            assert len(path) == abs(sx - dx) + abs(sy - dy) + 1
+            assert path[0][:2] == (sx, sy) and path[-1] == (dx, dy, LOCAL)
+            for (x, y, port), (nx, ny, _) in zip(path, path[1:]):
+                assert (x + step[port][0], y + step[port][1]) == (nx, ny)
+            ports = [port for _, _, port in path[:-1]]
+            turns = [(prev, port, x) for prev, (x, _, port) in zip(ports, path[1:-1])]
+            xy = all(prev in (EAST, WEST) or port in (NORTH, SOUTH) for prev, port, _ in turns)
+            assert xy or routing != 'xy'
+            n_adaptive += not xy
+            if routing == 'west_first':
+                assert all(prev == WEST or port != WEST for prev, port, _ in turns)
+            if routing == 'odd_even':
+                for prev, port, x in turns:
+                    assert not (prev == EAST and port in (NORTH, SOUTH) and x % 2 == 0)
+                    assert not (prev in (NORTH, SOUTH) and port == WEST and x % 2 == 1)
+        assert n_paths > 0
+        assert (n_adaptive > 0) == (routing != 'xy')
+# the adaptive routes steer around the full buffers in front of the hot core
+for arbitration in ('round_robin', 'age', 'delay'):
+    assert blocked[('west_first', arbitration)] < blocked[('xy', arbitration)]
+    assert blocked[('odd_even', arbitration)] < blocked[('xy', arbitration)]
+
+# the delay arbiter only looks at the own tile, so parallel workers keep the serial schedule
+serial = build('xy', 'delay', capacity=1, trace=False)
+for workers in (2, 3):
+    chip = build('xy', 'delay', capacity=1, workers=workers, trace=False)
+    same_state(chip, serial)
+    assert chip.core_cycle_count == serial.core_cycle_count
+    assert chip.cyc_counters == serial.cyc_counters
+
+for (routing, arbitration), count in sorted(cycles.items()):
+    print('{} {}: Cycle Count: {} blocked: {}'.format(routing, arbitration, count, blocked[(routing, arbitration)]))
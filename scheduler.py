@@ -0,0 +1,81 @@
+from functools import partial
+import time
+
+class EventScheduler:
+    """
+    Event-driven replacement for the synchronous cycle loop of Chip.operate_cycle
+
+    Only cores with work left and routers holding messages are visited. Queues wake their owner
+    through Queue.listener when a message is enqueued, so idle cores and routers are never rescanned,
+    and cycles in which no router holds a message are skipped up to the next core cycle.
+    core_cycle_count, cyc_counters and message ordering are identical to the synchronous loop.
+    """
+
+    def __init__(self, chip):
+        self.chip = chip
+        self.active_cores = set()
+        self.active_routers = set()
+        for i, core in enumerate(chip.cores):
+            core.in_buffer.listener = partial(self.active_cores.add, i)
+        for i, router in enumerate(chip.routers):
+            for buffkey in router.buffers.keys():
+                router.buffers[buffkey].listener = partial(self.active_routers.add, i)
+
+    def ready(self):
+        # idle cores and routers are always ready
+        for i in self.active_cores:
+            if not self.chip.cores[i].ready():
+                return False
+        for i in self.active_routers:
+            if not self.chip.routers[i].ready():
+                return False
+        return True
+
+    def operate(self):
+        chip = self.chip
+        cyc_counters = chip.cyc_counters
+        # every visit of a core counts one 'run' or 'stall' cycle, skipped visits are stalls
+        visits = [cyc_count['run'] + cyc_count['stall'] for cyc_count in cyc_counters]
+        core_ticks = 0
+        for i, core in enumerate(chip.cores):
+            if not core.is_idle():
+                self.active_cores.add(i)
+        telemetry = chip.telemetry
+        tic_toc = 0
+        while not self.ready():
+            if telemetry is not None:
+                t0 = time.perf_counter()
+            if tic_toc%4 == 0:
+                core_ticks += 1
+                cores = sorted(self.active_cores)
+                for i in cores:
+                    chip.cores[i].operate(cyc_count=cyc_counters[i])
+                self.active_cores.difference_update([i for i in cores if chip.cores[i].is_idle()])
+            if telemetry is not None:
+                t1 = time.perf_counter()
+                telemetry.time['core'] += t1 - t0
+            # routers that only receive messages this cycle cannot forward them before the next one
+            routers = sorted(self.active_routers)
+            for i in routers:
+                chip.routers[i].next_op_step()
+            for i in routers:
+                chip.routers[i].operate()
+            self.active_routers.difference_update([i for i in routers if chip.routers[i].is_empty()])
+            tic_toc += 1
+            chip.core_cycle_count += 1
+            if telemetry is not None:
+                telemetry.time['noc'] += time.perf_counter() - t1
+                telemetry.tick()
+            # nothing moves until the next core cycle if the NoC is empty
+            if len(self.active_routers) == 0 and tic_toc%4 != 0 and not self.ready():
+                skip = 4 - tic_toc%4
+                tic_toc += skip
+                chip.core_cycle_count += skip
+                if telemetry is not None:
+                    telemetry.idle(skip)
+        for i, cyc_count in enumerate(cyc_counters):
+            cyc_count['stall'] += core_ticks - (cyc_count['run'] + cyc_count['stall'] - visits[i])
+
+    def next_timestep(self):
+        for i in self.active_routers:
+            self.chip.routers[i].next_timestep()
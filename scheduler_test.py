@@ -0,0 +1,28 @@
+from chip_utils import Chip
+from core_utils import SynapseState
+import numpy as np
+
+# sparse cross-chip traffic on a 3x3 mesh, run with the synchronous and the event-driven loop
+def build(scheduler):
+    chip = Chip(x_dim=3, y_dim=3, scheduler=scheduler)
+    chip.controller.set_tmax(40)
+    for i, core in enumerate(chip.cores):
+        for n in range(3 + i%3):
+            core.add_neuron(0.5, 0.9, 80.0 + 10*n, bias=12.0 + i, bias_delay=i%4)
+    for i, core in enumerate(chip.cores):
+        for n in range(3):
+            dst = chip.get_coor((i*5 + n*7) % len(chip.cores))
+            core.add_axon_out(n, (dst, [10*i + n], 1 + n))
+            chip.cores[chip.get_ind(dst[0], dst[1])].add_synapse_in(10*i + n, SynapseState(n, 30.0 - 15*n, 2))
+    chip.prepare_computation()
+    chip.run()
+    return chip
+
+sync_chip = build('sync')
+event_chip = build('event')
+assert sync_chip.core_cycle_count == event_chip.core_cycle_count
+assert sync_chip.cyc_counters == event_chip.cyc_counters
+for sync_core, event_core in zip(sync_chip.cores, event_chip.cores):
+    assert np.array_equal(sync_core.voltage, event_core.voltage)
+    assert np.array_equal(sync_core.get_last_nrn_v(), event_core.get_last_nrn_v())
+print(event_chip.cyc_counters)
@@ -0,0 +1,134 @@
+import numpy as np
+from noc_utils import COOR_BITS, COOR_MASK, MULTICAST
+
+PORTS = ['north', 'east', 'south', 'west', 'local']
+
+class Telemetry:
+    """
+    NoC and core counters of a cycle-mode Chip, kept in preallocated arrays indexed [router, port]
+
+    flits: messages forwarded through each output port
+    conflicts: arbitrations in which more than one input requested the output port
+    blocked: arbitrations with a request that found the sink full
+    occupancy: histogram of the fill level of each router input buffer, [router, port, level]
+    bypass: spike messages that took the local bypass of each core
+    latency: histogram of cycles from injection by the source core to consumption by Core.process_msg
+    hop_latency_sum, hop_count: summed latency and number of messages per hop count (DOR distance)
+    time: wall time spent in the core and NoC phases of the cycle loop
+
+    Components only call into the Telemetry when it is attached (their 'stats' reference is not None),
+    so a chip without telemetry pays a single None check per arbitration and per message.
+    """
+
+    def __init__(self, chip, sample_every=None, latency_bins=1024):
+        """
+        sample_every: sample the buffer occupancy every sample_every cycles, or at every timestep boundary
+                      if None
+        latency_bins: latencies of latency_bins-1 cycles and above go to the last bin
+        """
+        assert chip.mode == 'cycle'
+        assert sample_every is None or sample_every >= 1
+        self.chip = chip
+        self.sample_every = sample_every
+        n = len(chip.routers)
+        self.capacity = max(buff.capacity for router in chip.routers for buff in router.buffers.values())
+        self.flits = np.zeros((n, len(PORTS)), dtype=np.int64)
+        self.conflicts = np.zeros((n, len(PORTS)), dtype=np.int64)
+        self.blocked = np.zeros((n, len(PORTS)), dtype=np.int64)
+        self.occupancy = np.zeros((n, len(PORTS), self.capacity+1), dtype=np.int64)
+        self.bypass = np.zeros(len(chip.cores), dtype=np.int64)
+        self.latency = np.zeros(latency_bins, dtype=np.int64)
+        mesh = chip if chip.board is None else chip.board # the messages of a Board chip cross the whole board
+        max_hops = mesh.x_dim + mesh.y_dim - 1
+        self.hop_latency_sum = np.zeros(max_hops, dtype=np.int64)
+        self.hop_count = np.zeros(max_hops, dtype=np.int64)
+        self.time = {'core': 0.0, 'noc': 0.0}
+        self.n_samples = 0
+        # flat [router, port] index of every router input buffer, for the occupancy samples
+        self.buffers = [buff for router in chip.routers for buff in router.buffers.values()]
+        self.buffer_rows = np.arange(len(self.buffers)) * (self.capacity+1)
+        for r, router in enumerate(chip.routers):
+            assert list(router.buffers.keys()) == PORTS
+            for p, key in enumerate(PORTS):
+                arbiter = router.xbar.arbiters[key]
+                arbiter.stats = self
+                arbiter.stats_ind = (r, p)
+        for i, core in enumerate(chip.cores):
+            core.stats = self
+            core.stats_ind = i
+
+    def detach(self):
+        for router in self.chip.routers:
+            for arbiter in router.xbar.arbiters.values():
+                arbiter.stats = None
+        for core in self.chip.cores:
+            core.stats = None
+
+    def arbitrate(self, arbiter):
+        # called by Arbiter.arbitrate before it grants
+        n_req = 0
+        for buff in arbiter.inputs:
+            mop, trav = buff.req()
+            if not trav and (mop == arbiter.op or (mop == MULTICAST and arbiter.op in buff.head().branches)):
+                n_req += 1
+        if n_req > 0:
+            if arbiter.sink.is_full():
+                self.blocked[arbiter.stats_ind] += 1
+            else:
+                self.flits[arbiter.stats_ind] += 1
+            if n_req > 1:
+                self.conflicts[arbiter.stats_ind] += 1
+
+    def inject(self, core, msg):
+        # called by Core.process_neuron for every spike message, before it is buffered
+        msg.src = core.packed_id
+        msg.born = self.chip.core_cycle_count
+        if msg.dst == core.packed_id and not core.in_buffer.is_full():
+            self.bypass[core.stats_ind] += 1
+
+    def deliver(self, core, msg):
+        # called by Core.process_msg for every consumed message
+        if msg.born < 0: # injected before the telemetry was attached
+            return
+        latency = self.chip.core_cycle_count - msg.born
+        self.latency[min(latency, len(self.latency)-1)] += 1
+        hops = abs((msg.src >> COOR_BITS) - (msg.dst >> COOR_BITS)) + abs((msg.src & COOR_MASK) - (msg.dst & COOR_MASK))
+        self.hop_latency_sum[hops] += latency
+        self.hop_count[hops] += 1
+
+    def sample(self):
+        levels = np.fromiter((buff.n_msgs for buff in self.buffers), dtype=np.int64, count=len(self.buffers))
+        self.occupancy.reshape(-1)[self.buffer_rows + levels] += 1 # one level per buffer, no repeats
+        self.n_samples += 1
+
+    def tick(self):
+        # called after every simulated cycle
+        if self.sample_every is not None and self.chip.core_cycle_count % self.sample_every == 0:
+            self.sample()
+
+    def idle(self, cycles):
+        # called for cycles the event scheduler skipped or Chip.quiet_timestep fast-forwarded, every router
+        # buffer is empty during them
+        if self.sample_every is not None:
+            end = self.chip.core_cycle_count
+            n = end // self.sample_every - (end - cycles) // self.sample_every
+            if n > 0:
+                self.occupancy[:, :, 0] += n
+                self.n_samples += n
+
+    def timestep(self):
+        # called at every timestep boundary
+        if self.sample_every is None:
+            self.sample()
+
+    def summary(self):
+        """
+        summary - dict of plain totals, for logging
+        """
+        delivered = int(self.hop_count.sum())
+        mean_latency = float(self.hop_latency_sum.sum()) / delivered if delivered > 0 else 0.0
+        occupancy = self.occupancy.sum(axis=(0, 1))
+        mean_occupancy = float(np.dot(occupancy, np.arange(len(occupancy)))) / max(int(occupancy.sum()), 1)
+        return dict(flits=int(self.flits.sum()), conflicts=int(self.conflicts.sum()), blocked=int(self.blocked.sum()),
+            bypass=int(self.bypass.sum()), delivered=delivered, mean_latency=mean_latency,
+            mean_occupancy=mean_occupancy, samples=self.n_samples, core_s=self.time['core'], noc_s=self.time['noc'])
@@ -0,0 +1,42 @@
+from chip_utils import Chip
+from core_utils import SynapseState
+from telemetry import PORTS
+import numpy as np
+
+# telemetry must not change the simulation, and the counters agree between the schedulers
+def build(scheduler, sample_every=None, telemetry=True):
+    chip = Chip(x_dim=3, y_dim=3, scheduler=scheduler, capacity=4)
+    chip.controller.set_tmax(40)
+    for i, core in enumerate(chip.cores):
+        for n in range(4):
+            core.add_neuron(0.5, 0.9, 60.0 + 10*n, bias=15.0 + i, bias_delay=n)
+    for i, core in enumerate(chip.cores):
+        for n in range(4):
+            dst = chip.get_coor((i*5 + n*2) % len(chip.cores))
+            core.add_axon_out(n, (dst, [10*i + n], 1 + n%3))
+            chip.cores[chip.get_ind(dst[0], dst[1])].add_synapse_in(10*i + n, SynapseState(n, 30.0 - 10*n, 1))
+    chip.prepare_computation()
+    if telemetry:
+        chip.enable_telemetry(sample_every=sample_every)
+    chip.run()
+    return chip
+
+plain = build('sync', telemetry=False)
+sync_chip = build('sync', sample_every=3)
+event_chip = build('event', sample_every=3)
+for chip in (sync_chip, event_chip):
+    assert chip.core_cycle_count == plain.core_cycle_count
+    for core, plain_core in zip(chip.cores, plain.cores):
+        assert np.array_equal(core.voltage, plain_core.voltage)
+sync_tel, event_tel = sync_chip.telemetry, event_chip.telemetry
+for name in ('flits', 'conflicts', 'blocked', 'occupancy', 'bypass', 'latency', 'hop_count', 'hop_latency_sum'):
+    assert np.array_equal(getattr(sync_tel, name), getattr(event_tel, name))
+# every consumed message either took the local bypass or left a router through its local port
+summary = sync_tel.summary()
+assert summary['delivered'] == summary['bypass'] + sync_tel.flits[:, PORTS.index('local')].sum()
+assert sync_tel.hop_count[0] >= summary['bypass']
+assert sync_tel.n_samples == sync_chip.core_cycle_count // 3
+assert np.all(sync_tel.occupancy.sum(axis=2) == sync_tel.n_samples)
+# timestep boundary sampling
+assert build('sync').telemetry.n_samples == 40
+print(summary)
@@ -0,0 +1,200 @@
+import numpy as np
+from noc_utils import unpack_coor, OP_CODES
+from probes import ChunkWriter
+
+# one record per traced message, written when the message is consumed
+TRACE_DTYPE = np.dtype([('id', np.int64), ('src', np.int64), ('dst', np.int64), ('delay', np.int32),
+    ('slack', np.int32), ('inject', np.int64), ('deliver', np.int64), ('inject_tstep', np.int32),
+    ('deliver_tstep', np.int32), ('hops', np.int32), ('src_wait', np.int64), ('dst_wait', np.int64)])
+# one record per router a traced message passed, in path order
+HOP_DTYPE = np.dtype([('id', np.int64), ('router', np.int32), ('port', np.int8), ('wait', np.int64)])
+
+class Tracer:
+    """
+    Per-message tracing of spike messages through the NoC of a cycle-mode Chip
+
+    Every sample-th injected message is followed from Core.process_neuron to Core.process_msg. Its record
+    holds the source and destination cores (packed), the message delay and the delay left when it was
+    consumed (slack, 1 means due in that timestep), the inject/deliver cycles and timesteps, the hop count,
+    the cycles spent in the source core's out_buffer (src_wait) and in the destination in_buffer (dst_wait).
+    The wait in every router input buffer goes to a separate hop table keyed by the message id.
+    A timestep does not end while delay-1 messages are in flight, so a message that would miss its
+    deadline stretches the timestep instead, visible as slack 1 with a long latency.
+    A multicast message is traced along the branch that is taken last at every fork (see Queue.fork).
+
+    Records are buffered in preallocated arrays of chunk rows and flushed to ChunkWriters, so memory is
+    bounded by the number of messages in flight.
+    """
+
+    def __init__(self, chip, sample=1, chunk=65536, filename=None):
+        """
+        sample: trace every sample-th injected message
+        filename: prefix of the chunk files (filename + '.msgs.npy', filename + '.hops.npy'),
+                  None temporary files
+        """
+        assert chip.mode == 'cycle'
+        assert sample >= 1
+        self.chip = chip
+        self.sample = sample
+        self.n_injected = 0
+        self.next_id = 0
+        self.live = {} # id -> [src_wait, inject_tstep, delay, (router, port, wait) per hop ...] in flight
+        self.msgs = np.zeros(chunk, dtype=TRACE_DTYPE)
+        self.hops = np.zeros(chunk, dtype=HOP_DTYPE)
+        self.n_msgs = 0
+        self.n_hops = 0
+        self.msg_writer = ChunkWriter(None if filename is None else filename + '.msgs.npy')
+        self.hop_writer = ChunkWriter(None if filename is None else filename + '.hops.npy')
+        for r, router in enumerate(chip.routers):
+            for arbiter in router.xbar.arbiters.values():
+                arbiter.tracer = self
+                arbiter.trace_ind = r
+        for core in chip.cores:
+            core.tracer = self
+
+    def detach(self):
+        for router in self.chip.routers:
+            for arbiter in router.xbar.arbiters.values():
+                arbiter.tracer = None
+        for core in self.chip.cores:
+            core.tracer = None
+
+    def inject(self, core, msg):
+        # called by Core.process_neuron for every spike message, before it is buffered
+        msg.src = core.packed_id
+        msg.born = self.chip.core_cycle_count
+        msg.hop_t = msg.born
+        msg.trace = -1
+        if self.n_injected % self.sample == 0:
+            msg.trace = self.next_id
+            self.live[msg.trace] = [0, self.chip.controller.get_tstep(), msg.delay]
+            self.next_id += 1
+        self.n_injected += 1
+
+    def leave_core(self, core, msg):
+        # called by Core.process_noc when the message moves from the out_buffer to the local router
+        if msg.trace >= 0:
+            now = self.chip.core_cycle_count
+            self.live[msg.trace][0] = now - msg.hop_t
+            msg.hop_t = now
+
+    def forward(self, arbiter, msg):
+        # called by Arbiter.arbitrate for every granted message
+        if msg.trace >= 0:
+            now = self.chip.core_cycle_count
+            self.live[msg.trace].append((arbiter.trace_ind, arbiter.op, now - msg.hop_t))
+            msg.hop_t = now
+
+    def deliver(self, core, msg):
+        # called by Core.process_msg for every consumed message
+        if msg.trace < 0:
+            return
+        now = self.chip.core_cycle_count
+        entry = self.live.pop(msg.trace)
+        src_wait, inject_tstep, delay = entry[:3]
+        path = entry[3:]
+        rec = self.msgs[self.n_msgs]
+        rec['id'] = msg.trace
+        rec['src'] = msg.src
+        rec['dst'] = msg.dst
+        rec['delay'] = delay
+        rec['slack'] = msg.delay
+        rec['inject'] = msg.born
+        rec['deliver'] = now
+        rec['inject_tstep'] = inject_tstep
+        rec['deliver_tstep'] = self.chip.controller.get_tstep()
+        rec['src_wait'] = src_wait
+        rec['dst_wait'] = now - msg.hop_t
+        rec['hops'] = len(path)
+        self.n_msgs += 1
+        if self.n_msgs == len(self.msgs):
+            self.flush_msgs()
+        for router, port, wait in path:
+            hop = self.hops[self.n_hops]
+            hop['id'] = msg.trace
+            hop['router'] = router
+            hop['port'] = port
+            hop['wait'] = wait
+            self.n_hops += 1
+            if self.n_hops == len(self.hops):
+                self.flush_hops()
+        msg.trace = -1
+
+    def flush_msgs(self):
+        if self.n_msgs > 0:
+            self.msg_writer.write(self.msgs[:self.n_msgs])
+            self.n_msgs = 0
+
+    def flush_hops(self):
+        if self.n_hops > 0:
+            self.hop_writer.write(self.hops[:self.n_hops])
+            self.n_hops = 0
+
+    def flush(self):
+        self.flush_msgs()
+        self.flush_hops()
+
+    def get_data(self):
+        """
+        get_data - columnar view of everything traced so far: dict of 1-d arrays, message columns by
+        their TRACE_DTYPE name and hop columns prefixed with 'hop_'
+        """
+        self.flush()
+        columns = {}
+        for writer, dtype, prefix in ((self.msg_writer, TRACE_DTYPE, ''), (self.hop_writer, HOP_DTYPE, 'hop_')):
+            chunks = writer.read()
+            table = np.concatenate(chunks) if len(chunks) > 0 else np.zeros(0, dtype=dtype)
+            for name in dtype.names:
+                columns[prefix + name] = np.ascontiguousarray(table[name])
+        return columns
+
+    def export(self, filename):
+        """
+        export - write the columns of get_data to an uncompressed .npz, read back with load_trace
+        """
+        np.savez(filename, **self.get_data())
+
+def load_trace(filename):
+    with np.load(filename) as data:
+        return {name: data[name] for name in data.files}
+
+def group_stats(keys, values):
+    """
+    group_stats - count, mean, 50th/95th percentile and max of values per distinct row of keys
+    keys: 2-d integer array, one row per value
+    returns (unique key rows, dict of per-group statistics)
+    """
+    if len(values) == 0:
+        empty = np.zeros(0)
+        return keys[:0], dict(count=empty.astype(np.int64), mean=empty, p50=empty, p95=empty, max=empty)
+    uniq, group = np.unique(keys, axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    order = np.lexsort((values, group))
+    count = np.bincount(group, minlength=len(uniq))
+    first = np.cumsum(count) - count
+    ranked = values[order]
+    def pct(q):
+        return ranked[first + np.floor(q * (count - 1)).astype(np.int64)]
+    return uniq, dict(count=count, mean=np.bincount(group, weights=values, minlength=len(uniq)) / count,
+        p50=pct(0.5), p95=pct(0.95), max=pct(1.0))
+
+def pair_latency(trace):
+    """
+    pair_latency - latency (deliver - inject cycles) distribution per (src, dst) core pair
+    returns a list of ((src x, src y), (dst x, dst y), stats dict) sorted by descending mean latency
+    """
+    uniq, stats = group_stats(np.stack((trace['src'], trace['dst']), axis=1), trace['deliver'] - trace['inject'])
+    rows = [(unpack_coor(int(src)), unpack_coor(int(dst)), {name: stats[name][i].item() for name in stats})
+        for i, (src, dst) in enumerate(uniq)]
+    return sorted(rows, key=lambda row: -row[2]['mean'])
+
+def router_waits(trace, chip):
+    """
+    router_waits - wait distribution per (router, output port), the DOR hotspots come first
+    returns a list of ((x, y), port name, stats dict) sorted by descending total wait
+    """
+    port_names = {code: name for name, code in OP_CODES.items()}
+    uniq, stats = group_stats(np.stack((trace['hop_router'], trace['hop_port']), axis=1), trace['hop_wait'])
+    rows = [(chip.get_coor(int(router)), port_names[int(port)], {name: stats[name][i].item() for name in stats})
+        for i, (router, port) in enumerate(uniq)]
+    return sorted(rows, key=lambda row: -row[2]['mean'] * row[2]['count'])
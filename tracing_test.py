@@ -0,0 +1,51 @@
+from chip_utils import Chip
+from core_utils import SynapseState
+from noc_utils import unpack_coor
+from tracing import pair_latency, router_waits, load_trace
+import numpy as np
+import os
+import tempfile
+
+# trace every message of a small network, next to the telemetry latency counters
+def build(sample=1, trace=True):
+    chip = Chip(x_dim=3, y_dim=3, capacity=4)
+    chip.controller.set_tmax(40)
+    for i, core in enumerate(chip.cores):
+        for n in range(4):
+            core.add_neuron(0.5, 0.9, 60.0 + 10*n, bias=15.0 + i, bias_delay=n)
+    for i, core in enumerate(chip.cores):
+        for n in range(4):
+            dst = chip.get_coor((i*5 + n*2) % len(chip.cores))
+            core.add_axon_out(n, (dst, [10*i + n], 1 + n%3))
+            chip.cores[chip.get_ind(dst[0], dst[1])].add_synapse_in(10*i + n, SynapseState(n, 30.0 - 10*n, 1))
+    chip.prepare_computation()
+    if trace:
+        chip.enable_tracing(sample=sample, chunk=16, filename=os.path.join(tempfile.mkdtemp(), 'trace'))
+        chip.enable_telemetry()
+    chip.run()
+    return chip
+
+plain = build(trace=False)
+chip = build()
+assert chip.core_cycle_count == plain.core_cycle_count
+filename = os.path.join(tempfile.mkdtemp(), 'trace.npz')
+chip.tracer.export(filename)
+trace = load_trace(filename)
+latency = trace['deliver'] - trace['inject']
+assert len(latency) == chip.telemetry.hop_count.sum()
+assert latency.sum() == chip.telemetry.hop_latency_sum.sum()
+assert np.all(trace['slack'] >= 1) and np.all(trace['deliver_tstep'] >= trace['inject_tstep'])
+# the waits along the path add up to the latency
+path_wait = np.bincount(trace['hop_id'], weights=trace['hop_wait'], minlength=trace['id'].max()+1)[trace['id']]
+assert np.array_equal(trace['src_wait'] + path_wait + trace['dst_wait'], latency)
+# dimension-ordered routes pass every router of the manhattan path, bypassed messages none
+for src, dst, hops in zip(trace['src'], trace['dst'], trace['hops']):
+    (sx, sy), (dx, dy) = unpack_coor(int(src)), unpack_coor(int(dst))
+    assert hops == 0 or hops == abs(sx - dx) + abs(sy - dy) + 1
+pairs = pair_latency(trace)
+assert sum(stats['count'] for _, _, stats in pairs) == len(latency)
+assert all(stats['p50'] <= stats['p95'] <= stats['max'] for _, _, stats in pairs)
+assert sum(stats['count'] for _, _, stats in router_waits(trace, chip)) == len(trace['hop_id'])
+sampled = build(sample=3).tracer.get_data()
+assert len(sampled['id']) < len(latency)
+print(pairs[0])